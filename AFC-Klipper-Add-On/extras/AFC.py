@@ -41,7 +41,7 @@ except: raise error(ERROR_STR.format(import_lib="AFC_functions", trace=traceback
 try: from extras.AFC_utils import add_filament_switch, AFC_moonraker
 except: raise error(ERROR_STR.format(import_lib="AFC_utils", trace=traceback.format_exc()))
 
-try: from extras.AFC_stats import AFCStats
+try: from extras.AFC_stats import AFCStats, AFCStats_var
 except: raise error(ERROR_STR.format(import_lib="AFC_stats", trace=traceback.format_exc()))
 
 AFC_VERSION="1.1.22"
@@ -427,6 +427,9 @@ class afc:
                     self.toolhead.dwell(1)
             self.td1_defined, self._td1_present, self.lane_data_enabled = self.moonraker.check_for_td1()
             self.afc_stats = AFCStats(self.moonraker, self.logger, len(self.tools) > 1)
+            metrics = self.printer.lookup_object("metrics", None)
+            if metrics is not None:
+                AFCStats_var.export_metrics(metrics.registry)
 
             self.printer.send_event("afc:moonraker_connect")
         except Exception as e:
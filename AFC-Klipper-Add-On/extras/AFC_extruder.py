@@ -1085,9 +1085,10 @@ class AFCExtruder:
         SAVE_EXTRUDER_VALUES EXTRUDER=extruder
         ```
         """
-        self.afc.function.ConfigRewrite(self.fullname, 'tool_stn', self.tool_stn, '')
-        self.afc.function.ConfigRewrite(self.fullname, 'tool_stn_unload', self.tool_stn_unload, '')
-        self.afc.function.ConfigRewrite(self.fullname, 'tool_sensor_after_extruder', self.tool_sensor_after_extruder, '')
+        with self.afc.function.config_batch():
+            self.afc.function.ConfigRewrite(self.fullname, 'tool_stn', self.tool_stn, '')
+            self.afc.function.ConfigRewrite(self.fullname, 'tool_stn_unload', self.tool_stn_unload, '')
+            self.afc.function.ConfigRewrite(self.fullname, 'tool_sensor_after_extruder', self.tool_sensor_after_extruder, '')
 
     cmd_AFC_SET_EXTRUDER_LED_help = "Turns on toolhead leds for specified extruder name, does not affect status led if status_led_idx variable is provided"
     cmd_AFC_SET_EXTRUDER_LED_options = {
@@ -10,11 +10,8 @@
 # Full license text available at: https://www.gnu.org/licenses/gpl-3.0.html
 from __future__ import annotations
 
-import os
 import random
-import re
 import traceback
-import configparser
 import inspect
 
 from configfile import error
@@ -44,6 +41,9 @@ except: raise error(ERROR_STR.format(import_lib="AFC_lane", trace=traceback.form
 try: from extras.AFC_unit import CALI_WARN
 except: raise error(ERROR_STR.format(import_lib="AFC_unit", trace=traceback.format_exc()))
 
+try: from extras.AFC_config_index import ConfigIndex
+except: raise error(ERROR_STR.format(import_lib="AFC_config_index", trace=traceback.format_exc()))
+
 
 def load_config(config):
     return afcFunction(config)
@@ -60,6 +60,8 @@ class afcFunction:
         # self.activate_extruder_cb = self.reactor.register_timer( self._handle_activate_extruder )
         self.printer.register_event_handler("afc:moonraker_connect", self.handle_moonraker_connect)
         self.auto_var_file = None
+        # (section, key) -> file/line index of the config files, shared with AFC_PLR
+        self.config_index = ConfigIndex()
         self.errorLog = {}
         self.pause    = False
         self.afc: afc
@@ -115,6 +117,8 @@ class afcFunction:
         self.mcu = self.printer.lookup_object('mcu')
 
         self.auto_var_file = Path(self.afc.VarFile).parent.joinpath("AFC_auto_vars.cfg")
+        self.config_index.logger = self.logger
+        self.config_index.add_root(self.afc.cfgloc)
         self.afc.gcode.register_command('CALIBRATE_AFC',   self.cmd_CALIBRATE_AFC,   desc=self.cmd_CALIBRATE_AFC_help)
         self.afc.gcode.register_command('ALL_CALIBRATION', self.cmd_ALL_CALIBRATION, desc=self.cmd_ALL_CALIBRATION_help)
         self.afc.gcode.register_command('AFC_CALI_FAIL',   self.cmd_AFC_CALI_FAIL,   desc=self.cmd_AFC_CALI_FAIL_help)
@@ -142,72 +146,45 @@ class afcFunction:
     def write_auto_variables(self, section_name, value_name, value):
         """
         Function writes variables to a separate file defined by `auto_var_file` variable.
-        First checks if section_name exists, if section does not exist its added
-        and then key,value is added to section and then config is saved to disk.
+        Adds section_name to the file if it does not exist yet and then adds or updates
+        the key/value in that section, leaving the rest of the file untouched.
 
         :param section_name: Name of section to add key/value to
         :param value_name: Name of key to add to section
         :param value: Value to assign to key
         """
-        config = configparser.RawConfigParser( delimiters=(':', '=') )
-
-        if not os.path.exists(self.auto_var_file):
-            open(self.auto_var_file, 'a').close()
-
-        # Read in old config
-        with open(self.auto_var_file) as fp:
-            config.read_file(fp)
-
-        if not config.has_section( section_name ):
-            config.add_section( section_name )
+        self.config_index.add_value(self.auto_var_file, section_name, value_name, value,
+                                    header=self.auto_save_top_comment)
 
-        config.set( section_name, value_name, value )
+    def config_batch(self):
+        """
+        Context manager that groups ConfigRewrite/write_auto_variables calls so each
+        touched config file is written once, atomically, when the block exits.
 
-        with open(self.auto_var_file, 'w') as fp:
-            fp.write(self.auto_save_top_comment)
-            config.write(fp)
+        Usage
+        -----
+        ```
+        with self.afc.function.config_batch():
+            self.afc.function.ConfigRewrite(section, 'key_a', value_a)
+            self.afc.function.ConfigRewrite(section, 'key_b', value_b)
+        ```
+        """
+        return self.config_index.batch()
 
     def ConfigRewrite(self, rawsection, rawkey, rawvalue, msg=""):
-        taskdone = False
-        sectionfound = False
-        # Creating regex pattern based off rawsection
-        pattern = re.compile("^\\[\\s*{}\\s*\\]".format(rawsection))
-        for filename in os.listdir(self.afc.cfgloc):
-            file_path = os.path.join(self.afc.cfgloc, filename)
-            if os.path.isfile(file_path) and filename.endswith(".cfg"):
-                with open(file_path, 'r') as f:
-                    dataout = ''
-                    for line in f:
-                        # If previous section found and line starts with bracket, means that this line is another section
-                        # need to set section found to false in order to not update wrong sections if raw key is not
-                        # found
-                        if sectionfound and line.startswith("["): sectionfound = False
-
-                        if re.match(pattern, line) is not None: sectionfound = True
-                        if sectionfound == True and line.startswith(rawkey):
-                            comments = ""
-                            comment_index = 0
-                            try:
-                                comment_index = line.index('#')
-                                comments = line[comment_index:-1]
-                            except ValueError:
-                                pass
-                            line = "{}: {}".format(rawkey, rawvalue )
-                            # Left justifying comment with spaces so its in original position
-                            line = line.ljust(comment_index - 1, " ")
-
-                            line = "{} {}\n".format(line, comments)
-                            sectionfound = False
-                            taskdone = True
-                        dataout += line
-                if taskdone:
-                    f=open(file_path, 'w')
-                    f.write(dataout)
-                    f.close()
-                    taskdone = False
-                    msg +='\n<span class=info--text>Saved {}:{} in {} section to configuration file</span>'.format(rawkey, rawvalue, rawsection)
-                    self.logger.info(msg)
-                    return
+        """
+        Rewrites `rawkey` in `rawsection` in place in the AFC config files, keeping any inline
+        comment. Keys that do not exist in any AFC config file are added to AFC_auto_vars.cfg.
+
+        :param rawsection: Section name to update
+        :param rawkey: Key to update
+        :param rawvalue: New value
+        :param msg: Message prefix to log along with the result
+        """
+        if self.config_index.set_value(rawsection, rawkey, rawvalue, within=self.afc.cfgloc):
+            msg +='\n<span class=info--text>Saved {}:{} in {} section to configuration file</span>'.format(rawkey, rawvalue, rawsection)
+            self.logger.info(msg)
+            return
         # Variables not found, write section and key to a separate file
         self.write_auto_variables( rawsection, rawkey, rawvalue )
         msg +='\n<span class=info--text>Key {} not found in section {} added to AFC_auto_vars.cfg file</span>'.format(rawkey, rawsection)
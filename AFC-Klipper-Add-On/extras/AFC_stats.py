@@ -38,6 +38,10 @@ class AFCStats_var:
     moonraker : AFC_moonraker
         AFC_moonraker class to easily post values to moonraker
     """
+    # Optional klippy metrics that stat updates are also exported to
+    metrics_events = None
+    metrics_times  = None
+
     def __init__(self, parent_name: str, name: str, data: dict, moonraker: AFC_moonraker,
                  new_parent_name: str='', new_average: bool=False):
         self.parent_name = parent_name
@@ -69,6 +73,20 @@ class AFCStats_var:
     def __str__(self):
         return str(self._value)
 
+    @classmethod
+    def export_metrics(cls, registry):
+        """
+        Export stat updates to a klippy metrics registry ([metrics] section). Count
+        increments are exported as afc_stat_events_total and averaged times as
+        afc_phase_seconds histograms.
+
+        :param registry: MetricsRegistry from klippy's metrics module
+        """
+        cls.metrics_events = registry.counter("afc_stat_events_total",
+                                              "AFC stat counter increments", ["stat"])
+        cls.metrics_times  = registry.histogram("afc_phase_seconds",
+                                                "AFC tool change phase durations", ["phase"])
+
     @property
     def value(self):
         return self._value
@@ -110,6 +128,8 @@ class AFCStats_var:
 
         :param value: Float value to average or sum into current value
         """
+        if self.metrics_times is not None:
+            self.metrics_times.observe(value, (self.name,))
         if self._value > 0:
             self._value += value
             if not self.new_average:
@@ -139,6 +159,8 @@ class AFCStats_var:
         """
         Helper function to easily increment count and updates moonrakers database
         """
+        if self.metrics_events is not None:
+            self.metrics_events.inc(1., (f"{self.parent_name}.{self.name}",))
         self._value += 1
         self.update_database()
 
@@ -18,6 +18,7 @@ from __future__ import annotations
 import time
 import threading
 import traceback
+from collections import deque
 from datetime import datetime
 from configparser import Error as error
 from typing import Any, Dict, Optional, Tuple, TYPE_CHECKING
@@ -57,19 +58,45 @@ class OAMSStatus:
 class AMSEventBus:
     """Process-wide singleton publish/subscribe bus for OpenAMS events.
 
-    Subscribers are stored per event type ordered by descending priority and
-    invoked synchronously on ``publish``. A bounded, TTL-pruned history of
-    recent events is retained for diagnostics.
+    Once a printer is attached, ``publish`` only records the event and queues
+    it; subscribers run later from a reactor callback, highest priority first,
+    so a slow handler no longer stalls the publisher (sensor polling, load
+    sequences). Repeated state events that are still queued are coalesced to
+    the latest value. Without a printer, events are dispatched synchronously.
+
+    A bounded ring of recent events and per-subscriber latency statistics are
+    available through ``AFC_OAMS_EVENTS`` and the ``afc/openams/events``
+    webhook.
+
+    Nothing in this module subscribes: afcAMS reads the F1S/hub sensors in
+    ``_poll_oams_sensors`` itself. Published events only reach the history
+    and any subscriber another module registers.
     """
     _instance = None
     _lock = threading.RLock()
     _MAX_HISTORY = 500
-    _HISTORY_TTL = 3600.0
+    # State events: a queued event with the same type and key values is
+    # replaced by the newer one instead of being delivered twice
+    _COALESCE_KEYS = {
+        "f1s_changed": ("unit_name", "bay"),
+        "hub_changed": ("unit_name", "bay"),
+    }
+    # Longest time one dispatch callback runs before yielding to the reactor
+    _DISPATCH_BUDGET = 0.050
+    # Handlers slower than this are logged
+    _SLOW_HANDLER = 0.100
 
     def __init__(self):
-        """Initialize an empty subscriber map, event history, and logger slot."""
+        """Initialize an empty subscriber map, queues, event history, and logger slot."""
         self._subscribers = {}
-        self._event_history = []
+        self._event_history = deque(maxlen=self._MAX_HISTORY)
+        self._queues = {}           # priority -> deque of pending deliveries
+        self._pending_state = {}    # (event_type, key) -> pending event payload
+        self._dispatch_scheduled = False
+        self._subscriber_stats = {}
+        self._published = self._coalesced = 0
+        self.printer = None
+        self.reactor = None
         self.logger = None
 
     @classmethod
@@ -86,6 +113,30 @@ class AMSEventBus:
                 cls._instance.logger = logger
             return cls._instance
 
+    def attach_printer(self, printer):
+        """Dispatch through this printer's reactor and register the
+        ``AFC_OAMS_EVENTS`` command and ``afc/openams/events`` endpoint.
+
+        Repeated calls for the same printer are no-ops. After a klippy restart
+        the new printer replaces the old one and undelivered events are dropped.
+
+        :param printer: Klipper printer object.
+        """
+        with self._lock:
+            if printer is self.printer:
+                return
+            self.printer = printer
+            self.reactor = printer.get_reactor()
+            self._queues.clear()
+            self._pending_state.clear()
+            self._dispatch_scheduled = False
+        gcode = printer.lookup_object("gcode")
+        gcode.register_command("AFC_OAMS_EVENTS", self.cmd_AFC_OAMS_EVENTS,
+                               desc=self.cmd_AFC_OAMS_EVENTS_help)
+        webhooks = printer.lookup_object("webhooks")
+        webhooks.register_endpoint("afc/openams/events",
+                                   self._handle_events_request)
+
     def subscribe(self, event_type, callback, *, priority=0):
         """Register a callback for an event type, ordered by priority.
 
@@ -106,34 +157,220 @@ class AMSEventBus:
             subscribers.insert(insert_idx, (callback, priority))
 
     def publish(self, event_type, **kwargs):
-        """Record an event in history and dispatch it to all subscribers.
+        """Record an event in history and queue it for all subscribers.
 
-        Exceptions raised by individual subscribers are swallowed so one bad
-        callback cannot block the others.
+        Exceptions raised by individual subscribers are logged and swallowed
+        so one bad callback cannot block the others.
 
         :param event_type: event name to publish.
         :param kwargs: event payload; ``eventtime`` defaults to ``time.time()``.
-        :return int: number of subscribers that handled the event successfully.
+        :return int: number of subscribers the event was queued for (or, with
+            no printer attached, that handled it successfully).
         """
         eventtime = kwargs.get('eventtime', time.time())
         with self._lock:
+            self._published += 1
             self._event_history.append((event_type, eventtime, dict(kwargs)))
-            if len(self._event_history) > self._MAX_HISTORY:
-                cutoff = time.monotonic() - self._HISTORY_TTL
-                self._event_history = [e for e in self._event_history if e[1] > cutoff]
-                if len(self._event_history) > self._MAX_HISTORY:
-                    self._event_history = self._event_history[-self._MAX_HISTORY:]
             subscribers = list(self._subscribers.get(event_type, []))
-        if not subscribers:
-            return 0
-        success_count = 0
+            if not subscribers:
+                return 0
+            if self.reactor is None:
+                synchronous = True
+            else:
+                synchronous = False
+                self._enqueue(event_type, kwargs, subscribers)
+        if synchronous:
+            queued = time.monotonic()
+            return sum(self._deliver(callback, priority, event_type, kwargs, queued)
+                       for callback, priority in subscribers)
+        self._schedule_dispatch()
+        return len(subscribers)
+
+    def _enqueue(self, event_type, kwargs, subscribers):
+        """Queue one delivery per subscriber, or refresh a pending state event.
+
+        Must be called with the bus lock held.
+        """
+        key_fields = self._COALESCE_KEYS.get(event_type)
+        if key_fields is not None:
+            state_key = (event_type,) + tuple(kwargs.get(f) for f in key_fields)
+            pending = self._pending_state.get(state_key)
+            if pending is not None:
+                # None of the queued deliveries (which share this payload
+                # dict) has run yet, so they can simply carry the new value
+                pending.clear()
+                pending.update(kwargs)
+                self._coalesced += 1
+                return
+            kwargs = self._pending_state[state_key] = dict(kwargs)
+        else:
+            state_key = None
+        queued = time.monotonic()
         for callback, priority in subscribers:
-            try:
-                callback(event_type=event_type, **kwargs)
-                success_count += 1
-            except Exception:
-                pass
-        return success_count
+            queue = self._queues.get(priority)
+            if queue is None:
+                queue = self._queues[priority] = deque()
+            queue.append((callback, priority, event_type, kwargs, queued, state_key))
+
+    def _schedule_dispatch(self):
+        """Arrange for ``_dispatch`` to run from the reactor."""
+        with self._lock:
+            if self._dispatch_scheduled or self.reactor is None:
+                return
+            self._dispatch_scheduled = True
+            reactor = self.reactor
+        if threading.current_thread() is threading.main_thread():
+            reactor.register_callback(self._dispatch)
+        else:
+            reactor.register_async_callback(self._dispatch)
+
+    def _pop_delivery(self):
+        """Return the oldest delivery of the highest priority, or None."""
+        with self._lock:
+            for priority in sorted(self._queues, reverse=True):
+                queue = self._queues[priority]
+                if queue:
+                    delivery = queue.popleft()
+                    state_key = delivery[5]
+                    if (state_key is not None
+                            and self._pending_state.get(state_key) is delivery[3]):
+                        # Delivery has started - newer events must queue anew
+                        del self._pending_state[state_key]
+                    return delivery
+                del self._queues[priority]
+            self._dispatch_scheduled = False
+            return None
+
+    def _dispatch(self, eventtime):
+        """Reactor callback: deliver queued events for up to ``_DISPATCH_BUDGET``."""
+        deadline = time.monotonic() + self._DISPATCH_BUDGET
+        while True:
+            delivery = self._pop_delivery()
+            if delivery is None:
+                return
+            callback, priority, event_type, kwargs, queued, _key = delivery
+            self._deliver(callback, priority, event_type, dict(kwargs), queued)
+            if time.monotonic() > deadline:
+                break
+        # Let other reactor work run before continuing
+        with self._lock:
+            self._dispatch_scheduled = False
+        self._schedule_dispatch()
+
+    def flush(self):
+        """Deliver every queued event now, in the caller's stack."""
+        while True:
+            delivery = self._pop_delivery()
+            if delivery is None:
+                return
+            callback, priority, event_type, kwargs, queued, _key = delivery
+            self._deliver(callback, priority, event_type, dict(kwargs), queued)
+
+    def _deliver(self, callback, priority, event_type, kwargs, queued):
+        """Invoke one subscriber and record its queue delay and run time.
+
+        :return int: 1 if the handler succeeded, else 0.
+        """
+        start = time.monotonic()
+        ok = 1
+        try:
+            callback(event_type=event_type, **kwargs)
+        except Exception as e:
+            ok = 0
+            if self.logger is not None:
+                self.logger.error(f"Event handler failed for '{event_type}' (priority={priority}): {e}")
+        end = time.monotonic()
+        name = getattr(callback, "__qualname__", repr(callback))
+        with self._lock:
+            stats = self._subscriber_stats.get(name)
+            if stats is None:
+                stats = self._subscriber_stats[name] = {
+                    "calls": 0, "errors": 0, "total_time": 0., "max_time": 0.,
+                    "max_delay": 0.}
+            stats["calls"] += 1
+            stats["errors"] += 1 - ok
+            stats["total_time"] += end - start
+            stats["max_time"] = max(stats["max_time"], end - start)
+            stats["max_delay"] = max(stats["max_delay"], start - queued)
+        if end - start > self._SLOW_HANDLER and self.logger is not None:
+            self.logger.debug(f"Slow OpenAMS event handler {name} for '{event_type}': "
+                              f"{(end - start) * 1000.:.1f} ms")
+        return ok
+
+    # ---- Diagnostics ----
+
+    def get_history(self, event_type=None, count=None):
+        """Return recent events, oldest first.
+
+        :param event_type: only return events of this type.
+        :param count: return at most this many of the newest matching events.
+        :return list: ``{"event_type", "eventtime", "data"}`` dicts.
+        """
+        with self._lock:
+            events = list(self._event_history)
+        if event_type is not None:
+            events = [e for e in events if e[0] == event_type]
+        if count is not None:
+            events = events[-count:] if count > 0 else []
+        return [{"event_type": etype, "eventtime": etime, "data": data}
+                for etype, etime, data in events]
+
+    def get_stats(self):
+        """Return bus counters and per-subscriber latency statistics.
+
+        :return dict: published/coalesced/queued counts and, per subscriber,
+            calls, errors, average and maximum run time and maximum queue delay.
+        """
+        with self._lock:
+            subscribers = {}
+            for name, stats in self._subscriber_stats.items():
+                calls = stats["calls"]
+                subscribers[name] = dict(stats, avg_time=stats["total_time"] / calls)
+            return {
+                "published": self._published,
+                "coalesced": self._coalesced,
+                "queued": sum(len(q) for q in self._queues.values()),
+                "subscribers": subscribers,
+            }
+
+    def _handle_events_request(self, web_request):
+        """Webhook ``afc/openams/events``: recent history and handler stats."""
+        event_type = web_request.get_str("event_type", None)
+        count = web_request.get_int("count", None)
+        web_request.send({"events": self.get_history(event_type, count),
+                          "stats": self.get_stats()})
+
+    cmd_AFC_OAMS_EVENTS_help = "Show recent OpenAMS events and event handler latency"
+
+    def cmd_AFC_OAMS_EVENTS(self, gcmd):
+        """Report the most recent OpenAMS bus events and per-handler latency.
+
+        Usage
+        -----
+        `AFC_OAMS_EVENTS [TYPE=<event_type>] [COUNT=<n>]`
+
+        Example
+        -----
+        ```
+        AFC_OAMS_EVENTS TYPE=hub_changed COUNT=10
+        ```
+        """
+        event_type = gcmd.get("TYPE", None)
+        count = gcmd.get_int("COUNT", 20, minval=0)
+        lines = []
+        for event in self.get_history(event_type, count):
+            data = ", ".join(f"{k}={v}" for k, v in event["data"].items()
+                             if k != "eventtime")
+            lines.append(f"{event['eventtime']:.3f} {event['event_type']} {data}")
+        stats = self.get_stats()
+        lines.append(f"Published: {stats['published']}, coalesced: {stats['coalesced']}, "
+                     f"queued: {stats['queued']}")
+        for name, sub in sorted(stats["subscribers"].items()):
+            lines.append(f"{name}: {sub['calls']} calls, {sub['errors']} errors, "
+                         f"avg {sub['avg_time'] * 1000.:.2f} ms, "
+                         f"max {sub['max_time'] * 1000.:.2f} ms, "
+                         f"max delay {sub['max_delay'] * 1000.:.2f} ms")
+        gcmd.respond_info("\n".join(lines))
 
 
 class LaneInfo:
@@ -169,28 +406,30 @@ class LaneInfo:
 
 
 class LaneRegistry:
-    """Per-printer registry mapping OpenAMS lanes to spools and extruders.
+    """Per-printer registry mapping OpenAMS lanes to spools, extruders and FPS.
 
-    Maintains lookup indexes (by lane name, by (unit, spool) pair, by extruder)
-    so the hardware service can resolve lane identities from firmware events.
-    One instance exists per printer object.
+    The authoritative index for lane resolution: lanes are added and removed
+    with ``register_lane``/``unregister_lane`` (afcAMS registers its lanes at
+    klippy:ready), and every lookup - by lane name (exact or case-insensitive),
+    (unit, spool) pair, extruder or FPS - is a dictionary hit. One instance
+    exists per printer object.
     """
     _instances = {}
     _lock = threading.RLock()
 
     def __init__(self, printer, logger=None):
-        """Initialize empty lane lists and lookup indexes.
+        """Initialize the empty lookup indexes.
 
         :param printer: Klipper printer object this registry serves.
         :param logger: optional AFC logger instance.
         """
         self.printer = printer
         self.logger = logger
-        self._lanes = []
-        self._by_lane_name = {}
+        self._lanes = {}              # lane name -> LaneInfo, registration order
         self._by_lane_name_lower = {}
-        self._by_spool = {}
-        self._by_extruder = {}
+        self._by_spool = {}           # (unit name, spool index) -> LaneInfo
+        self._by_extruder = {}        # extruder name -> {lane name: LaneInfo}
+        self._by_fps = {}             # FPS name -> {lane name: LaneInfo}
         self.event_bus = AMSEventBus.get_instance(logger=self.logger)
 
     @classmethod
@@ -228,7 +467,7 @@ class LaneRegistry:
         :return LaneInfo: the newly created lane record.
         """
         with self._lock:
-            existing = self._by_lane_name.get(lane_name)
+            existing = self._lanes.get(lane_name)
             if existing is not None:
                 self._unregister_lane(existing)
             info = LaneInfo(
@@ -237,30 +476,55 @@ class LaneRegistry:
                 fps_name=fps_name, hub_name=hub_name, led_index=led_index,
                 custom_load_cmd=custom_load_cmd, custom_unload_cmd=custom_unload_cmd,
             )
-            self._lanes.append(info)
-            self._by_lane_name[lane_name] = info
+            self._lanes[lane_name] = info
             self._by_lane_name_lower[lane_name.lower()] = info
             self._by_spool[(unit_name, spool_index)] = info
-            if extruder not in self._by_extruder:
-                self._by_extruder[extruder] = []
-            self._by_extruder[extruder].append(info)
+            self._by_extruder.setdefault(extruder, {})[lane_name] = info
+            if fps_name is not None:
+                self._by_fps.setdefault(fps_name, {})[lane_name] = info
+            return info
+
+    def unregister_lane(self, lane_name):
+        """Remove a lane from all lookup indexes.
+
+        :param lane_name: AFC lane name.
+        :return LaneInfo: the removed record, or None if it was not registered.
+        """
+        with self._lock:
+            info = self._lanes.get(lane_name)
+            if info is not None:
+                self._unregister_lane(info)
             return info
 
     def _unregister_lane(self, info):
-        """Remove a lane record from all lookup indexes.
+        """Remove a lane record from all lookup indexes (lock held).
+
+        Index entries that were since claimed by another lane are left alone.
 
         :param info: the LaneInfo record to remove.
         """
-        if info in self._lanes:
-            self._lanes.remove(info)
-        self._by_lane_name.pop(info.lane_name, None)
-        self._by_lane_name_lower.pop(info.lane_name.lower(), None)
-        self._by_spool.pop((info.unit_name, info.spool_index), None)
-        extruder_lanes = self._by_extruder.get(info.extruder, [])
-        if info in extruder_lanes:
-            extruder_lanes.remove(info)
-            if not extruder_lanes:
-                self._by_extruder.pop(info.extruder, None)
+        if self._lanes.get(info.lane_name) is info:
+            del self._lanes[info.lane_name]
+        if self._by_lane_name_lower.get(info.lane_name.lower()) is info:
+            del self._by_lane_name_lower[info.lane_name.lower()]
+        spool_key = (info.unit_name, info.spool_index)
+        if self._by_spool.get(spool_key) is info:
+            del self._by_spool[spool_key]
+        for index, key in ((self._by_extruder, info.extruder),
+                           (self._by_fps, info.fps_name)):
+            lanes = index.get(key)
+            if lanes is not None and lanes.get(info.lane_name) is info:
+                del lanes[info.lane_name]
+                if not lanes:
+                    del index[key]
+
+    def get_lanes(self):
+        """Return all registered lanes in registration order.
+
+        :return list: LaneInfo records.
+        """
+        with self._lock:
+            return list(self._lanes.values())
 
     def get_by_lane(self, lane_name):
         """Return the LaneInfo for a lane name, or None.
@@ -269,7 +533,7 @@ class LaneRegistry:
         :return LaneInfo: matching record or None.
         """
         with self._lock:
-            return self._by_lane_name.get(lane_name)
+            return self._lanes.get(lane_name)
 
     def get_by_spool(self, unit_name, spool_index):
         """Return the LaneInfo for a (unit, spool) pair, or None.
@@ -281,6 +545,24 @@ class LaneRegistry:
         with self._lock:
             return self._by_spool.get((unit_name, spool_index))
 
+    def get_by_extruder(self, extruder):
+        """Return the lanes feeding an extruder.
+
+        :param extruder: extruder name.
+        :return list: LaneInfo records (empty if none).
+        """
+        with self._lock:
+            return list(self._by_extruder.get(extruder, {}).values())
+
+    def get_by_fps(self, fps_name):
+        """Return the lanes monitored by an FPS buffer.
+
+        :param fps_name: FPS buffer name.
+        :return list: LaneInfo records (empty if none).
+        """
+        with self._lock:
+            return list(self._by_fps.get(fps_name, {}).values())
+
     def resolve_lane_token(self, token):
         """Resolve a lane name case-insensitively.
 
@@ -310,6 +592,134 @@ class LaneRegistry:
         return info.extruder if info else None
 
 
+# Lane states in which filament is being moved by the unit; polling runs at the
+# load rate while any lane of the unit is in one of them.
+_ACTIVE_LANE_STATES = frozenset((
+    AFCLaneState.TOOL_LOADING, AFCLaneState.TOOL_UNLOADING,
+    AFCLaneState.HUB_LOADING, AFCLaneState.EJECTING,
+    AFCLaneState.CALIBRATING, AFCLaneState.INFINITE_RUNOUT,
+))
+
+
+def _lane_poll_mode(lanes, afc):
+    """Return the poll mode for a set of lanes.
+
+    :param lanes: iterable of AFCLane objects (None entries are skipped).
+    :param afc: the AFC object, or None.
+    :return str: ``"load"`` if any lane is moving filament, ``"print"`` while
+        printing, otherwise ``"idle"``.
+    """
+    for lane in lanes:
+        if lane is not None and getattr(lane, 'status', None) in _ACTIVE_LANE_STATES:
+            return "load"
+    try:
+        if afc is not None and afc.function.in_print():
+            return "print"
+    except Exception:
+        pass
+    return "idle"
+
+
+class AdaptivePollScheduler:
+    """Interval scheduler for OpenAMS sensor polling.
+
+    The base interval follows the unit mode: ``idle``, ``print`` or ``load``.
+    A poll that sees a change drops to ``fast_interval``. Each unchanged poll
+    after that multiplies the interval by ``backoff`` until it is back at the
+    mode's base. The achieved poll rate and change-detection latency are kept
+    for status reporting. The latency is the gap between the poll that saw a
+    change and the previous poll, i.e. the worst case for when it happened.
+    """
+    DEFAULT_INTERVALS = {"idle": 4.0, "print": 2.0, "load": 0.5}
+    RATE_WINDOW = 20
+
+    def __init__(self, intervals=None, fast_interval=0.25, backoff=1.5):
+        """Initialize the scheduler at the idle rate.
+
+        :param intervals: optional ``{mode: seconds}`` overrides.
+        :param fast_interval: interval after a poll that saw a change.
+        :param backoff: growth factor per unchanged poll.
+        """
+        self.intervals = dict(self.DEFAULT_INTERVALS)
+        if intervals:
+            self.intervals.update(intervals)
+        self.fast_interval = fast_interval
+        self.backoff = backoff
+        self.mode = "idle"
+        self.interval = self.intervals["idle"]
+        self._poll_times = deque(maxlen=self.RATE_WINDOW)
+        self.polls = 0
+        self.changes = 0
+        self.last_latency = None
+        self.max_latency = 0.0
+        self._total_latency = 0.0
+        self._latency_samples = 0
+
+    def next_poll(self, eventtime, mode, changed):
+        """Record a poll and return when the next one should run.
+
+        :param eventtime: reactor time of this poll.
+        :param mode: ``"idle"``, ``"print"`` or ``"load"``.
+        :param changed: whether this poll detected a change.
+        :return float: reactor time for the next poll.
+        """
+        base = self.intervals.get(mode)
+        if base is None:
+            mode, base = "idle", self.intervals["idle"]
+        self.mode = mode
+        if self._poll_times:
+            previous = self._poll_times[-1]
+        else:
+            previous = None
+        self._poll_times.append(eventtime)
+        self.polls += 1
+        if changed:
+            self.changes += 1
+            if previous is not None:
+                latency = eventtime - previous
+                self.last_latency = latency
+                self.max_latency = max(self.max_latency, latency)
+                self._total_latency += latency
+                self._latency_samples += 1
+            self.interval = min(self.fast_interval, base)
+        else:
+            self.interval = min(self.interval * self.backoff, base)
+        return eventtime + self.interval
+
+    def poll_rate(self):
+        """Return the achieved poll rate over the recent window.
+
+        :return float: polls per second (0.0 until two polls were recorded).
+        """
+        if len(self._poll_times) < 2:
+            return 0.0
+        span = self._poll_times[-1] - self._poll_times[0]
+        if span <= 0.0:
+            return 0.0
+        return (len(self._poll_times) - 1) / span
+
+    def get_status(self):
+        """Return polling statistics for status reporting.
+
+        :return dict: mode, current interval, achieved rate, poll/change
+            counts and change-detection latency (seconds).
+        """
+        if self._latency_samples:
+            avg_latency = self._total_latency / self._latency_samples
+        else:
+            avg_latency = None
+        return {
+            "mode": self.mode,
+            "interval": self.interval,
+            "poll_rate": self.poll_rate(),
+            "polls": self.polls,
+            "changes": self.changes,
+            "last_change_latency": self.last_latency,
+            "avg_change_latency": avg_latency,
+            "max_change_latency": self.max_latency,
+        }
+
+
 class AMSHardwareService:
     """Per-(printer, unit) façade over the [oams] hardware controller.
 
@@ -340,12 +750,10 @@ class AMSHardwareService:
         self._status_callbacks = []
         self.registry = LaneRegistry.for_printer(printer, logger=self.logger)
         self.event_bus = AMSEventBus.get_instance(logger=self.logger)
+        self.event_bus.attach_printer(printer)
         self._reactor = None
         self._polling_timer = None
-        self._polling_interval = 2.0
-        self._polling_interval_idle = 4.0
-        self._consecutive_idle_polls = 0
-        self._idle_poll_threshold = 3
+        self.poll_scheduler = AdaptivePollScheduler()
         self._last_encoder_clicks = None
         self._last_f1s_hes = [None, None, None, None]
         self._last_hub_hes = [None, None, None, None]
@@ -424,7 +832,7 @@ class AMSHardwareService:
             return
         self._polling_enabled = True
         self._polling_timer = self._reactor.register_timer(
-            self._polling_callback, self._reactor.NOW + 1.0)
+            self._polling_callback, self._reactor.monotonic() + 1.0)
 
     def stop_polling(self):
         """Disable polling and unregister the poll timer if running."""
@@ -436,47 +844,65 @@ class AMSHardwareService:
     def _polling_callback(self, eventtime):
         """Reactor timer callback: poll status and publish sensor-change events.
 
-        Publishes ``f1s_changed``/``hub_changed`` events on transitions and
-        backs the poll interval off to the idle rate when nothing changes.
+        Publishes ``f1s_changed``/``hub_changed`` events on transitions. The
+        next poll is scheduled by ``poll_scheduler`` from the lane mode and
+        whether anything (sensors or encoder) changed.
 
         :param eventtime: reactor time the timer fired.
         :return float: next scheduled reactor time, or ``NEVER`` if disabled.
         """
         if not self._polling_enabled:
             return self._reactor.NEVER
+        scheduler = self.poll_scheduler
         try:
             status = self.poll_status()
             if not status:
-                return eventtime + self._polling_interval_idle
-            f1s_values = status.get("f1s_hes_value", [])
-            for bay in range(min(len(f1s_values), 4)):
-                new_val = bool(f1s_values[bay])
-                old_val = self._last_f1s_hes[bay]
-                if old_val is None or new_val != old_val:
-                    self.event_bus.publish(
-                        "f1s_changed", unit_name=self.name, bay=bay,
-                        value=new_val, eventtime=eventtime)
-                self._last_f1s_hes[bay] = new_val
-            hub_values = status.get("hub_hes_value", [])
-            for bay in range(min(len(hub_values), 4)):
-                new_val = bool(hub_values[bay])
-                old_val = self._last_hub_hes[bay]
-                if old_val is None or new_val != old_val:
-                    self.event_bus.publish(
-                        "hub_changed", unit_name=self.name, bay=bay,
-                        value=new_val, eventtime=eventtime)
-                self._last_hub_hes[bay] = new_val
+                return scheduler.next_poll(eventtime, "idle", False)
+            changed = False
+            for event_type, last_values, values in (
+                    ("f1s_changed", self._last_f1s_hes,
+                     status.get("f1s_hes_value", [])),
+                    ("hub_changed", self._last_hub_hes,
+                     status.get("hub_hes_value", []))):
+                for bay in range(min(len(values), 4)):
+                    new_val = bool(values[bay])
+                    old_val = last_values[bay]
+                    if old_val is None or new_val != old_val:
+                        changed = changed or old_val is not None
+                        self.event_bus.publish(
+                            event_type, unit_name=self.name, bay=bay,
+                            value=new_val, eventtime=eventtime)
+                    last_values[bay] = new_val
+            mode = self._poll_mode()
             encoder_clicks = status.get("encoder_clicks")
             if encoder_clicks is not None:
-                if self._last_encoder_clicks is not None and encoder_clicks != self._last_encoder_clicks:
-                    self._consecutive_idle_polls = 0
+                if (self._last_encoder_clicks is not None
+                        and encoder_clicks != self._last_encoder_clicks):
+                    changed = True
+                    mode = "load"
                 self._last_encoder_clicks = encoder_clicks
-            self._consecutive_idle_polls += 1
-            if self._consecutive_idle_polls > self._idle_poll_threshold:
-                return eventtime + self._polling_interval_idle
-            return eventtime + self._polling_interval
+            return scheduler.next_poll(eventtime, mode, changed)
         except Exception:
-            return eventtime + self._polling_interval_idle
+            return scheduler.next_poll(eventtime, "idle", False)
+
+    def _poll_mode(self):
+        """Return the poll mode from the state of this unit's registered lanes.
+
+        :return str: ``"load"``, ``"print"`` or ``"idle"``.
+        """
+        afc = self.printer.lookup_object("AFC", None)
+        afc_lanes = getattr(afc, 'lanes', {})
+        lanes = [afc_lanes.get(info.lane_name)
+                 for info in self.registry.get_lanes()
+                 if info.unit_name == self.name]
+        return _lane_poll_mode(lanes, afc)
+
+    def polling_status(self):
+        """Return the adaptive polling statistics of this service.
+
+        :return dict: see ``AdaptivePollScheduler.get_status``.
+        """
+        return self.poll_scheduler.get_status()
 
     def poll_status(self):
         """Read the controller status (falling back to attribute reads) and cache it.
@@ -611,8 +1037,9 @@ class AMSHardwareService:
     def _resolve_lane_name_from_afc(self, unit_name, spool_index):
         """Find a lane name by scanning AFC units when the registry has no entry.
 
-        Matches the unit by ``oams_name`` and the lane by its ``unit:slot``
-        suffix (slot = spool_index + 1).
+        Matches the unit by ``oams_name`` and the lane by its slot, the
+        ``index`` AFCLane parses from ``unit: <name>:<slot>``
+        (slot = spool_index + 1).
 
         :param unit_name: owning OpenAMS unit name.
         :param spool_index: spool index.
@@ -637,14 +1064,10 @@ class AMSHardwareService:
                 continue
             target_slot = normalized_index + 1
             for lane_name, lane_obj in getattr(unit_obj, 'lanes', {}).items():
-                lane_unit = getattr(lane_obj, 'unit', None)
-                if lane_unit and ':' in lane_unit:
-                    try:
-                        slot = int(lane_unit.split(':', 1)[1])
-                    except (ValueError, IndexError):
-                        continue
-                    if slot == target_slot:
-                        return lane_name
+                # AFCLane keeps the slot of its ``unit: <name>:<slot>``
+                # option in ``index`` (``lane.unit`` is only the unit name)
+                if getattr(lane_obj, 'index', 0) == target_slot:
+                    return lane_name
         return None
 
 
@@ -751,8 +1174,17 @@ class afcAMS(afcUnit):
         self._follower: Optional[FollowerController] = None
         self._monitor: Optional[OAMSMonitor] = None
         self._spool_map: dict[str, int] = {}
+        self._lane_registry = LaneRegistry.for_printer(self.printer)
+
+        # Sensor poll intervals (seconds) per mode; see AdaptivePollScheduler
+        self._poll_scheduler = AdaptivePollScheduler({
+            "idle": config.getfloat("poll_interval_idle", 4.0, minval=0.1),
+            "print": config.getfloat("poll_interval_print", 2.0, minval=0.1),
+            "load": config.getfloat("poll_interval_load", 0.5, minval=0.1),
+        })
 
         self.gcode = self.printer.lookup_object('gcode')
+        AMSEventBus.get_instance().attach_printer(self.printer)
         self.gcode.register_mux_command(
             'AFC_OAMS_CALIBRATE_PTFE', "UNIT", self.name, self.cmd_AFC_OAMS_CALIBRATE_PTFE,
             desc="Calibrate OpenAMS PTFE length")
@@ -888,6 +1320,7 @@ class afcAMS(afcUnit):
             super().handle_ready()
         except Exception as e:
             self.logger.debug(f"afcUnit.handle_ready: {e}")
+        self._register_lanes()
         # Vivid-style hub: each lane's raw_load_state carries the hub HES and the
         # native AFC_hub reports any(lane.raw_load_state). The hub stays
         # non-driven (_state_driven False) — no set_state_driven needed.
@@ -904,11 +1337,46 @@ class afcAMS(afcUnit):
         # Seed initial state from hardware sensors
         self._sync_lanes_from_hardware()
 
-        # Start periodic polling (every 2s) for sensor changes
+        # Start adaptive polling for sensor changes
         self._poll_timer = self.afc.reactor.register_timer(
             self._poll_oams_sensors,
             self.afc.reactor.monotonic() + 1.0)
 
+    def _register_lanes(self):
+        """Index this unit's lanes in the shared ``LaneRegistry``.
+
+        Spool indexes follow the ``unit:slot`` numbering (``lane.index``)
+        used by ``AMSHardwareService._resolve_lane_name_from_afc``; lanes
+        without a slot are left to that scan. Each registered bay is checked
+        against the scan, and a mismatch (e.g. two lanes configured with the
+        same slot) is logged.
+        """
+        self._lane_registry = LaneRegistry.for_printer(self.printer, logger=self.logger)
+        registered = set()
+        for lane_name, lane in self.lanes.items():
+            if getattr(lane, 'index', 0) < 1:
+                continue
+            extruder_obj = getattr(lane, 'extruder_obj', None)
+            buf = getattr(lane, 'buffer_obj', None)
+            fps_name = None
+            if buf is not None and hasattr(buf, 'get_fps_value'):
+                fps_name = getattr(buf, 'name', 'fps')
+            self._lane_registry.register_lane(
+                lane_name, self.oams_name, self._spool_map[lane_name],
+                extruder_obj.name if extruder_obj is not None else None,
+                fps_name=fps_name, hub_name=getattr(lane, 'hub', None),
+                led_index=getattr(lane, 'led_index', None))
+            registered.add(self._spool_map[lane_name])
+        hw = AMSHardwareService.for_printer(self.printer, self.oams_name, logger=self.logger)
+        for spool_index in sorted(registered):
+            indexed = hw.resolve_lane_for_spool(self.oams_name, spool_index)
+            scanned = hw._resolve_lane_name_from_afc(self.oams_name, spool_index)
+            if indexed != scanned:
+                self.logger.warning(
+                    f"{self.name}: bay {spool_index} resolves to lane "
+                    f"'{indexed}' but the AFC unit scan finds '{scanned}'; "
+                    f"check the lane unit slots")
+
     def _is_virtual_hub(self, lane) -> bool:
         """Return whether a lane's hub is a virtual (pin-backed) hub.
 
@@ -962,12 +1430,19 @@ class afcAMS(afcUnit):
                 self._last_hub[slot] = hub_present
 
     def _poll_oams_sensors(self, eventtime):
-        """Periodic timer callback — detect sensor changes and update lane state."""
+        """Periodic timer callback — detect sensor changes and update lane state.
+
+        The next poll time comes from ``_poll_scheduler``: fast after a change,
+        then backing off to the idle/print/load rate of the unit.
+        """
         if self.oams is None:
             return self.afc.reactor.NEVER
 
         if self._operation_active:
-            return eventtime + 2.0
+            # Load/unload in progress; the sequence re-polls when it finishes
+            return eventtime + self._poll_scheduler.intervals["print"]
+
+        changed = False
 
         resync_prev = self._prev_states_stale
         self._prev_states_stale = False
@@ -997,6 +1472,7 @@ class afcAMS(afcUnit):
                     old_f1s = self._last_f1s[slot] if slot < len(self._last_f1s) else None
 
                     if old_f1s is not None and new_f1s != old_f1s:
+                        changed = True
                         if self._should_block_sensor_for_runout(lane, new_f1s):
                             self._last_f1s[slot] = new_f1s
                             continue
@@ -1013,9 +1489,27 @@ class afcAMS(afcUnit):
             if slot < len(hub_values):
                 new_hub = bool(hub_values[slot])
                 lane._load_state = new_hub
+                if not resync_prev and self._last_hub[slot] not in (None, new_hub):
+                    changed = True
                 self._last_hub[slot] = new_hub
 
-        return eventtime + 2.0
+        return self._poll_scheduler.next_poll(
+            eventtime, _lane_poll_mode(self.lanes.values(), self.afc), changed)
+
+    def _poll_sensors_soon(self):
+        """Run the sensor poll now (e.g. after a load/unload finished)."""
+        if self._poll_timer is not None:
+            self.afc.reactor.update_timer(self._poll_timer, self.afc.reactor.NOW)
+
+    def get_status(self, eventtime=None):
+        """Unit status, plus the adaptive sensor-polling statistics.
+
+        :param eventtime: reactor time of the status query.
+        :return dict: ``afcUnit`` status with a ``polling`` entry.
+        """
+        response = super().get_status(eventtime)
+        response['polling'] = self._poll_scheduler.get_status()
+        return response
 
     # ── Engagement verification ─────────────────────────────────────
 
@@ -1640,6 +2134,7 @@ class afcAMS(afcUnit):
         finally:
             self._operation_active = False
             self._prev_states_stale = True
+            self._poll_sensors_soon()
 
     def _oams_load_inner(self, cur_lane, cur_extruder) -> bool:
         """OAMS custom load — filament transport only.
@@ -1682,6 +2177,7 @@ class afcAMS(afcUnit):
         finally:
             self._operation_active = False
             self._prev_states_stale = True
+            self._poll_sensors_soon()
 
     def lane_unloading(self, lane):
         """Unload-start hook the upstream core actually calls.
@@ -3071,6 +3567,9 @@ class afcAMS(afcUnit):
             return None
         if lane_name in self.afc.lanes:
             return self.afc.lanes[lane_name]
+        info = self._lane_registry.resolve_lane_token(lane_name)
+        if info is not None and info.lane_name in self.afc.lanes:
+            return self.afc.lanes[info.lane_name]
         lower = lane_name.lower()
         for name, lane in self.afc.lanes.items():
             if name.lower() == lower:
@@ -3085,6 +3584,9 @@ class afcAMS(afcUnit):
         """
         if spool_index is None:
             return None
+        info = self._lane_registry.get_by_spool(self.oams_name, spool_index)
+        if info is not None and info.lane_name in self.afc.lanes:
+            return self.afc.lanes[info.lane_name]
         for name, idx in self._spool_map.items():
             if idx == spool_index and name in self.afc.lanes:
                 return self.afc.lanes[name]
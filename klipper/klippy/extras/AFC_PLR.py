@@ -214,6 +214,8 @@ import threading
 import time
 from typing import TYPE_CHECKING
 
+from extras.AFC_config_index import ConfigIndex
+
 if TYPE_CHECKING:
     pass
 
@@ -378,6 +380,7 @@ class AFCPLR:
         self._sd = None
         self._gcode_move = None
         self._afc = None
+        self._config_index = None
         self._print_stats = None
         self._heater_bed = None
         self.save_file = ''
@@ -1798,44 +1801,22 @@ class AFCPLR:
 
     def _rewrite_config_value(self, section, key, val):
         # Find a .cfg in the config tree whose [section] holds a `key` line and
-        # rewrite it in place, preserving indentation and any trailing comment.
+        # rewrite it in place, preserving any trailing comment. Uses AFC's
+        # config index when AFC is loaded so both share one parse of the tree.
         # Returns the file path on success, else None.
-        sec_re = re.compile(r"^\s*\[\s*%s\s*\]\s*$" % re.escape(section))
-        key_re = re.compile(r"^(\s*)%s\s*[:=]" % re.escape(key))
+        afc = self._afc or self.printer.lookup_object('AFC', None)
+        fn = getattr(afc, 'function', None) if afc is not None else None
+        index = getattr(fn, 'config_index', None)
+        if index is None:
+            if self._config_index is None:
+                self._config_index = ConfigIndex(logging.getLogger())
+            index = self._config_index
         for root in self._config_roots():
-            for dirpath, _dirs, files in os.walk(root):
-                for name in sorted(files):
-                    if not name.endswith('.cfg'):
-                        continue
-                    fpath = os.path.join(dirpath, name)
-                    try:
-                        with open(fpath) as f:
-                            lines = f.readlines()
-                    except OSError:
-                        continue
-                    in_sec = False
-                    idx = None
-                    for i, line in enumerate(lines):
-                        if line.lstrip().startswith('['):
-                            in_sec = sec_re.match(line) is not None
-                            continue
-                        if in_sec and key_re.match(line):
-                            idx = i
-                            break
-                    if idx is None:
-                        continue
-                    indent = key_re.match(lines[idx]).group(1)
-                    comment = ''
-                    if '#' in lines[idx]:
-                        comment = '  ' + lines[idx][lines[idx].index('#'):].rstrip('\n')
-                    lines[idx] = "%s%s: %s%s\n" % (indent, key, val, comment)
-                    try:
-                        with open(fpath, 'w') as f:
-                            f.writelines(lines)
-                        return fpath
-                    except OSError:
-                        continue
-        return None
+            index.add_root(root, recursive=True)
+        try:
+            return index.set_value(section, key, val)
+        except OSError:
+            return None
 
     def cmd_PLR_SAVE(self, gcmd):
         """
@@ -12,9 +12,12 @@ from __future__ import annotations
 import json
 import os
 import re
+import time
+from contextlib import contextmanager
 from typing import TYPE_CHECKING
-from urllib.request import Request
-from urllib.parse import urljoin, quote
+from urllib.parse import quote
+
+from extras.AFC_spoolman import lookup_spoolman_service
 
 if TYPE_CHECKING:
     from extras.AFC_lane import AFCLane
@@ -26,18 +29,20 @@ class SpoolmanClient:
     The upstream AFC_moonraker only exposes read helpers (get_spool, GET
     _get_results) — none of the create/search methods our RFID needs. Rather
     than edit the frozen upstream AFC_utils, this wraps the live moonraker
-    object (reusing its host + GET plumbing) and adds the Spoolman write API.
+    object and adds the Spoolman write API on top of the shared
+    SpoolmanService (one keep-alive connection and cache for all modules).
     """
 
     def __init__(self, moonraker):
         """Wrap a live moonraker object to add the Spoolman write API.
 
-        :param moonraker: AFC moonraker object whose host and GET plumbing
-            (``_get_results``, ``get_spool``) are reused.
+        :param moonraker: AFC moonraker object whose host, logger and
+            ``_get_results`` are reused.
         """
         self._mr = moonraker
         self.host = moonraker.host
         self.logger = moonraker.logger
+        self._service = lookup_spoolman_service(moonraker)
         self._fields_ensured = False
         self._filament_fields_ensured = False
 
@@ -50,7 +55,8 @@ class SpoolmanClient:
         """
         return self._mr._get_results(url_string, print_error)
 
-    def _spoolman_proxy(self, method, path, body=None, print_error=True):
+    def _spoolman_proxy(self, method, path, body=None, print_error=True,
+                        max_age=None):
         """Spoolman API call via moonraker's proxy endpoint.
 
         :param method: HTTP method (e.g. 'GET', 'POST', 'PATCH').
@@ -58,9 +64,10 @@ class SpoolmanClient:
         :param body: Optional request body; a JSON string is decoded to an
             object so moonraker's proxy sets the JSON Content-Type.
         :param print_error: Whether to log on a failed request.
+        :param max_age: Oldest cached GET result to accept, in seconds
+            (None for the service TTL, 0 to always fetch).
         :return: Parsed JSON result, or None on failure.
         """
-        payload = {"request_method": method, "path": path}
         if body is not None:
             # Moonraker's proxy needs body as a JSON object so it sets
             # Content-Type: application/json upstream (a raw string body is
@@ -70,11 +77,9 @@ class SpoolmanClient:
                     body = json.loads(body)
                 except (ValueError, TypeError):
                     pass
-            payload["body"] = body
-        url = urljoin(self.host, 'server/spoolman/proxy')
-        req = Request(url, json.dumps(payload).encode('utf-8'),
-                      headers={"Content-Type": "application/json"})
-        result = self._get_results(req, print_error)
+        result = self._service.request(method, path, body=body,
+                                       print_error=print_error,
+                                       max_age=max_age)
         if result is None and method != "GET":
             self.logger.error(
                 f"Spoolman {method} {path} failed; request body: "
@@ -89,7 +94,7 @@ class SpoolmanClient:
         """
         try:
             return self._spoolman_proxy(
-                "GET", "/v1/info", print_error=False) is not None
+                "GET", "/v1/info", print_error=False, max_age=0) is not None
         except Exception:
             return False
 
@@ -127,6 +132,44 @@ class SpoolmanClient:
         resp = self._spoolman_proxy("GET", path, print_error=False)
         return resp if isinstance(resp, list) else []
 
+    def search_spools_since(self, since, page_size=100):
+        """Return the spools registered or used after a Spoolman timestamp.
+
+        Spoolman has no modified-since filter, so this pages through the spool
+        list sorted newest-first on each timestamp field and stops at the first
+        spool at or before ``since``. Timestamps are compared as the ISO strings
+        Spoolman returns, so ``since`` must come from the same server.
+
+        :param since: ISO timestamp of the previous sync.
+        :param page_size: Spools fetched per request.
+        :return list: Changed spool dicts, or None if a request failed.
+        """
+        found = {}
+        for field in ("last_used", "registered"):
+            offset = 0
+            while True:
+                resp = self._spoolman_proxy(
+                    "GET", f"/v1/spool?sort={field}:desc"
+                    f"&limit={page_size}&offset={offset}", print_error=False,
+                    max_age=0)
+                if not isinstance(resp, list):
+                    return None
+                done = len(resp) < page_size
+                for spool in resp:
+                    if not isinstance(spool, dict):
+                        continue
+                    stamp = spool.get(field)
+                    if not stamp:
+                        continue    # never used; the null sort order varies
+                    if stamp <= since:
+                        done = True
+                        break
+                    found[spool.get("id")] = spool
+                if done:
+                    break
+                offset += page_size
+        return list(found.values())
+
     def get_or_create_vendor(self, name):
         """Return an existing Spoolman vendor by name, creating it if absent.
 
@@ -348,13 +391,12 @@ class SpoolmanClient:
         return self._patch_spool(spool_id, lot_nr=lot_nr, extra_updates=extra)
 
     def get_spool(self, spool_id):
-        """Read a spool dict from Spoolman (delegated to the live moonraker,
-        which already has get_spool).
+        """Read a spool dict from Spoolman through the shared service cache.
 
         :param spool_id: Spoolman spool id to fetch.
         :return dict: The spool dict, or None if not found.
         """
-        return self._mr.get_spool(spool_id)
+        return self._service.get_spool(spool_id)
 
     def read_flow_k(self, spool_id):
         """Read flow K from the 'flow_k' extra field.
@@ -1084,6 +1126,10 @@ SPOOLMAN_CACHE_FILE = "AFC_spoolman_cache.json"
 # One-shot guard: pre-build the whole offline cache once per klipper run,
 # on the first reachable Spoolman interaction (set in sync_rfid_to_spoolman).
 _CACHE_PREWARMED = False
+# After the pre-build, later interactions fetch only the spools changed since
+# the last sync, at most once per this many seconds.
+SPOOLMAN_REFRESH_INTERVAL = 600.
+_CACHE_REFRESHED_AT = 0.
 
 
 def _printer_data_dir(afc):
@@ -1154,10 +1200,15 @@ class SpoolmanCache:
     the lane's filament settings.
     """
 
+    # Holds the newest Spoolman timestamp seen, for incremental refreshes
+    SYNC_KEY = "meta:last_sync"
+
     def __init__(self, path, logger=None):
         self.path = path
         self.logger = logger
         self._data = self._load()
+        self._batch_depth = 0
+        self._dirty = False
 
     def _load(self):
         try:
@@ -1170,13 +1221,45 @@ class SpoolmanCache:
     def get(self, key):
         return self._data.get(key) if key else None
 
+    def discard(self, key):
+        if key in self._data:
+            del self._data[key]
+            self._dirty = True
+            if not self._batch_depth:
+                self._save()
+
     def put(self, key, entry):
         if not key or not isinstance(entry, dict):
             return
         if self._data.get(key) == entry:   # no-op rewrite -> don't churn the file
             return
         self._data[key] = entry
-        self._save()
+        self._dirty = True
+        if not self._batch_depth:
+            self._save()
+
+    @contextmanager
+    def batch(self):
+        """Defer the writes of every put() in the block to a single atomic
+        flush when the outermost batch exits.
+        """
+        self._batch_depth += 1
+        try:
+            yield self
+        finally:
+            self._batch_depth -= 1
+            if not self._batch_depth and self._dirty:
+                self._save()
+
+    @property
+    def last_sync(self):
+        """Spoolman timestamp of the newest spool change already cached."""
+        meta = self._data.get(self.SYNC_KEY)
+        return meta.get("time") if isinstance(meta, dict) else None
+
+    def set_last_sync(self, stamp):
+        if stamp:
+            self.put(self.SYNC_KEY, {"time": stamp})
 
     def _save(self):
         tmp = self.path + ".tmp"
@@ -1187,6 +1270,7 @@ class SpoolmanCache:
             with open(tmp, "w") as f:
                 json.dump(self._data, f, indent=1, sort_keys=True)
             os.replace(tmp, self.path)
+            self._dirty = False
         except OSError as e:
             if self.logger:
                 self.logger.debug(f"Spoolman cache save failed ({self.path}): {e}")
@@ -1239,13 +1323,29 @@ def apply_cached_spool(afc, lane, entry: dict, logger, prefix: str):
         return False
 
 
-def build_spoolman_cache(afc, logger, prefix="Spoolman cache"):
+def _spool_weight(value):
+    try:
+        return float(value or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def build_spoolman_cache(afc, logger, prefix="Spoolman cache",
+                         incremental=False):
     """Pre-warm the offline cache from a full Spoolman scan.
 
     Fetches every Spoolman spool and records it under each NFC tag UID it carries
     AND its product SKU, so even tags that have not been inserted yet can be
     restored during an outage. For a SKU shared by several spools, caches the
-    fullest non-archived one (same choice as find_spool_by_sku).
+    fullest non-archived one (same choice as find_spool_by_sku). All entries are
+    written in one batch, so the cache file is rewritten at most once.
+
+    With ``incremental`` only the spools registered or used since the last sync
+    are fetched and merged (a full scan is done when the cache has no sync
+    stamp yet). When a changed spool is the cached SKU choice and got lighter
+    or was archived, that SKU is re-resolved with find_spool_by_sku, since an
+    unchanged spool may now be the fullest. Edits that change neither
+    timestamp are picked up by the next full scan.
 
     :return int: number of cache entries written, or -1 if Spoolman is
         unreachable / not configured.
@@ -1256,39 +1356,74 @@ def build_spoolman_cache(afc, logger, prefix="Spoolman cache"):
     if not client.reachable():
         logger.info(f"{prefix}: Spoolman unreachable - skipping cache pre-build")
         return -1
+    cache = SpoolmanCache(
+        _spoolman_cache_path(afc), logger)
+    since = cache.last_sync if incremental else None
     try:
-        spools = client.search_spools()
+        if since:
+            spools = client.search_spools_since(since)
+            if spools is None:
+                raise RuntimeError("request failed")
+        else:
+            spools = client.search_spools()
     except Exception as e:
         logger.info(f"{prefix}: Spoolman spool scan failed: {e}")
         return -1
 
-    cache = SpoolmanCache(
-        _spoolman_cache_path(afc), logger)
     uid_count = 0
     sku_best = {}   # sku -> (remaining_weight, entry); fullest non-archived wins
-    for spool in spools:
-        if not isinstance(spool, dict):
-            continue
-        fil = spool.get("filament") or {}
-        entry = _spool_cache_entry(spool, fil)
-        for uid in _spool_uids(spool):
-            cache.put(f"uid:{uid}", entry)
-            uid_count += 1
-        sku = (fil.get("article_number") or "").strip()
-        if sku and not spool.get("archived"):
-            try:
-                rem = float(spool.get("remaining_weight") or 0)
-            except (TypeError, ValueError):
-                rem = 0.0
-            if sku not in sku_best or rem > sku_best[sku][0]:
-                sku_best[sku] = (rem, entry)
-    for sku, (_rem, entry) in sku_best.items():
-        cache.put(f"sku:{sku}", entry)
+    recheck = {}    # sku -> True if its cached choice was archived
+    newest = since
+    with cache.batch():
+        for spool in spools:
+            if not isinstance(spool, dict):
+                continue
+            for field in ("registered", "last_used"):
+                stamp = spool.get(field)
+                if stamp and (newest is None or stamp > newest):
+                    newest = stamp
+            fil = spool.get("filament") or {}
+            entry = _spool_cache_entry(spool, fil)
+            for uid in _spool_uids(spool):
+                cache.put(f"uid:{uid}", entry)
+                uid_count += 1
+            sku = (fil.get("article_number") or "").strip()
+            if since and sku:
+                cached = cache.get(f"sku:{sku}")
+                if cached and cached.get("spool_id") == spool.get("id") and (
+                        spool.get("archived")
+                        or _spool_weight(spool.get("remaining_weight"))
+                        < _spool_weight(cached.get("remaining_weight"))):
+                    recheck[sku] = bool(spool.get("archived"))
+            if sku and not spool.get("archived"):
+                if since and sku not in sku_best:
+                    # Only changed spools were fetched: compete against the
+                    # cached choice unless that is this same spool.
+                    cached = cache.get(f"sku:{sku}")
+                    if cached and cached.get("spool_id") != spool.get("id"):
+                        sku_best[sku] = (
+                            _spool_weight(cached.get("remaining_weight")),
+                            cached)
+                rem = _spool_weight(spool.get("remaining_weight"))
+                if sku not in sku_best or rem > sku_best[sku][0]:
+                    sku_best[sku] = (rem, entry)
+        for sku, archived in recheck.items():
+            best = find_spool_by_sku(client, sku)
+            if best is not None:
+                sku_best[sku] = (_spool_weight(best.get("remaining_weight")),
+                                 _spool_cache_entry(best, best.get("filament")))
+            elif archived and sku not in sku_best:
+                # No spool of this product left (or the lookup failed):
+                # never restore the archived one
+                cache.discard(f"sku:{sku}")
+        for sku, (_rem, entry) in sku_best.items():
+            cache.put(f"sku:{sku}", entry)
+        cache.set_last_sync(newest)
     total = uid_count + len(sku_best)
     logger.info(
-        f"{prefix}: pre-built {total} cache entries "
-        f"({uid_count} by UID, {len(sku_best)} by SKU) from "
-        f"{len(spools)} Spoolman spools")
+        f"{prefix}: {'refreshed' if since else 'pre-built'} {total} cache "
+        f"entries ({uid_count} by UID, {len(sku_best)} by SKU) from "
+        f"{len(spools)} {'changed ' if since else ''}Spoolman spools")
     return total
 
 
@@ -1378,11 +1513,18 @@ def sync_rfid_to_spoolman(afc, lane, slot_info: dict, logger, prefix: str,
     # offline cache from a full scan, so even tags not yet inserted survive a
     # later outage. One-shot per klipper run (module flag); best-effort, and it
     # runs entirely from the RFID path (no unit type or core module required).
-    global _CACHE_PREWARMED
-    if not _CACHE_PREWARMED:
+    # Later interactions, at most every SPOOLMAN_REFRESH_INTERVAL, only merge
+    # the spools changed since the last sync.
+    global _CACHE_PREWARMED, _CACHE_REFRESHED_AT
+    now = time.monotonic()
+    incremental = _CACHE_PREWARMED
+    if (not _CACHE_PREWARMED
+            or now - _CACHE_REFRESHED_AT >= SPOOLMAN_REFRESH_INTERVAL):
         _CACHE_PREWARMED = True
+        _CACHE_REFRESHED_AT = now
         try:
-            build_spoolman_cache(afc, logger, prefix=prefix)
+            build_spoolman_cache(afc, logger, prefix=prefix,
+                                 incremental=incremental)
         except Exception as e:
             logger.debug(f"{prefix}: cache pre-warm skipped: {e}")
         # build_spoolman_cache wrote via its OWN SpoolmanCache instance; reload
@@ -56,6 +56,9 @@ DETECT_PRESENT = 1
 XYZ_TO_INDEX = {'x': 0, 'X': 0, 'y': 1, 'Y': 1, 'z': 2, 'Z': 2}
 INDEX_TO_XYZ = 'XYZ'
 
+# Rendered scripts kept per template by the render cache
+RENDER_CACHE_SIZE = 8
+
 class AfcToolchanger(afcUnit):
     def __init__(self, config: ConfigWrapper) -> None:
         super().__init__(config)
@@ -113,6 +116,16 @@ class AfcToolchanger(afcUnit):
         self._crash_active = False
         self._crash_watchdog_timer = None
         self._crash_watchdog_errors = 0
+        # In "events" mode tools with a detection_pin are watched through
+        # their pin change callbacks instead of the polling watchdog, which
+        # remains in use for tools that only have a tool probe.
+        self.crash_detection_mode: str = config.getchoice(
+            'crash_detection_mode', {'poll': 'poll', 'events': 'events'},
+            'poll')
+        self.crash_event_debounce: float = config.getfloat(
+            'crash_event_debounce', 0., minval=0.)
+        self._crash_event_timer = self.printer.get_reactor().register_timer(
+            self._crash_event_check)
 
         # Dock cooling — turns on part cooling fan for docked tools above
         # a temperature threshold to prevent oozing while parked.
@@ -180,6 +193,21 @@ class AfcToolchanger(afcUnit):
         # Fan switcher (created on demand)
         self.fan_switcher = None
 
+        # Rendered template scripts keyed on the context values each
+        # template reads, reused while those values are unchanged
+        self._render_cache = {}
+        self._render_cache_hits = 0
+        self._render_cache_misses = 0
+        self._render_cache_uncacheable = 0
+
+        # Input shapers calibrated per tool, applied when the tool is
+        # picked up: tool name -> {axis: (shaper_type, shaper_freq)}
+        self.tool_shapers: Dict[str, dict] = {}
+
+        # Duration histogram of the tool change gcode phases, set on
+        # connect when a [metrics] section is configured
+        self.phase_metrics = None
+
         # Register native toolchanger gcode commands
         self.gcode.register_command("SELECT_TOOL",
                                     self.cmd_SELECT_TOOL,
@@ -229,6 +257,8 @@ class AfcToolchanger(afcUnit):
 
         self.printer.register_event_handler("klippy:connect",
                                             self._handle_tc_connect)
+        self.printer.register_event_handler("klippy:ready",
+                                            self._restore_tool_shapers)
         self.printer.register_event_handler("homing:home_rails_begin",
                                             self._handle_home_rails_begin)
         self.printer.register_event_handler("homing:home_rails_end",
@@ -261,6 +291,12 @@ class AfcToolchanger(afcUnit):
             self.gcode_transform, force=True)
         self.tool_probe_endstop = self.printer.lookup_object(
             'AFC_tool_probe_endstop', None)
+        metrics = self.printer.lookup_object('metrics', None)
+        if metrics is not None:
+            self.phase_metrics = metrics.registry.histogram(
+                'toolchanger_phase_queue_seconds',
+                "Host time to render and queue each tool change gcode phase"
+                " (not the duration of its moves)", ['phase'])
 
     def _handle_home_rails_begin(self, homing_state, rails):
         self._homing_saved_tool = self.gcode_transform.tool
@@ -317,6 +353,14 @@ class AfcToolchanger(afcUnit):
     def note_detect_change(self, extruder, eventtime):
         """Called by AFC_extruder when a detection pin changes state."""
         self.detected_tool = self._require_detected_tool()
+        if (self._crash_active and extruder is self.active_tool
+                and self._uses_crash_events(extruder)
+                and extruder.detect_state != DETECT_PRESENT):
+            # Confirm once the debounce time (and enable grace) has passed
+            waketime = max(eventtime + self.crash_event_debounce,
+                           self._crash_enable_time + self._crash_enable_grace)
+            self.printer.get_reactor().update_timer(
+                self._crash_event_timer, waketime)
 
     def get_status(self, eventtime=None):
         """Return status for webhooks / gcode template context."""
@@ -332,6 +376,9 @@ class AfcToolchanger(afcUnit):
             'active_tool_gcode_x_offset': offset[0],
             'active_tool_gcode_y_offset': offset[1],
             'active_tool_gcode_z_offset': offset[2],
+            'render_cache_hits': self._render_cache_hits,
+            'render_cache_misses': self._render_cache_misses,
+            'render_cache_uncacheable': self._render_cache_uncacheable,
         })
         return response
 
@@ -670,6 +717,7 @@ class AfcToolchanger(afcUnit):
                 # while still at the dock — before restore moves).
                 self._run_gcode('after_change_gcode',
                                tool.after_change_gcode, extra_context)
+                self._apply_tool_shaper(tool)
 
             self._restore_state_and_transform(tool)
             self.status = STATUS_READY
@@ -864,16 +912,109 @@ class AfcToolchanger(afcUnit):
         if self.active_tool:
             self.active_tool.activate_tool()
 
+    def set_tool_shaper(self, tool, axis, shaper_type, shaper_freq):
+        """Store a calibrated input shaper for a tool, applied on pickup.
+
+        The tool's params_input_shaper_* values are updated as well so
+        templates and power loss recovery see the calibrated shaper.
+        """
+        tool.params['params_input_shaper_type_%s' % axis] = shaper_type
+        tool.params['params_input_shaper_freq_%s' % axis] = shaper_freq
+        self.tool_shapers.setdefault(tool.name, {})[axis] = (
+            shaper_type, shaper_freq)
+        if tool is self.active_tool:
+            self._apply_tool_shaper(tool)
+
+    def save_tool_shapers(self, tool):
+        """Write a tool's calibrated input shapers to its config section.
+
+        The values land in the tool's params_input_shaper_* options, which
+        ``_restore_tool_shapers`` reads back after a restart.
+        """
+        shapers = self.tool_shapers.get(tool.name, {})
+        with self.afc.function.config_batch():
+            for axis, (shaper_type, shaper_freq) in sorted(shapers.items()):
+                self.afc.function.ConfigRewrite(
+                    tool.fullname, 'params_input_shaper_type_%s' % axis,
+                    repr(shaper_type), '')
+                self.afc.function.ConfigRewrite(
+                    tool.fullname, 'params_input_shaper_freq_%s' % axis,
+                    '%.1f' % shaper_freq, '')
+
+    def _restore_tool_shapers(self):
+        """Load per-tool input shapers saved by ``save_tool_shapers``."""
+        for tool in self.tools.values():
+            for axis in 'xy':
+                shaper_type = tool.params.get('params_input_shaper_type_%s' % axis)
+                shaper_freq = tool.params.get('params_input_shaper_freq_%s' % axis)
+                if shaper_type is None or shaper_freq is None:
+                    continue
+                try:
+                    shaper_freq = float(shaper_freq)
+                except (TypeError, ValueError):
+                    continue
+                self.tool_shapers.setdefault(tool.name, {})[axis] = (
+                    str(shaper_type), shaper_freq)
+        if self.active_tool is not None:
+            self._apply_tool_shaper(self.active_tool)
+
+    def _apply_tool_shaper(self, tool):
+        """Apply the input shaper calibrated for a tool, if any."""
+        shapers = self.tool_shapers.get(tool.name)
+        if not shapers:
+            return
+        input_shaper = self.printer.lookup_object('input_shaper', None)
+        if input_shaper is None:
+            return
+        params = {}
+        for axis, (shaper_type, shaper_freq) in shapers.items():
+            params['SHAPER_TYPE_' + axis.upper()] = shaper_type
+            params['SHAPER_FREQ_' + axis.upper()] = '%.1f' % shaper_freq
+        input_shaper.cmd_SET_INPUT_SHAPER(self.gcode.create_gcode_command(
+            "SET_INPUT_SHAPER", "SET_INPUT_SHAPER", params))
+
     def _run_gcode(self, name, template, extra_context):
-        """Run a gcode template with tool/toolchanger context."""
+        """Run a gcode template with tool/toolchanger context.
+
+        The rendered script is cached per template, keyed on the context
+        values the template reads, so templates whose inputs are unchanged
+        between tool changes (dock coordinates, tool params) skip Jinja.
+        """
         curtime = self.printer.get_reactor().monotonic()
-        context = {
-            **template.create_template_context(),
-            'tool': self.active_tool.get_tool_status(curtime) if self.active_tool else {},
-            'toolchanger': self.get_status(curtime),
-            **extra_context,
-        }
-        template.run_gcode_from_command(context)
+        reads = template.get_context_reads()
+        roots = None if reads is None else {path[0] for path in reads}
+        context = template.create_template_context()
+        if roots is None or 'tool' in roots:
+            context['tool'] = (self.active_tool.get_tool_status(curtime)
+                               if self.active_tool else {})
+        if roots is None or 'toolchanger' in roots:
+            context['toolchanger'] = self.get_status(curtime)
+        context.update(extra_context)
+        key = template.get_context_key(context)
+        if key is None:
+            self._render_cache_uncacheable += 1
+            template.run_gcode_from_command(context)
+            self._note_phase(name, curtime)
+            return
+        scripts = self._render_cache.setdefault(template, {})
+        script = scripts.get(key)
+        if script is None:
+            self._render_cache_misses += 1
+            script = template.render(context)
+            if len(scripts) >= RENDER_CACHE_SIZE:
+                del scripts[next(iter(scripts))]
+            scripts[key] = script
+        else:
+            self._render_cache_hits += 1
+        template.run_script_from_command(script)
+        self._note_phase(name, curtime)
+
+    def _note_phase(self, name, start_time):
+        # Moves are only queued here; waiting for them would stall the
+        # toolhead between phases
+        if self.phase_metrics is not None:
+            duration = self.printer.get_reactor().monotonic() - start_time
+            self.phase_metrics.observe(duration, (name,))
 
     def _ensure_homed(self, gcmd):
         """Check that required axes are homed before tool change."""
@@ -997,8 +1138,17 @@ class AfcToolchanger(afcUnit):
         if not self.active_tool:
             return
         self._crash_watchdog_errors = 0
-        self._crash_enable_time = self.printer.get_reactor().monotonic()
+        reactor = self.printer.get_reactor()
+        self._crash_enable_time = reactor.monotonic()
         self._crash_active = True
+        if self._uses_crash_events(self.active_tool):
+            # Pin changes are reported by note_detect_change(); only check
+            # once at the end of the grace period for a tool lost during it
+            reactor.update_timer(
+                self._crash_event_timer,
+                self._crash_enable_time + self._crash_enable_grace)
+            self.logger.info("tool_crash: enabled (pin events)")
+            return
         # Start watchdog timer
         if self._crash_watchdog_timer is None:
             self._crash_watchdog_timer = self.printer.get_reactor().register_timer(
@@ -1014,11 +1164,31 @@ class AfcToolchanger(afcUnit):
         """
         self._crash_active = False
         self._crash_watchdog_errors = 0
+        reactor = self.printer.get_reactor()
+        reactor.update_timer(self._crash_event_timer, reactor.NEVER)
         if self._crash_watchdog_timer is not None:
-            self.printer.get_reactor().unregister_timer(self._crash_watchdog_timer)
+            reactor.unregister_timer(self._crash_watchdog_timer)
             self._crash_watchdog_timer = None
         self.logger.info("tool_crash: disabled")
 
+    def _uses_crash_events(self, tool):
+        """Return True if crash detection for the tool is event driven."""
+        return (self.crash_detection_mode == 'events' and tool is not None
+                and tool.detect_pin_name is not None)
+
+    def _crash_event_check(self, eventtime):
+        """Confirm a detection pin change reported while crash detection is on."""
+        reactor = self.printer.get_reactor()
+        if not self._crash_active or not self.active_tool:
+            return reactor.NEVER
+        if self.status in (STATUS_CHANGING, STATUS_INITIALIZING, STATUS_UNINITIALIZED):
+            return reactor.NEVER
+        active = self.active_tool
+        if not self._is_tool_present(active):
+            self._do_crash("tool_crash: detection pin reported loss of %s"
+                           % active.name, eventtime)
+        return reactor.NEVER
+
     def _crash_watchdog_tick(self, eventtime):
         """Periodic watchdog check — verify active tool is still detected."""
         if not self._crash_active or not self.active_tool:
@@ -1085,6 +1255,8 @@ class AfcToolchanger(afcUnit):
     def _do_crash(self, message, eventtime):
         """Handle a detected tool crash — disable detection and error."""
         self._crash_active = False
+        self.printer.get_reactor().update_timer(
+            self._crash_event_timer, self.printer.get_reactor().NEVER)
         if self._crash_watchdog_timer is not None:
             self.printer.get_reactor().unregister_timer(self._crash_watchdog_timer)
             self._crash_watchdog_timer = None
@@ -0,0 +1,257 @@
+# Indexed in-place rewriting of Klipper config options
+#
+# This file may be distributed under the terms of the GNU GPLv3 license.
+#
+# Used by AFC_functions.ConfigRewrite / write_auto_variables and by
+# AFC_PLR to persist calibration results. The .cfg files under the added roots
+# are parsed once into a (section, key) -> (file, line span) index; later calls
+# only re-parse files whose size or mtime changed. Writes edit the cached lines
+# and replace the file atomically, and several writes can be grouped into one
+# batch so every touched file is written once.
+#
+# Not a config section: AFC_functions owns the shared instance
+# (``afc.function.config_index``).
+
+from __future__ import annotations
+import os
+import re
+import tempfile
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+_SECTION_RE = re.compile(r"^\s*\[\s*([^\]]*?)\s*\]")
+# Options start in column 0; indented lines continue the previous value
+_OPTION_RE = re.compile(r"^([^\s#;\[][^:=]*?)\s*[:=]")
+# Inline comments need whitespace before the prefix (as in configparser), so
+# values such as colors ("#ff0000" after the delimiter) are left alone
+_COMMENT_RE = re.compile(r"\s[#;]")
+
+
+class _CfgFile:
+    """Cached lines and option spans of one config file."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.signature = None
+        self.lines: List[str] = []
+        self.sections: Dict[str, int] = {}   # section -> line after its last option
+        self.options: Dict[Tuple[str, str], Tuple[int, int]] = {}
+
+    def load(self):
+        with open(self.path) as f:
+            self.lines = f.readlines()
+        self.signature = _signature(self.path)
+        self.parse()
+
+    def parse(self):
+        """Rebuild the option index from the cached lines."""
+        self.sections = {}
+        self.options = {}
+        section = None
+        last = None
+        for i, line in enumerate(self.lines):
+            if last is not None:
+                if line.strip() and line[0] in " \t":
+                    # Continuation of a multi-line value
+                    self.options[last] = (self.options[last][0], i + 1)
+                    self.sections[section] = i + 1
+                    continue
+                last = None
+            m = _SECTION_RE.match(line)
+            if m is not None:
+                section = m.group(1)
+                self.sections.setdefault(section, i + 1)
+                continue
+            if section is None:
+                continue
+            m = _OPTION_RE.match(line)
+            if m is not None:
+                key = (section, m.group(1).strip().lower())
+                if key not in self.options:
+                    self.options[key] = (i, i + 1)
+                    last = key
+                self.sections[section] = i + 1
+
+
+def _signature(path: str):
+    st = os.stat(path)
+    return (st.st_mtime_ns, st.st_size)
+
+
+def format_option(key: str, value, old_line: str = "") -> str:
+    """Return ``key: value`` keeping any inline comment of ``old_line`` at its
+    original column.
+    """
+    line = f"{key}: {value}"
+    m = _COMMENT_RE.search(old_line.rstrip("\n"))
+    if m is None:
+        return line + "\n"
+    comment = old_line[m.start() + 1:].rstrip("\n")
+    return line.ljust(m.start()) + " " + comment + "\n"
+
+
+class ConfigIndex:
+    """(section, key) index over the .cfg files below a set of directories."""
+
+    def __init__(self, logger=None):
+        self.logger = logger
+        self._roots: List[Tuple[str, bool]] = []
+        self._files: Dict[str, _CfgFile] = {}
+        self._batch_depth = 0
+        self._dirty = set()
+
+    def add_root(self, path, recursive: bool = False):
+        """Index the .cfg files in ``path`` (and its subdirectories when
+        ``recursive``). Adding a root twice is a no-op.
+        """
+        root = (os.path.abspath(str(path)), recursive)
+        if root not in self._roots:
+            self._roots.append(root)
+
+    def _cfg_paths(self) -> List[str]:
+        paths = []
+        for root, recursive in self._roots:
+            if not os.path.isdir(root):
+                continue
+            walker = os.walk(root) if recursive else [
+                (root, [], os.listdir(root))]
+            for dirpath, dirs, names in walker:
+                dirs.sort()
+                for name in sorted(names):
+                    fpath = os.path.join(dirpath, name)
+                    if (name.endswith(".cfg") and fpath not in paths
+                            and os.path.isfile(fpath)):
+                        paths.append(fpath)
+        return paths
+
+    def refresh(self):
+        """Re-parse new or changed files and forget deleted ones."""
+        files = {}
+        for fpath in self._cfg_paths():
+            cf = self._files.get(fpath)
+            try:
+                if cf is None:
+                    cf = _CfgFile(fpath)
+                    cf.load()
+                elif fpath not in self._dirty and cf.signature != _signature(fpath):
+                    cf.load()
+            except OSError:
+                continue
+            files[fpath] = cf
+        self._files = files
+
+    def find(self, section: str, key: str,
+             within: Optional[str] = None) -> Optional[Tuple[str, int, int]]:
+        """Return ``(path, first line, end line)`` of an option, or None.
+
+        :param within: Only consider files directly inside this directory.
+        """
+        if not self._batch_depth:
+            self.refresh()
+        wanted = (section.strip(), key.lower())
+        if within is not None:
+            within = os.path.abspath(str(within))
+        for fpath, cf in self._files.items():
+            if within is not None and os.path.dirname(fpath) != within:
+                continue
+            span = cf.options.get(wanted)
+            if span is not None:
+                return (fpath,) + span
+        return None
+
+    def set_value(self, section: str, key: str, value,
+                  within: Optional[str] = None) -> Optional[str]:
+        """Rewrite an existing option in place.
+
+        :return: Path of the file written, or None if the option was not found.
+        """
+        found = self.find(section, key, within)
+        if found is None:
+            return None
+        fpath, start, end = found
+        cf = self._files[fpath]
+        cf.lines[start:end] = [format_option(key, value, cf.lines[start])]
+        cf.parse()
+        self._mark_dirty(fpath)
+        return fpath
+
+    def add_value(self, path, section: str, key: str, value,
+                  header: str = "") -> str:
+        """Add an option to ``path``, creating the section (and the file,
+        starting with ``header``) when missing. An existing option is
+        rewritten instead.
+        """
+        fpath = os.path.abspath(str(path))
+        if not self._batch_depth:
+            self.refresh()
+        cf = self._files.get(fpath)
+        if cf is None:
+            cf = self._files[fpath] = _CfgFile(fpath)
+            if os.path.exists(fpath):
+                cf.load()
+            else:
+                cf.lines = [header] if header else []
+        span = cf.options.get((section.strip(), key.lower()))
+        if span is not None:
+            cf.lines[span[0]:span[1]] = [format_option(key, value,
+                                                       cf.lines[span[0]])]
+        elif section in cf.sections:
+            cf.lines.insert(cf.sections[section], f"{key} : {value}\n")
+        else:
+            if cf.lines and cf.lines[-1].strip():
+                cf.lines.append("\n")
+            if cf.lines and not cf.lines[-1].endswith("\n"):
+                cf.lines[-1] += "\n"
+            cf.lines.extend([f"[{section}]\n", f"{key} : {value}\n"])
+        cf.parse()
+        self._mark_dirty(fpath)
+        return fpath
+
+    @contextmanager
+    def batch(self):
+        """Group writes: each touched file is written once, atomically, when
+        the outermost batch exits.
+        """
+        if not self._batch_depth:
+            self.refresh()
+        self._batch_depth += 1
+        try:
+            yield self
+        finally:
+            self._batch_depth -= 1
+            if not self._batch_depth:
+                self.flush()
+
+    def _mark_dirty(self, fpath: str):
+        self._dirty.add(fpath)
+        if not self._batch_depth:
+            self.flush()
+
+    def flush(self):
+        """Write every modified file."""
+        for fpath in sorted(self._dirty):
+            cf = self._files.get(fpath)
+            if cf is not None:
+                self._write(cf)
+        self._dirty.clear()
+
+    def _write(self, cf: _CfgFile):
+        # Replace the file a symlinked include points to, not the link
+        path = os.path.realpath(cf.path)
+        fd, tmp = tempfile.mkstemp(prefix=".cfg-", dir=os.path.dirname(path))
+        try:
+            with os.fdopen(fd, "w") as f:
+                f.writelines(cf.lines)
+            if os.path.exists(path):
+                os.chmod(tmp, os.stat(path).st_mode & 0o7777)
+            else:
+                os.chmod(tmp, 0o644)
+            os.replace(tmp, path)
+        except OSError as e:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+            if self.logger is not None:
+                self.logger.error(f"Unable to write {cf.path}: {e}")
+            self._files.pop(cf.path, None)   # re-read on the next refresh
+            raise
+        cf.signature = _signature(cf.path)
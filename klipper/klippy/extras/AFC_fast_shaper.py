@@ -1,4 +1,6 @@
 # Fast input shaper calibration using narrow frequency band around current settings
+from . import resonance_tester, shaper_calibrate
+
 class AFCFastShaper:
     def __init__(self, config):
         self.printer = config.get_printer()
@@ -9,6 +11,10 @@ class AFCFastShaper:
         self.gcode.register_command(
             'FAST_SHAPER_CALIBRATE', self.cmd_FAST_SHAPER_CALIBRATE,
             desc="Run narrow-band shaper calibration around current frequencies")
+        self.gcode.register_command(
+            'FAST_SHAPER_CALIBRATE_TOOLS',
+            self.cmd_FAST_SHAPER_CALIBRATE_TOOLS,
+            desc="Run narrow-band shaper calibration for every tool")
 
     def _get_shaper_params_from_tool(self):
         """Read shaper params from the active AFC_extruder's tool params."""
@@ -35,17 +41,10 @@ class AFCFastShaper:
             'y': (float(freq_y), str(type_y)),
         }
 
-    def cmd_FAST_SHAPER_CALIBRATE(self, gcmd):
-        input_shaper = self.printer.lookup_object('input_shaper', None)
-        if input_shaper is None:
-            raise gcmd.error(
-                "[input_shaper] not found. "
-                "Add [input_shaper] to your config first.")
-
-        delta = gcmd.get_float('DELTA_FREQ', self.delta_freq, minval=5.0)
-
+    def _get_freq_ranges(self, gcmd, input_shaper, delta):
+        """Return (axis, shaper_type, freq_start, freq_end) per axis."""
         tool_params = self._get_shaper_params_from_tool()
-
+        ranges = []
         for axis_idx, axis_name in enumerate(['x', 'y']):
             shaper = input_shaper.shapers[axis_idx]
             current_freq = shaper.params.shaper_freq
@@ -65,7 +64,24 @@ class AFCFastShaper:
             freq_end = current_freq + abs(delta)
             if freq_end > self.max_freq:
                 freq_end = self.max_freq
+            ranges.append((axis_name, shaper_type, freq_start, freq_end))
+        return ranges
 
+    def _get_input_shaper(self, gcmd):
+        input_shaper = self.printer.lookup_object('input_shaper', None)
+        if input_shaper is None:
+            raise gcmd.error(
+                "[input_shaper] not found. "
+                "Add [input_shaper] to your config first.")
+        return input_shaper
+
+    def cmd_FAST_SHAPER_CALIBRATE(self, gcmd):
+        input_shaper = self._get_input_shaper(gcmd)
+
+        delta = gcmd.get_float('DELTA_FREQ', self.delta_freq, minval=5.0)
+
+        for axis_name, shaper_type, freq_start, freq_end in \
+                self._get_freq_ranges(gcmd, input_shaper, delta):
             gcmd.respond_info(
                 "FAST_SHAPER_CALIBRATE: axis=%s type=%s freq_range=%.1f-%.1f"
                 % (axis_name.upper(), shaper_type, freq_start, freq_end))
@@ -75,5 +91,124 @@ class AFCFastShaper:
                        % (axis_name, shaper_type, freq_start, freq_end))
             self.gcode.run_script_from_command(command)
 
+    def _get_tools(self, gcmd):
+        """Return the (toolchanger, tool) pairs to calibrate, in order."""
+        tools = []
+        for _, toolchanger in self.printer.lookup_objects('AFC_Toolchanger'):
+            for tool_number in sorted(toolchanger.tools):
+                tools.append((toolchanger, toolchanger.tools[tool_number]))
+        selected = gcmd.get('TOOLS', None)
+        if selected is not None:
+            try:
+                numbers = [int(t.strip().lstrip('Tt'))
+                           for t in selected.split(',') if t.strip()]
+            except ValueError:
+                raise gcmd.error("Invalid TOOLS parameter '%s'" % selected)
+            by_number = dict((tool.tool_number, (tc, tool))
+                             for tc, tool in tools)
+            missing = [n for n in numbers if n not in by_number]
+            if missing:
+                raise gcmd.error("TOOLS: T%d not found" % missing[0])
+            tools = [by_number[n] for n in numbers]
+        if not tools:
+            raise gcmd.error("No toolchanger tools to calibrate")
+        return tools
+
+    def _get_chips(self, gcmd, tester, tool):
+        if tool.resonance_chip:
+            return tester._parse_chips(tool.resonance_chip)
+        chips = [chip for chip_axis, chip in tester.accel_chips
+                 if 'x' in chip_axis or 'y' in chip_axis]
+        if not chips:
+            raise gcmd.error("No resonance_chip configured for %s" % tool.name)
+        return chips
+
+    def _measure_axis(self, gcmd, tester, chips, axis_name,
+                      freq_start, freq_end):
+        """Excite one axis over a band and return the accelerometer clients."""
+        toolhead = self.printer.lookup_object('toolhead')
+        test_gcmd = self.gcode.create_gcode_command(
+            "FAST_SHAPER_CALIBRATE_TOOLS", "FAST_SHAPER_CALIBRATE_TOOLS",
+            {'FREQ_START': '%.3f' % freq_start, 'FREQ_END': '%.3f' % freq_end})
+        tester.generator.prepare_test(test_gcmd, is_z=False)
+        toolhead.wait_moves()
+        toolhead.dwell(0.500)
+        aclients = [(chip.start_internal_client(), chip.name)
+                    for chip in chips]
+        tester.executor.run_test(tester.generator.gen_test(),
+                                 resonance_tester.TestAxis(axis_name), gcmd)
+        for aclient, chip_name in aclients:
+            aclient.finish_measurements()
+        for aclient, chip_name in aclients:
+            if not aclient.has_valid_samples():
+                raise gcmd.error(
+                    "accelerometer '%s' measured no data" % (chip_name,))
+        return [aclient for aclient, chip_name in aclients]
+
+    def _finish_job(self, gcmd, toolchanger, tool, axis_name, job, pool):
+        best_shaper, all_shapers, messages, calc_time = pool.wait(job)
+        for msg in messages:
+            gcmd.respond_info("%s: %s" % (tool.name, msg))
+        gcmd.respond_info(
+            "%s: shaper_type_%s = %s, shaper_freq_%s = %.1f Hz"
+            % (tool.name, axis_name, best_shaper.name,
+               axis_name, best_shaper.freq))
+        toolchanger.set_tool_shaper(tool, axis_name, best_shaper.name,
+                                    round(float(best_shaper.freq), 1))
+        return calc_time
+
+    def cmd_FAST_SHAPER_CALIBRATE_TOOLS(self, gcmd):
+        """Calibrate every tool, analysing each tool in the background
+        while the next one is picked up and excited.
+        """
+        input_shaper = self._get_input_shaper(gcmd)
+        tester = self.printer.lookup_object('resonance_tester', None)
+        if tester is None:
+            raise gcmd.error("[resonance_tester] not found")
+        delta = gcmd.get_float('DELTA_FREQ', self.delta_freq, minval=5.0)
+        max_smoothing = gcmd.get_float(
+            'MAX_SMOOTHING', tester.max_smoothing, minval=0.05)
+        tools = self._get_tools(gcmd)
+
+        reactor = self.printer.get_reactor()
+        toolhead = self.printer.lookup_object('toolhead')
+        pool = shaper_calibrate.ShaperCalibrate(self.printer).get_worker_pool()
+        start_time = reactor.monotonic()
+        pending = []
+        calc_time = 0.
+        for toolchanger, tool in tools:
+            gcmd.respond_info(
+                "FAST_SHAPER_CALIBRATE_TOOLS: calibrating %s" % (tool.name,))
+            toolchanger.select_tool(gcmd, tool, tool.t_command_restore_axis)
+            chips = self._get_chips(gcmd, tester, tool)
+            ranges = self._get_freq_ranges(gcmd, input_shaper, delta)
+            if tester.probe_points:
+                toolhead.manual_move(tester.probe_points[0], tester.move_speed)
+            scv = toolhead.get_status(
+                reactor.monotonic())['square_corner_velocity']
+            for axis_name, shaper_type, freq_start, freq_end in ranges:
+                aclients = self._measure_axis(gcmd, tester, chips, axis_name,
+                                              freq_start, freq_end)
+                job = pool.submit_calibration(
+                    'resonances_%s_%s' % (tool.name, axis_name), aclients,
+                    max_smoothing=max_smoothing, scv=scv,
+                    max_freq=tester._get_max_calibration_freq())
+                pending.append((toolchanger, tool, axis_name, job))
+            # Report results that are already available
+            while pending and pool.is_done(pending[0][3]):
+                calc_time += self._finish_job(gcmd, *pending.pop(0),
+                                              pool=pool)
+        measure_time = reactor.monotonic() - start_time
+        for item in pending:
+            calc_time += self._finish_job(gcmd, *item, pool=pool)
+        # Keep the results across restarts
+        for toolchanger, tool in tools:
+            toolchanger.save_tool_shapers(tool)
+        total_time = reactor.monotonic() - start_time
+        gcmd.respond_info(
+            "FAST_SHAPER_CALIBRATE_TOOLS: calibrated %d tools in %.1fs "
+            "(%.1fs measuring + %.1fs analysis if run serially)"
+            % (len(tools), total_time, measure_time, calc_time))
+
 def load_config(config):
     return AFCFastShaper(config)
@@ -21,6 +21,7 @@ import re
 from typing import TYPE_CHECKING, Optional, Dict, Tuple
 
 from extras.AFC import State
+from extras.AFC_spoolman import lookup_spoolman_service
 
 if TYPE_CHECKING:
     from extras.AFC_lane import AFCLane
@@ -59,15 +60,36 @@ class AFCFlowK:
         self._load_all_spoolman_k()
 
     def _load_all_spoolman_k(self):
-        """At startup, load K from Spoolman for all lanes with spoolman_flow_sync."""
+        """At startup, load K from Spoolman for all lanes with spoolman_flow_sync.
+
+        The spools of every such lane are read with one bulk query.
+        """
         if self.afc.moonraker is None:
             return
+        lanes = {}
         for lane in self.afc.lanes.values():
             if self._get_lane_k(lane) is not None:
                 continue
             if not self._spoolman_flow_sync_enabled(lane):
                 continue
-            k = self._read_flow_k_from_spoolman(lane)
+            try:
+                spool_id = int(getattr(lane, 'spool_id', None) or 0)
+            except (TypeError, ValueError):
+                continue
+            if spool_id:
+                lanes[lane.name] = (lane, spool_id)
+        if not lanes:
+            return
+        try:
+            spools = lookup_spoolman_service(self.afc.moonraker).get_spools(
+                spool_id for _lane, spool_id in lanes.values())
+        except Exception as e:
+            if self.logger:
+                self.logger.error(
+                    "AFC flow K: failed to read spools from Spoolman: %s" % e)
+            return
+        for lane, spool_id in lanes.values():
+            k = self._k_from_spool(lane, spool_id, spools.get(spool_id))
             if k is not None:
                 self._set_lane_k(lane, k)
 
@@ -229,16 +251,9 @@ class AFCFlowK:
         if self.afc.moonraker is None:
             return None
         try:
-            spool = self.afc.moonraker.get_spool(int(spool_id))
-            if spool is None:
-                return None
-            comment = spool.get("comment") or ""
-            k = self._parse_k_from_comment(comment)
-            if k is not None and self.logger:
-                self.logger.info(
-                    "AFC flow K: read K=%.6f from Spoolman spool %s for %s"
-                    % (k, spool_id, lane.name))
-            return k
+            spool = lookup_spoolman_service(self.afc.moonraker).get_spool(
+                int(spool_id))
+            return self._k_from_spool(lane, spool_id, spool)
         except Exception as e:
             if self.logger:
                 self.logger.error(
@@ -246,6 +261,17 @@ class AFCFlowK:
                     % (spool_id, e))
         return None
 
+    def _k_from_spool(self, lane, spool_id, spool) -> Optional[float]:
+        if spool is None:
+            return None
+        comment = spool.get("comment") or ""
+        k = self._parse_k_from_comment(comment)
+        if k is not None and self.logger:
+            self.logger.info(
+                "AFC flow K: read K=%.6f from Spoolman spool %s for %s"
+                % (k, spool_id, lane.name))
+        return k
+
     @staticmethod
     def _parse_k_from_comment(comment: str) -> Optional[float]:
         m = _K_PATTERN.search(comment)
@@ -0,0 +1,259 @@
+# USB barcode / QR spool scanner read directly by klippy
+#
+# This file may be distributed under the terms of the GNU GPLv3 license.
+#
+# Replaces afc-spool-scan/usb-qr-scanner-read.sh. The scanner is a USB HID
+# keyboard: its evdev device is opened non-blocking and registered with the
+# reactor, key events are decoded through a keycode table, and each scanned
+# line that carries a Spoolman spool id runs SET_NEXT_SPOOL_ID in-process (no
+# evtest/curl processes, no Moonraker round trip). The device is reopened when
+# the scanner is unplugged and plugged back in.
+#
+# ── Configuration ───────────────────────────────────────────────────
+#   [AFC_spool_scanner]
+#   device: /dev/input/by-id/usb-<scanner>-event-kbd
+#   # spoolman_prefix: web+spoolman:s-  # QR payload prefix before the id
+#   # grab: True                        # keep scans out of the console
+#   # hotplug_interval: 2.0             # seconds between reopen attempts
+#
+# SPOOL_SCANNER_REPLAY FILE=<path> feeds a recorded event file (e.g. from
+# ``cat /dev/input/eventN > scan.bin``) through the same decoder.
+
+from __future__ import annotations
+import errno
+import fcntl
+import logging
+import os
+import re
+import struct
+from typing import Optional
+
+# struct input_event: struct timeval (two native longs), u16 type, u16 code,
+# s32 value
+INPUT_EVENT = struct.Struct("llHHi")
+EV_KEY = 0x01
+KEY_RELEASE, KEY_PRESS, KEY_REPEAT = 0, 1, 2
+KEY_ENTER, KEY_KPENTER = 28, 96
+KEY_LEFTSHIFT, KEY_RIGHTSHIFT = 42, 54
+EVIOCGRAB = 0x40044590
+
+# Linux keycode -> (unshifted, shifted) character for a US keyboard layout
+KEYCODES = {
+    2: ("1", "!"), 3: ("2", "@"), 4: ("3", "#"), 5: ("4", "$"),
+    6: ("5", "%"), 7: ("6", "^"), 8: ("7", "&"), 9: ("8", "*"),
+    10: ("9", "("), 11: ("0", ")"), 12: ("-", "_"), 13: ("=", "+"),
+    16: ("q", "Q"), 17: ("w", "W"), 18: ("e", "E"), 19: ("r", "R"),
+    20: ("t", "T"), 21: ("y", "Y"), 22: ("u", "U"), 23: ("i", "I"),
+    24: ("o", "O"), 25: ("p", "P"), 26: ("[", "{"), 27: ("]", "}"),
+    30: ("a", "A"), 31: ("s", "S"), 32: ("d", "D"), 33: ("f", "F"),
+    34: ("g", "G"), 35: ("h", "H"), 36: ("j", "J"), 37: ("k", "K"),
+    38: ("l", "L"), 39: (";", ":"), 40: ("'", '"'), 41: ("`", "~"),
+    43: ("\\", "|"), 44: ("z", "Z"), 45: ("x", "X"), 46: ("c", "C"),
+    47: ("v", "V"), 48: ("b", "B"), 49: ("n", "N"), 50: ("m", "M"),
+    51: (",", "<"), 52: (".", ">"), 53: ("/", "?"), 55: ("*", "*"),
+    57: (" ", " "), 71: ("7", "7"), 72: ("8", "8"), 73: ("9", "9"),
+    74: ("-", "-"), 75: ("4", "4"), 76: ("5", "5"), 77: ("6", "6"),
+    78: ("+", "+"), 79: ("1", "1"), 80: ("2", "2"), 81: ("3", "3"),
+    82: ("0", "0"), 83: (".", "."), 98: ("/", "/"),
+}
+
+_URL_SPOOL_ID = re.compile(r"/spool/show/(\d+)")
+
+
+class ScanDecoder:
+    """Turn raw evdev input_event bytes into scanned lines.
+
+    Partial events are kept until the rest arrives, so any read size works.
+    """
+
+    def __init__(self):
+        self._pending = b""
+        self._chars = []
+        self._shift = False
+
+    def feed(self, data: bytes) -> list:
+        """Decode ``data`` and return the lines completed by it."""
+        data = self._pending + data
+        size = INPUT_EVENT.size
+        end = len(data) - len(data) % size
+        self._pending = data[end:]
+        lines = []
+        for _sec, _usec, ev_type, code, value in INPUT_EVENT.iter_unpack(
+                data[:end]):
+            if ev_type != EV_KEY:
+                continue
+            if code in (KEY_LEFTSHIFT, KEY_RIGHTSHIFT):
+                self._shift = value != KEY_RELEASE
+            elif value != KEY_PRESS:
+                continue
+            elif code in (KEY_ENTER, KEY_KPENTER):
+                lines.append("".join(self._chars))
+                self._chars = []
+            elif code in KEYCODES:
+                self._chars.append(KEYCODES[code][self._shift])
+        return lines
+
+    def reset(self):
+        self._pending = b""
+        self._chars = []
+        self._shift = False
+
+
+def parse_spool_id(line: str, prefix: str) -> Optional[int]:
+    """Spoolman spool id from a scanned line, or None.
+
+    Accepts the ``web+spoolman:s-<id>`` QR payload and Spoolman spool URLs
+    (``http://host:7912/spool/show/<id>``).
+    """
+    line = line.strip()
+    if prefix and line.startswith(prefix):
+        value = line[len(prefix):]
+    elif line.startswith("http"):
+        match = _URL_SPOOL_ID.search(line)
+        value = match.group(1) if match else ""
+    else:
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        return None
+
+
+class AFCSpoolScanner:
+    """Read a USB HID barcode/QR scanner and stage the scanned spool."""
+
+    def __init__(self, config):
+        self.printer = config.get_printer()
+        self.reactor = self.printer.get_reactor()
+        self.gcode = self.printer.lookup_object('gcode')
+        self.logger = logging.getLogger('AFC_spool_scanner')
+        self.device: str = config.get('device')
+        self.prefix: str = config.get('spoolman_prefix', 'web+spoolman:s-')
+        self.grab: bool = config.getboolean('grab', True)
+        self.hotplug_interval: float = config.getfloat(
+            'hotplug_interval', 2., above=0.)
+        self.decoder = ScanDecoder()
+        self._fd: Optional[int] = None
+        self._fd_handle = None
+        self._open_timer = self.reactor.register_timer(self._open_device)
+        self.last_code = ""
+        self.last_spool_id: Optional[int] = None
+        self.scan_count = 0
+
+        self.printer.register_event_handler('klippy:ready', self._handle_ready)
+        self.printer.register_event_handler('klippy:disconnect',
+                                            self._close_device)
+        self.gcode.register_command(
+            'SPOOL_SCANNER_REPLAY', self.cmd_SPOOL_SCANNER_REPLAY,
+            desc=self.cmd_SPOOL_SCANNER_REPLAY_help)
+
+    def _handle_ready(self):
+        afc = self.printer.lookup_object('AFC', None)
+        if afc is not None:
+            self.logger = afc.logger
+        self.reactor.update_timer(self._open_timer, self.reactor.NOW)
+
+    # ── Device handling ─────────────────────────────────────────────
+
+    def _open_device(self, eventtime):
+        """Timer: (re)open the scanner; retried until it is plugged in."""
+        try:
+            fd = os.open(self.device, os.O_RDONLY | os.O_NONBLOCK)
+        except OSError:
+            return eventtime + self.hotplug_interval
+        if self.grab:
+            try:
+                fcntl.ioctl(fd, EVIOCGRAB, 1)
+            except OSError as e:
+                self.logger.debug(f"Spool scanner: grab failed: {e}")
+        self._fd = fd
+        self._fd_handle = self.reactor.register_fd(fd, self._handle_read)
+        self.decoder.reset()
+        self.logger.info(f"Spool scanner: connected {self.device}")
+        return self.reactor.NEVER
+
+    def _close_device(self):
+        if self._fd_handle is not None:
+            self.reactor.unregister_fd(self._fd_handle)
+            self._fd_handle = None
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def _handle_read(self, eventtime):
+        data = b""
+        while True:
+            try:
+                chunk = os.read(self._fd, 4096)
+            except OSError as e:
+                if e.errno == errno.EAGAIN:
+                    break
+                chunk = b""
+            if not chunk:
+                # Unplugged (ENODEV) - wait for the scanner to come back
+                self.logger.info(
+                    f"Spool scanner: {self.device} disconnected")
+                self._close_device()
+                self.reactor.update_timer(
+                    self._open_timer, eventtime + self.hotplug_interval)
+                break
+            data += chunk
+        for line in self.decoder.feed(data):
+            self._handle_line(line)
+
+    # ── Scans ───────────────────────────────────────────────────────
+
+    def _handle_line(self, line: str):
+        self.last_code = line
+        spool_id = parse_spool_id(line, self.prefix)
+        if spool_id is None:
+            self.logger.debug(f"Spool scanner: ignoring scan '{line}'")
+            return
+        self.last_spool_id = spool_id
+        self.scan_count += 1
+        self.logger.info(f"Spool scanner: scanned spool {spool_id}")
+        # Run from a reactor callback so the command gets the gcode mutex
+        self.reactor.register_callback(
+            lambda e: self._set_next_spool(spool_id))
+
+    def _set_next_spool(self, spool_id: int):
+        try:
+            self.gcode.run_script(f"SET_NEXT_SPOOL_ID SPOOL_ID={spool_id}")
+        except self.printer.command_error as e:
+            self.logger.error(
+                f"Spool scanner: SET_NEXT_SPOOL_ID {spool_id} failed: {e}")
+
+    cmd_SPOOL_SCANNER_REPLAY_help = "Decode a recorded scanner event file"
+    def cmd_SPOOL_SCANNER_REPLAY(self, gcmd):
+        """Feed a recorded evdev event file through the scanner decoder.
+
+        Each decoded line is handled exactly like a live scan.
+
+        Usage
+        -----
+        `SPOOL_SCANNER_REPLAY FILE=<path>`
+        """
+        path = os.path.expanduser(gcmd.get('FILE'))
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except OSError as e:
+            raise gcmd.error(f"Unable to read '{path}': {e}")
+        decoder = ScanDecoder()
+        lines = decoder.feed(data)
+        for line in lines:
+            self._handle_line(line)
+        gcmd.respond_info(
+            f"Spool scanner: replayed {len(lines)} scan(s) from {path}")
+
+    def get_status(self, eventtime=None):
+        return {
+            'connected': self._fd is not None,
+            'last_code': self.last_code,
+            'last_spool_id': self.last_spool_id,
+            'scan_count': self.scan_count,
+        }
+
+
+def load_config(config):
+    return AFCSpoolScanner(config)
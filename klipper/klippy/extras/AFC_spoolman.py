@@ -0,0 +1,286 @@
+# Shared Spoolman access for AFC modules
+#
+# This file may be distributed under the terms of the GNU GPLv3 license.
+#
+# One SpoolmanService per Moonraker host serves every AFC module that talks to
+# Spoolman (RFID sync, flow K, autocal, the AFC spool module). It keeps a
+# persistent keep-alive connection to Moonraker's Spoolman proxy, caches GET
+# results for a short TTL, drops cached entries when a write touches the same
+# kind of record, and lets concurrent lookups of the same path share one fetch.
+#
+# Not a config section: import lookup_spoolman_service() and pass it the live
+# AFC moonraker object.
+
+from __future__ import annotations
+import copy
+import http.client
+import json
+import select
+import socket
+import threading
+import time
+from typing import Dict, Iterable, Optional
+from urllib.parse import urlsplit
+
+# Seconds a cached GET result is served without asking Spoolman again. Spool
+# weights are also updated by Moonraker directly, so keep this short.
+SPOOLMAN_CACHE_TTL = 10.
+# Records embedded in other records: a write to the key invalidates the values.
+_EMBEDDED_IN = {
+    "vendor": ("filament", "spool"),
+    "filament": ("spool",),
+}
+_PROXY_PATH = "/server/spoolman/proxy"
+
+_SERVICES: Dict[str, "SpoolmanService"] = {}
+_services_lock = threading.Lock()
+
+
+def _resource(path: str) -> str:
+    """Record kind of a Spoolman API path: '/v1/spool/3?x' -> 'spool'."""
+    parts = path.split("?", 1)[0].strip("/").split("/")
+    return parts[1] if len(parts) > 1 else parts[0]
+
+
+class _PendingFetch:
+    """A GET in flight; later callers for the same path wait on it."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+
+
+class SpoolmanService:
+    """Cached, coalescing client for Moonraker's Spoolman proxy.
+
+    :param host: Moonraker base url, e.g. ``http://localhost:7125``.
+    :param logger: AFC logger used for request errors.
+    :param ttl: Seconds a GET result stays valid in the cache.
+    """
+
+    def __init__(self, host: str, logger, ttl: float = SPOOLMAN_CACHE_TTL):
+        self.host = host
+        self.logger = logger
+        self.ttl = ttl
+        url = urlsplit(host)
+        self._conn_class = (http.client.HTTPSConnection
+                            if url.scheme == "https"
+                            else http.client.HTTPConnection)
+        self._conn_host = url.hostname or "localhost"
+        self._conn_port = url.port
+        self._conn: Optional[http.client.HTTPConnection] = None
+        self._conn_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._cache: Dict[str, tuple] = {}  # path -> (fetch time, result)
+        self._pending: Dict[str, _PendingFetch] = {}
+        self.stats = {"requests": 0, "hits": 0, "coalesced": 0,
+                      "reconnects": 0}
+
+    # ── Transport ─────────────────────────────────────────────────
+
+    def _connect(self):
+        if self._conn is not None and self._conn.sock is not None:
+            # A kept-alive socket that is readable between requests has been
+            # closed by Moonraker; reconnect before sending anything on it
+            try:
+                stale = select.select([self._conn.sock], [], [], 0)[0]
+            except (OSError, ValueError):
+                stale = True
+            if stale:
+                self._close()
+        if self._conn is None:
+            self._conn = self._conn_class(
+                self._conn_host, self._conn_port, timeout=10.)
+        return self._conn
+
+    def _close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def _post_proxy(self, method: str, path: str, body=None,
+                    print_error: bool = True):
+        """Send one request through the proxy over the kept-alive connection.
+
+        A request that fails on a reused connection is sent again on a new
+        one, unless it timed out or a non-GET request had already been
+        written (Spoolman may have acted on it).
+        """
+        log = self.logger.error if print_error else self.logger.debug
+        payload = {"request_method": method, "path": path}
+        if body is not None:
+            payload["body"] = body
+        data = json.dumps(payload).encode("utf-8")
+        headers = {"Content-Type": "application/json",
+                   "Connection": "keep-alive"}
+        with self._conn_lock:
+            self.stats["requests"] += 1
+            for attempt in (0, 1):
+                prev_conn = self._conn
+                reused = sent = False
+                try:
+                    conn = self._connect()
+                    reused = conn is prev_conn and conn.sock is not None
+                    conn.request("POST", _PROXY_PATH, data, headers)
+                    sent = True
+                    resp = conn.getresponse()
+                    raw = resp.read()
+                except (http.client.HTTPException, OSError) as e:
+                    self._close()
+                    if (attempt == 0 and reused
+                            and not isinstance(e, socket.timeout)
+                            and (method == "GET" or not sent)):
+                        self.stats["reconnects"] += 1
+                        continue
+                    log(f"Spoolman {method} {path} failed: {e}")
+                    return None
+                break
+            if resp.will_close:
+                self._close()
+        if not 200 <= resp.status < 300:
+            log(f"Spoolman {method} {path} failed: "
+                f"{resp.status} {resp.reason}")
+            return None
+        try:
+            return json.loads(raw)["result"]
+        except (ValueError, KeyError, TypeError):
+            log(f"Spoolman {method} {path}: invalid response")
+            return None
+
+    # ── Cache ─────────────────────────────────────────────────────
+
+    def _cached(self, path: str, max_age: float):
+        entry = self._cache.get(path)
+        if entry is not None and time.monotonic() - entry[0] <= max_age:
+            return entry
+        return None
+
+    def invalidate(self, path: Optional[str] = None):
+        """Drop cached results for the record kind of ``path`` (and the
+        records embedding it), or everything when ``path`` is None.
+        """
+        with self._lock:
+            if path is None:
+                self._cache.clear()
+                return
+            kinds = (_resource(path),) + _EMBEDDED_IN.get(_resource(path), ())
+            for key in [k for k in self._cache if _resource(k) in kinds]:
+                del self._cache[key]
+
+    def request(self, method: str, path: str, body=None,
+                print_error: bool = True, max_age: Optional[float] = None):
+        """Issue a Spoolman API call via Moonraker's proxy.
+
+        GET results are served from the cache when younger than ``max_age``
+        (default: the service TTL; 0 always fetches). A GET already in flight
+        for the same path is shared instead of sent again. Any other method
+        invalidates the cached records of the kind it writes.
+
+        :param method: HTTP method (e.g. 'GET', 'POST', 'PATCH').
+        :param path: Spoolman API path (e.g. '/v1/spool/3').
+        :param body: Optional JSON-serialisable request body.
+        :param print_error: Whether to log a failed request as an error.
+        :param max_age: Oldest cached GET result, in seconds, to accept.
+        :return: Parsed result (a private copy), or None on failure.
+        """
+        if method != "GET":
+            result = self._post_proxy(method, path, body, print_error)
+            self.invalidate(path)
+            return result
+        if max_age is None:
+            max_age = self.ttl
+        with self._lock:
+            entry = self._cached(path, max_age)
+            if entry is not None:
+                self.stats["hits"] += 1
+                return copy.deepcopy(entry[1])
+            pending = self._pending.get(path)
+            owner = pending is None
+            if owner:
+                pending = self._pending[path] = _PendingFetch()
+            else:
+                self.stats["coalesced"] += 1
+        if not owner:
+            pending.done.wait()
+            return copy.deepcopy(pending.result)
+        try:
+            fetch_time = time.monotonic()
+            result = self._post_proxy("GET", path, body, print_error)
+            pending.result = result
+            with self._lock:
+                if result is not None:
+                    self._cache[path] = (fetch_time, result)
+        finally:
+            with self._lock:
+                del self._pending[path]
+            pending.done.set()
+        return copy.deepcopy(result)
+
+    # ── Records ───────────────────────────────────────────────────
+
+    def get_spool(self, spool_id, max_age: Optional[float] = None):
+        """Return a spool dict, or None if Spoolman has no such spool."""
+        spool = self.request("GET", f"/v1/spool/{spool_id}",
+                             print_error=False, max_age=max_age)
+        if spool is None:
+            self.logger.info(f"SpoolID: {spool_id} not found")
+        return spool
+
+    def get_spools(self, spool_ids: Iterable) -> dict:
+        """Return ``{spool id: spool dict}`` for several spools at once.
+
+        Spools not in the cache are read with one listing of all spools (the
+        Spoolman API has no filter on spool id), which also refreshes their
+        individual cache entries. A single missing spool is fetched directly.
+
+        :param spool_ids: Spoolman spool ids (ints or numeric strings).
+        :return dict: Found spools keyed by int id; unknown ids are omitted.
+        """
+        found = {}
+        missing = []
+        with self._lock:
+            for sid in set(int(s) for s in spool_ids):
+                entry = self._cached(f"/v1/spool/{sid}", self.ttl)
+                if entry is not None:
+                    self.stats["hits"] += 1
+                    found[sid] = copy.deepcopy(entry[1])
+                else:
+                    missing.append(sid)
+        if len(missing) == 1:
+            spool = self.get_spool(missing[0])
+            if spool is not None:
+                found[missing[0]] = spool
+        elif missing:
+            fetch_time = time.monotonic()
+            spools = self.request("GET", "/v1/spool?allow_archived=true",
+                                  print_error=False)
+            with self._lock:
+                for spool in spools or ():
+                    if not isinstance(spool, dict):
+                        continue
+                    sid = spool.get("id")
+                    self._cache[f"/v1/spool/{sid}"] = (fetch_time, spool)
+                    if sid in missing:
+                        found[sid] = copy.deepcopy(spool)
+        return found
+
+
+def lookup_spoolman_service(moonraker) -> SpoolmanService:
+    """Return the shared SpoolmanService for an AFC moonraker object.
+
+    The first call also routes the moonraker class's get_spool() through the
+    service, so modules that still call ``afc.moonraker.get_spool`` (the AFC
+    spool module) share its connection and cache.
+    """
+    with _services_lock:
+        service = _SERVICES.get(moonraker.host)
+        if service is None:
+            service = _SERVICES[moonraker.host] = SpoolmanService(
+                moonraker.host, moonraker.logger)
+        cls = type(moonraker)
+        if not getattr(cls, "_afc_spoolman_patched", False):
+            def get_spool(self, id):
+                return lookup_spoolman_service(self).get_spool(id)
+            cls.get_spool = get_spool
+            cls._afc_spoolman_patched = True
+    return service
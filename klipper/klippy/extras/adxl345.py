@@ -3,7 +3,7 @@
 # Copyright (C) 2020-2023  Kevin O'Connor <kevin@koconnor.net>
 #
 # This file may be distributed under the terms of the GNU GPLv3 license.
-import logging, time, collections, multiprocessing, os
+import logging, time, collections, multiprocessing, os, tempfile
 from . import bus, bulk_sensor
 
 # ADXL345 registers
@@ -29,6 +29,9 @@ SCALE_Z  = 0.003906 * FREEFALL_ACCEL # 1 / 256 (at 3.3V) mg/LSB
 
 Accel_Measurement = collections.namedtuple(
     'Accel_Measurement', ('time', 'accel_x', 'accel_y', 'accel_z'))
+# Layout of a sample in numpy array batches
+ACCEL_DTYPE = [('time', 'f8'), ('accel_x', 'f8'), ('accel_y', 'f8'),
+               ('accel_z', 'f8')]
 
 # Helper class to obtain measurements
 class AccelQueryHelper:
@@ -39,24 +42,55 @@ class AccelQueryHelper:
         self.request_start_time = self.request_end_time = print_time
         self.msgs = []
         self.samples = []
+        self.stream = None
+        self.stream_ranges = []
+    def stream_to_file(self, filename=None):
+        # Write batches to a capture file as they arrive instead of
+        # keeping them in memory
+        if filename is None:
+            fd, filename = tempfile.mkstemp(prefix="accel-", suffix=".capture")
+            os.close(fd)
+        self.stream = bulk_sensor.CaptureFileWriter(
+            filename, Accel_Measurement._fields)
+    def discard_stream(self):
+        # Remove the capture file (once no longer needed)
+        if self.stream is None:
+            return
+        self.stream.close()
+        try:
+            os.unlink(self.stream.filename)
+        except OSError:
+            pass
+    def get_stream_reader(self):
+        if self.stream is None:
+            return None
+        return bulk_sensor.CaptureFileReader(
+            self.stream.filename, self.request_start_time,
+            self.request_end_time)
     def finish_measurements(self):
         toolhead = self.printer.lookup_object('toolhead')
         self.request_end_time = toolhead.get_last_move_time()
         toolhead.wait_moves()
         self.is_finished = True
+        if self.stream is not None:
+            self.stream.close()
     def handle_batch(self, msg):
         if self.is_finished:
             return False
+        if self.stream is not None:
+            data = msg['data']
+            self.stream_ranges.append((data[0][0], data[-1][0]))
+            self.stream.write_rows(data)
+            return True
         if len(self.msgs) >= 10000:
             # Avoid filling up memory with too many samples
             return False
         self.msgs.append(msg)
         return True
     def has_valid_samples(self):
-        for msg in self.msgs:
-            data = msg['data']
-            first_sample_time = data[0][0]
-            last_sample_time = data[-1][0]
+        ranges = self.stream_ranges or [(msg['data'][0][0], msg['data'][-1][0])
+                                        for msg in self.msgs]
+        for first_sample_time, last_sample_time in ranges:
             if (first_sample_time > self.request_end_time
                     or last_sample_time < self.request_start_time):
                 continue
@@ -70,13 +104,19 @@ class AccelQueryHelper:
             return True
         return False
     def get_samples(self):
+        if self.stream is not None and not self.samples:
+            self.samples = [Accel_Measurement(*row)
+                            for row in self.get_stream_reader().iter_rows()]
         if not self.msgs:
             return self.samples
         total = sum([len(m['data']) for m in self.msgs])
         count = 0
         self.samples = samples = [None] * total
         for msg in self.msgs:
-            for samp_time, x, y, z in msg['data']:
+            data = msg['data']
+            if not isinstance(data, list):
+                data = data.tolist()
+            for samp_time, x, y, z in data:
                 if samp_time < self.request_start_time:
                     continue
                 if samp_time > self.request_end_time:
@@ -85,7 +125,35 @@ class AccelQueryHelper:
                 count += 1
         del samples[count:]
         return self.samples
+    def get_samples_array(self):
+        # Return the samples as an (N, 4) numpy array of floats
+        np = bulk_sensor.lookup_numpy()
+        if self.stream is not None:
+            parts = list(self.get_stream_reader().iter_chunks())
+            if not parts:
+                return np.zeros((0, 4))
+            return np.concatenate(parts)
+        parts = []
+        for msg in self.msgs:
+            data = msg['data']
+            if isinstance(data, list):
+                data = np.array(data, dtype=np.float64).reshape(-1, 4)
+            else:
+                data = data.view(np.float64).reshape(-1, 4)
+            parts.append(data)
+        if not parts:
+            return np.array(self.samples, dtype=np.float64).reshape(-1, 4)
+        data = np.concatenate(parts)
+        times = data[:, 0]
+        return data[(times >= self.request_start_time)
+                    & (times <= self.request_end_time)]
     def write_to_file(self, filename):
+        reader = capture_file = None
+        if self.stream is not None:
+            # Open the capture file now so that the writing process can
+            # read it even if it is discarded in the meantime
+            reader = self.get_stream_reader()
+            capture_file = reader.open()
         def write_impl():
             try:
                 # Try to re-nice writing process
@@ -94,7 +162,10 @@ class AccelQueryHelper:
                 pass
             f = open(filename, "w")
             f.write("#time,accel_x,accel_y,accel_z\n")
-            samples = self.samples or self.get_samples()
+            if reader is not None:
+                samples = reader.iter_rows(capture_file)
+            else:
+                samples = self.samples or self.get_samples()
             for t, accel_x, accel_y, accel_z in samples:
                 f.write("%.6f,%.6f,%.6f,%.6f\n" % (
                     t, accel_x, accel_y, accel_z))
@@ -102,6 +173,8 @@ class AccelQueryHelper:
         write_proc = multiprocessing.Process(target=write_impl)
         write_proc.daemon = True
         write_proc.start()
+        if capture_file is not None:
+            capture_file.close()
 
 # Helper class for G-Code commands
 class AccelCommandHelper:
@@ -148,6 +221,8 @@ class AccelCommandHelper:
         if self.bg_client is None:
             # Start measurements
             self.bg_client = self.chip.start_internal_client()
+            # Measurements may run for a long time - keep them on disk
+            self.bg_client.stream_to_file()
             gcmd.respond_info("accelerometer measurements started")
             return
         # End measurements
@@ -163,6 +238,7 @@ class AccelCommandHelper:
         else:
             filename = "/tmp/%s-%s-%s.csv" % (self.base_name, self.name, name)
         bg_client.write_to_file(filename)
+        bg_client.discard_stream()
         gcmd.respond_info("Writing raw accelerometer data to %s file"
                           % (filename,))
     cmd_ACCELEROMETER_QUERY_help = "Query accelerometer for the current values"
@@ -224,7 +300,8 @@ class ADXL345:
         # Process messages in batches
         self.batch_bulk = bulk_sensor.BatchBulkHelper(
             self.printer, self._process_batch,
-            self._start_measurements, self._finish_measurements, BATCH_UPDATES)
+            self._start_measurements, self._finish_measurements, BATCH_UPDATES,
+            array_batch_cb=self._process_array_batch)
         self.name = config.get_name().split()[-1]
         hdr = ('time', 'x_acceleration', 'y_acceleration', 'z_acceleration')
         self.batch_bulk.add_mux_endpoint("adxl345/dump_adxl345", "sensor",
@@ -250,7 +327,7 @@ class ADXL345:
                         reg, val, stored_val))
     def start_internal_client(self):
         aqh = AccelQueryHelper(self.printer)
-        self.batch_bulk.add_client(aqh.handle_batch)
+        self.batch_bulk.add_client(aqh.handle_batch, use_arrays=True)
         return aqh
     # Measurement decoding
     def _convert_samples(self, samples):
@@ -271,6 +348,26 @@ class ADXL345:
             samples[count] = (round(ptime, 6), x, y, z)
             count += 1
         del samples[count:]
+    def _convert_samples_array(self, times, raw):
+        np = bulk_sensor.lookup_numpy()
+        (x_pos, x_scale), (y_pos, y_scale), (z_pos, z_scale) = self.axes_map
+        valid = (raw['f4'] & 0x80) == 0
+        count = int(np.count_nonzero(valid))
+        self.last_error_count += len(raw) - count
+        raw = raw[valid]
+        xlow, ylow, zlow, xzhigh, yzhigh = [raw['f%d' % (i,)].astype(np.int32)
+                                            for i in range(5)]
+        rx = (xlow | ((xzhigh & 0x1f) << 8)) - ((xzhigh & 0x10) << 9)
+        ry = (ylow | ((yzhigh & 0x1f) << 8)) - ((yzhigh & 0x10) << 9)
+        rz = ((zlow | ((xzhigh & 0xe0) << 3) | ((yzhigh & 0xe0) << 6))
+              - ((yzhigh & 0x40) << 7))
+        raw_xyz = (rx, ry, rz)
+        samples = np.empty(count, dtype=ACCEL_DTYPE)
+        samples['time'] = np.round(times[valid], 6)
+        samples['accel_x'] = np.round(raw_xyz[x_pos] * x_scale, 6)
+        samples['accel_y'] = np.round(raw_xyz[y_pos] * y_scale, 6)
+        samples['accel_z'] = np.round(raw_xyz[z_pos] * z_scale, 6)
+        return samples
     # Start, stop, and process message batches
     def _start_measurements(self):
         # In case of miswiring, testing ADXL345 device ID prevents treating
@@ -309,6 +406,15 @@ class ADXL345:
             return {}
         return {'data': samples, 'errors': self.last_error_count,
                 'overflows': self.ffreader.get_last_overflows()}
+    def _process_array_batch(self, eventtime):
+        times, raw = self.ffreader.pull_samples_array()
+        if times is None:
+            return {}
+        samples = self._convert_samples_array(times, raw)
+        if not len(samples):
+            return {}
+        return {'data': samples, 'errors': self.last_error_count,
+                'overflows': self.ffreader.get_last_overflows()}
 
 def load_config(config):
     return ADXL345(config)
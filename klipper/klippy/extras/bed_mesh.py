@@ -1258,6 +1258,8 @@ class MoveSplitter:
     def __init__(self, config, gcode):
         self.split_delta_z = config.getfloat(
             'split_delta_z', .025, minval=0.01)
+        # Moves are split at mesh cell boundaries rather than sampled, the
+        # option is still accepted so existing configs continue to load
         self.move_check_distance = config.getfloat(
             'move_check_distance', 5., minval=3.)
         self.z_mesh = None
@@ -1273,16 +1275,75 @@ class MoveSplitter:
         self.z_factor = factor
         self.z_offset = self._calc_z_offset(prev_pos)
         self.traverse_complete = False
-        self.distance_checked = 0.
         axes_d = [np - pp for np, pp in zip(self.next_pos, self.prev_pos)]
         self.total_move_length = math.sqrt(sum([d*d for d in axes_d[:3]]))
         self.axis_move = [not isclose(d, 0., abs_tol=1e-10) for d in axes_d]
+        self.splits = []
+        self.split_index = 0
+        if self.axis_move[0] or self.axis_move[1]:
+            # X and/or Y axis move, traverse if necessary
+            self._find_splits(axes_d[0], axes_d[1])
     def _calc_z_offset(self, pos):
         z = self.z_mesh.calc_z(pos[0], pos[1])
         offset = self.fade_offset
         return self.z_factor * (z - offset) + offset
-    def _set_next_move(self, distance_from_prev):
-        t = distance_from_prev / self.total_move_length
+    def _find_splits(self, dx, dy):
+        # The mesh is bilinear within each cell, so along the move the
+        # z adjustment is a quadratic between consecutive cell boundary
+        # crossings.  Collect the z adjustment at those crossings (and
+        # inside any span that bows out), then only split where a straight
+        # move would stray from them.  The sampling and the line fit each
+        # get half of split_delta_z, so together they stay within it.
+        mesh = self.z_mesh
+        x0, y0 = self.prev_pos[:2]
+        half_delta_z = .5 * self.split_delta_z
+        factor = self.z_factor
+        offset = self.fade_offset
+        mesh_x_dist = mesh.mesh_x_dist
+        mesh_y_dist = mesh.mesh_y_dist
+        points = []
+        span_start = 0.
+        for span_end in mesh.get_cell_crossings(x0, y0, dx, dy) + [1.]:
+            if span_end - span_start < 1e-9:
+                continue
+            t_mid = .5 * (span_start + span_end)
+            (a, b, c, d), cell_x, cell_y = mesh.get_cell(
+                x0 + dx * t_mid, y0 + dy * t_mid)
+            cell_x -= mesh.mesh_offsets[0]
+            cell_y -= mesh.mesh_offsets[1]
+            span = span_end - span_start
+            tx0 = (x0 - cell_x) / mesh_x_dist
+            ty0 = (y0 - cell_y) / mesh_y_dist
+            dtx = dx / mesh_x_dist
+            dty = dy / mesh_y_dist
+            # Deviation of the quadratic from its chord over the span
+            bow = abs(factor * d * dtx * dty) * span * span
+            count = max(1, int(math.ceil(math.sqrt(.25 * bow
+                                                   / half_delta_z))))
+            for i in range(1, count + 1):
+                t = span_start + span * i / count
+                tx = constrain(tx0 + dtx * t, 0., 1.)
+                ty = constrain(ty0 + dty * t, 0., 1.)
+                z = a + b * tx + (c + d * tx) * ty
+                points.append((t, factor * (z - offset) + offset))
+            span_start = span_end
+        # Greedily extend each straight segment while every point it
+        # passes stays within half_delta_z of it
+        t0, z0 = 0., self.z_offset
+        min_slope, max_slope = -float('inf'), float('inf')
+        prev = None
+        for t, z in points:
+            slope = (z - z0) / (t - t0)
+            if not min_slope <= slope <= max_slope:
+                self.splits.append(prev)
+                t0, z0 = prev
+                min_slope, max_slope = -float('inf'), float('inf')
+                slope = (z - z0) / (t - t0)
+            tolerance = half_delta_z / (t - t0)
+            min_slope = max(min_slope, slope - tolerance)
+            max_slope = min(max_slope, slope + tolerance)
+            prev = (t, z)
+    def _set_next_move(self, t):
         if t > 1. or t < 0.:
             raise self.gcode.error(
                 "bed_mesh: Slice distance is negative "
@@ -1293,18 +1354,13 @@ class MoveSplitter:
                     t, self.prev_pos[i], self.next_pos[i])
     def split(self):
         if not self.traverse_complete:
-            if self.axis_move[0] or self.axis_move[1]:
-                # X and/or Y axis move, traverse if necessary
-                while self.distance_checked + self.move_check_distance \
-                        < self.total_move_length:
-                    self.distance_checked += self.move_check_distance
-                    self._set_next_move(self.distance_checked)
-                    next_z = self._calc_z_offset(self.current_pos)
-                    if abs(next_z - self.z_offset) >= self.split_delta_z:
-                        self.z_offset = next_z
-                        newpos = list(self.current_pos)
-                        newpos[2] += self.z_offset
-                        return newpos
+            if self.split_index < len(self.splits):
+                t, self.z_offset = self.splits[self.split_index]
+                self.split_index += 1
+                self._set_next_move(t)
+                newpos = list(self.current_pos)
+                newpos[2] += self.z_offset
+                return newpos
             # end of move reached
             self.current_pos[:] = self.next_pos
             self.z_offset = self._calc_z_offset(self.current_pos)
@@ -1322,6 +1378,7 @@ class ZMesh:
     def __init__(self, params, name):
         self.profile_name = name or "adaptive-%X" % (id(self),)
         self.probed_matrix = self.mesh_matrix = None
+        self.cell_coeffs = None
         self.mesh_params = params
         self.mesh_offsets = [0., 0.]
         logging.debug('bed_mesh: probe/mesh parameters:')
@@ -1405,6 +1462,7 @@ class ZMesh:
     def build_mesh(self, z_matrix):
         self.probed_matrix = z_matrix
         self._sample(z_matrix)
+        self._build_cell_coeffs()
         self.print_mesh(logging.debug)
     def set_zero_reference(self, xpos, ypos):
         offset = self.calc_z(xpos, ypos)
@@ -1416,6 +1474,7 @@ class ZMesh:
             for yidx in range(len(matrix)):
                 for xidx in range(len(matrix[yidx])):
                     matrix[yidx][xidx] -= offset
+        self._build_cell_coeffs()
     def set_mesh_offsets(self, offsets):
         for i, o in enumerate(offsets):
             if o is not None:
@@ -1425,16 +1484,63 @@ class ZMesh:
     def get_y_coordinate(self, index):
         return self.mesh_y_min + self.mesh_y_dist * index
     def calc_z(self, x, y):
-        if self.mesh_matrix is not None:
-            tbl = self.mesh_matrix
+        if self.cell_coeffs is not None:
             tx, xidx = self._get_linear_index(x + self.mesh_offsets[0], 0)
             ty, yidx = self._get_linear_index(y + self.mesh_offsets[1], 1)
-            z0 = lerp(tx, tbl[yidx][xidx], tbl[yidx][xidx+1])
-            z1 = lerp(tx, tbl[yidx+1][xidx], tbl[yidx+1][xidx+1])
-            return lerp(ty, z0, z1)
+            a, b, c, d = self.cell_coeffs[
+                yidx * (self.mesh_x_count - 1) + xidx]
+            return a + b * tx + (c + d * tx) * ty
         else:
             # No mesh table generated, no z-adjustment
             return 0.
+    def _build_cell_coeffs(self):
+        # Precompute the bilinear form of every mesh cell so that a lookup
+        # is z = a + b*tx + c*ty + d*tx*ty, with tx and ty in [0, 1]
+        tbl = self.mesh_matrix
+        coeffs = []
+        for yidx in range(self.mesh_y_count - 1):
+            row0 = tbl[yidx]
+            row1 = tbl[yidx + 1]
+            for xidx in range(self.mesh_x_count - 1):
+                z00, z10 = row0[xidx], row0[xidx + 1]
+                z01, z11 = row1[xidx], row1[xidx + 1]
+                coeffs.append((z00, z10 - z00, z01 - z00,
+                               z11 - z10 - z01 + z00))
+        self.cell_coeffs = coeffs
+    def get_cell(self, x, y):
+        # Return the bilinear coefficients of the cell containing the
+        # (offset adjusted) mesh position along with the cell origin
+        x += self.mesh_offsets[0]
+        y += self.mesh_offsets[1]
+        xidx = constrain(int(math.floor((x - self.mesh_x_min)
+                                        / self.mesh_x_dist)),
+                         0, self.mesh_x_count - 2)
+        yidx = constrain(int(math.floor((y - self.mesh_y_min)
+                                        / self.mesh_y_dist)),
+                         0, self.mesh_y_count - 2)
+        return (self.cell_coeffs[yidx * (self.mesh_x_count - 1) + xidx],
+                self.get_x_coordinate(xidx), self.get_y_coordinate(yidx))
+    def get_cell_crossings(self, x, y, dx, dy):
+        # Return the fractions of the move from (x, y) by (dx, dy) at which
+        # it crosses a mesh grid line, in ascending order
+        crossings = []
+        axes = ((x + self.mesh_offsets[0], dx, self.mesh_x_min,
+                 self.mesh_x_dist, self.mesh_x_count),
+                (y + self.mesh_offsets[1], dy, self.mesh_y_min,
+                 self.mesh_y_dist, self.mesh_y_count))
+        for start, delta, mesh_min, mesh_dist, mesh_cnt in axes:
+            if isclose(delta, 0., abs_tol=1e-10):
+                continue
+            lo = (min(start, start + delta) - mesh_min) / mesh_dist
+            hi = (max(start, start + delta) - mesh_min) / mesh_dist
+            first = max(int(math.floor(lo)) + 1, 0)
+            last = min(int(math.ceil(hi)) - 1, mesh_cnt - 1)
+            base = (mesh_min - start) / delta
+            step = mesh_dist / delta
+            crossings.extend([base + idx * step
+                              for idx in range(first, last + 1)])
+        crossings.sort()
+        return crossings
     def get_z_range(self):
         if self.mesh_matrix is not None:
             mesh_min = min([min(x) for x in self.mesh_matrix])
@@ -3,7 +3,7 @@
 # Copyright (C) 2020-2023  Kevin O'Connor <kevin@koconnor.net>
 #
 # This file may be distributed under the terms of the GNU GPLv3 license.
-import logging, threading, struct
+import logging, threading, struct, importlib, json, zlib
 
 # This "bulk sensor" module facilitates the processing of sensor chip
 # measurements that do not require the host to respond with low
@@ -16,15 +16,35 @@ import logging, threading, struct
 # bandwidth to/from the mcu, and reduces load on the host.  It also
 # makes it easier to export the raw measurements via the webhooks
 # system (aka API Server).
+#
+# Sensors may optionally provide an "array" batch callback that
+# decodes the measurements into numpy structured arrays instead of
+# lists of tuples.  Clients that register with use_arrays=True receive
+# those arrays (when numpy is available), while list based clients
+# continue to receive the traditional format.
 
 BATCH_INTERVAL = 0.500
 
+# Load numpy on demand - it is not required for normal operation
+def lookup_numpy():
+    try:
+        return importlib.import_module('numpy')
+    except ImportError:
+        return None
+
+# Convert an array batch message into the traditional list format
+def batch_to_list(msg):
+    res = dict(msg)
+    res['data'] = msg['data'].tolist()
+    return res
+
 # Helper to process accumulated messages in periodic batches
 class BatchBulkHelper:
     def __init__(self, printer, batch_cb, start_cb=None, stop_cb=None,
-                 batch_interval=BATCH_INTERVAL):
+                 batch_interval=BATCH_INTERVAL, array_batch_cb=None):
         self.printer = printer
         self.batch_cb = batch_cb
+        self.array_batch_cb = array_batch_cb
         if start_cb is None:
             start_cb = (lambda: None)
         self.start_cb = start_cb
@@ -35,6 +55,7 @@ class BatchBulkHelper:
         self.batch_interval = batch_interval
         self.batch_timer = None
         self.client_cbs = []
+        self.array_client_cbs = []
         self.webhooks_start_resp = {}
     # Periodic batch processing
     def _start(self):
@@ -47,6 +68,7 @@ class BatchBulkHelper:
             logging.exception("BatchBulkHelper start callback error")
             self.is_started = False
             del self.client_cbs[:]
+            del self.array_client_cbs[:]
             raise
         reactor = self.printer.get_reactor()
         systime = reactor.monotonic()
@@ -54,6 +76,7 @@ class BatchBulkHelper:
         self.batch_timer = reactor.register_timer(self._proc_batch, waketime)
     def _stop(self):
         del self.client_cbs[:]
+        del self.array_client_cbs[:]
         self.printer.get_reactor().unregister_timer(self.batch_timer)
         self.batch_timer = None
         if not self.is_started:
@@ -63,31 +86,52 @@ class BatchBulkHelper:
         except self.printer.command_error as e:
             logging.exception("BatchBulkHelper stop callback error")
             del self.client_cbs[:]
+            del self.array_client_cbs[:]
         self.is_started = False
         if self.client_cbs:
             # New client started while in process of stopping
             self._start()
     def _proc_batch(self, eventtime):
+        use_arrays = bool(self.array_client_cbs)
         try:
-            msg = self.batch_cb(eventtime)
+            if use_arrays:
+                array_msg = self.array_batch_cb(eventtime)
+            else:
+                msg = self.batch_cb(eventtime)
         except self.printer.command_error as e:
             logging.exception("BatchBulkHelper batch callback error")
             self._stop()
             return self.printer.get_reactor().NEVER
-        if not msg:
+        if use_arrays:
+            if not array_msg:
+                return eventtime + self.batch_interval
+            msg = None
+            if len(self.array_client_cbs) < len(self.client_cbs):
+                msg = batch_to_list(array_msg)
+        elif not msg:
             return eventtime + self.batch_interval
         for client_cb in list(self.client_cbs):
-            res = client_cb(msg)
+            if client_cb in self.array_client_cbs:
+                res = client_cb(array_msg)
+            else:
+                res = client_cb(msg)
             if not res:
                 # This client no longer needs updates - unregister it
                 self.client_cbs.remove(client_cb)
+                if client_cb in self.array_client_cbs:
+                    self.array_client_cbs.remove(client_cb)
                 if not self.client_cbs:
                     self._stop()
                     return self.printer.get_reactor().NEVER
         return eventtime + self.batch_interval
     # Client registration
-    def add_client(self, client_cb):
+    def add_client(self, client_cb, use_arrays=False):
+        # Clients asking for arrays must also accept the list format,
+        # which is used if the sensor (or host) does not support arrays
         self.client_cbs.append(client_cb)
+        if (use_arrays and self.array_batch_cb is not None
+                and lookup_numpy() is not None):
+            self.array_client_cbs.append(client_cb)
         self._start()
     # Webhooks registration
     def _add_api_client(self, web_request):
@@ -112,6 +156,112 @@ class BatchWebhooksClient:
         self.cconn.send(tmp)
         return True
 
+
+
+######################################################################
+# Capture files
+######################################################################
+
+# Long captures can be streamed to disk as the batches arrive instead
+# of being held in memory until the capture ends.  A capture file is a
+# small json header followed by zlib compressed chunks (one per batch)
+# of little-endian float64 rows.
+
+CAPTURE_FILE_MAGIC = b"KBULK1\n"
+CAPTURE_HEADER = struct.Struct("<I")
+CAPTURE_CHUNK = struct.Struct("<II")
+
+# Append measurement batches to a capture file
+class CaptureFileWriter:
+    def __init__(self, filename, columns, compress_level=1):
+        self.filename = filename
+        self.compress_level = compress_level
+        self.row_format = struct.Struct("<%dd" % (len(columns),))
+        header = json.dumps({'columns': list(columns)}).encode()
+        self.file = open(filename, "wb")
+        self.file.write(CAPTURE_FILE_MAGIC + CAPTURE_HEADER.pack(len(header))
+                        + header)
+        self.rows = 0
+    def write_rows(self, data):
+        # Data may be a list of tuples or a numpy array of float rows
+        if isinstance(data, list):
+            pack = self.row_format.pack
+            raw = b"".join([pack(*row) for row in data])
+        else:
+            np = lookup_numpy()
+            raw = np.ascontiguousarray(data).view(np.float64).astype(
+                "<f8", copy=False).tobytes()
+        rows = len(raw) // self.row_format.size
+        if not rows:
+            return
+        chunk = zlib.compress(raw, self.compress_level)
+        self.file.write(CAPTURE_CHUNK.pack(rows, len(chunk)) + chunk)
+        self.rows += rows
+    def handle_batch(self, msg):
+        self.write_rows(msg['data'])
+        return True
+    def close(self):
+        if not self.file.closed:
+            self.file.close()
+
+# Read a capture file one chunk at a time (optionally limited to rows
+# with a first column between start_time and end_time)
+class CaptureFileReader:
+    def __init__(self, filename, start_time=None, end_time=None):
+        self.filename = filename
+        self.start_time = start_time
+        self.end_time = end_time
+    def open(self):
+        return open(self.filename, "rb")
+    def _iter_raw_chunks(self, f=None):
+        # An already open file may be passed in (it is closed when done)
+        if f is None:
+            f = self.open()
+        with f:
+            if f.read(len(CAPTURE_FILE_MAGIC)) != CAPTURE_FILE_MAGIC:
+                raise IOError("'%s' is not a capture file" % (self.filename,))
+            hlen, = CAPTURE_HEADER.unpack(f.read(CAPTURE_HEADER.size))
+            columns = json.loads(f.read(hlen).decode())['columns']
+            while True:
+                data = f.read(CAPTURE_CHUNK.size)
+                if len(data) < CAPTURE_CHUNK.size:
+                    return
+                rows, size = CAPTURE_CHUNK.unpack(data)
+                data = f.read(size)
+                if len(data) < size:
+                    return
+                yield len(columns), rows, zlib.decompress(data)
+    def _in_range(self, t):
+        return ((self.start_time is None or t >= self.start_time)
+                and (self.end_time is None or t <= self.end_time))
+    def iter_rows(self, f=None):
+        # Yield every row as a tuple (does not require numpy)
+        for ncols, rows, raw in self._iter_raw_chunks(f):
+            for row in struct.iter_unpack("<%dd" % (ncols,), raw):
+                if self._in_range(row[0]):
+                    yield row
+    def iter_chunks(self, f=None):
+        # Yield each chunk as a (rows, columns) numpy array
+        np = lookup_numpy()
+        for ncols, rows, raw in self._iter_raw_chunks(f):
+            data = np.frombuffer(raw, dtype="<f8").astype(np.float64)
+            data = data.reshape(rows, ncols)
+            if self.start_time is not None or self.end_time is not None:
+                times = data[:, 0]
+                mask = np.ones(rows, dtype=bool)
+                if self.start_time is not None:
+                    mask &= times >= self.start_time
+                if self.end_time is not None:
+                    mask &= times <= self.end_time
+                data = data[mask]
+            if len(data):
+                yield data
+
+
+######################################################################
+# Bulk data reading
+######################################################################
+
 SENSOR_BULK_FMT = "sensor_bulk_data oid=%c sequence=%hu data=%*s"
 
 # Helper class to store incoming messages in a queue
@@ -208,6 +358,7 @@ class FixedFreqReader:
     def __init__(self, mcu, chip_clock_smooth, unpack_fmt):
         self.mcu = mcu
         self.clock_sync = ClockSyncRegression(mcu, chip_clock_smooth)
+        self.unpack_fmt = unpack_fmt
         unpack = struct.Struct(unpack_fmt)
         self.unpack_from = unpack.unpack_from
         self.bytes_per_sample = unpack.size
@@ -215,6 +366,7 @@ class FixedFreqReader:
         self.last_sequence = self.max_query_duration = 0
         self.last_overflows = 0
         self.bulk_queue = self.oid = self.query_status_cmd = None
+        self.raw_dtype = None
     def setup_query_command(self, msgformat, oid, cq):
         # Lookup sensor query command (that responds with sensor_bulk_status)
         self.oid = oid
@@ -297,3 +449,54 @@ class FixedFreqReader:
         self.clock_sync.set_last_chip_clock(seq * samples_per_block + i)
         del samples[count:]
         return samples
+    # Convert sensor_bulk_data responses into numpy arrays
+    def pull_samples_array(self):
+        # Returns (times, raw) where raw is a structured array with one
+        # field per entry in the unpack format (named f0, f1, ...)
+        np = lookup_numpy()
+        self._update_clock()
+        raw_samples = self.bulk_queue.pull_queue()
+        if not raw_samples:
+            return None, None
+        if self.raw_dtype is None:
+            self.raw_dtype = np.dtype(_struct_to_dtype(self.unpack_fmt))
+        last_sequence = self.last_sequence
+        time_base, chip_base, inv_freq = self.clock_sync.get_time_translation()
+        bytes_per_sample = self.bytes_per_sample
+        samples_per_block = self.samples_per_block
+        # Locate the first chip clock and sample count of each message
+        count = len(raw_samples)
+        msg_cdiff = np.empty(count, dtype=np.float64)
+        msg_counts = np.empty(count, dtype=np.int64)
+        for j, params in enumerate(raw_samples):
+            seq_diff = (params['sequence'] - last_sequence) & 0xffff
+            seq_diff -= (seq_diff & 0x8000) << 1
+            seq = last_sequence + seq_diff
+            msg_cdiff[j] = seq * samples_per_block - chip_base
+            msg_counts[j] = len(params['data']) // bytes_per_sample
+        total = int(msg_counts.sum())
+        # Decode all payloads at once into a preallocated array
+        data = bytearray(total * bytes_per_sample)
+        pos = 0
+        for params in raw_samples:
+            payload = params['data']
+            size = len(payload) - len(payload) % bytes_per_sample
+            data[pos:pos+size] = payload[:size]
+            pos += size
+        raw = np.frombuffer(data, dtype=self.raw_dtype)
+        # Calculate the time of every sample
+        msg_start = np.cumsum(msg_counts) - msg_counts
+        offsets = np.arange(total) - np.repeat(msg_start, msg_counts)
+        chip_clocks = np.repeat(msg_cdiff, msg_counts) + offsets
+        times = chip_clocks * inv_freq + time_base
+        self.clock_sync.set_last_chip_clock(
+            seq * samples_per_block + int(msg_counts[-1]) - 1)
+        return times, raw
+
+# Map a struct module format to the equivalent numpy dtype description
+def _struct_to_dtype(unpack_fmt):
+    byteorder = '='
+    if unpack_fmt[:1] in '<>!=@':
+        byteorder = {'!': '>', '@': '='}.get(unpack_fmt[0], unpack_fmt[0])
+        unpack_fmt = unpack_fmt[1:]
+    return [('f%d' % (i,), byteorder + c) for i, c in enumerate(unpack_fmt)]
@@ -8,6 +8,66 @@
 import logging
 import json
 
+# Spatial index of the EXCLUDE_OBJECT_DEFINE polygons, used to find the
+# object at a position when the file has no EXCLUDE_OBJECT_START markers
+class ObjectIndex:
+    def __init__(self, objects):
+        shapes = []
+        for obj in objects:
+            polygon = obj.get('polygon')
+            try:
+                pts = [(float(p[0]), float(p[1])) for p in polygon]
+            except (TypeError, ValueError, IndexError):
+                continue
+            if len(pts) < 3:
+                continue
+            xs = [p[0] for p in pts]
+            ys = [p[1] for p in pts]
+            bbox = (min(xs), min(ys), max(xs), max(ys))
+            shapes.append((obj['name'], bbox, pts))
+        self.shapes = shapes
+        self.grid = {}
+        self.last = None
+        if not shapes:
+            self.cell = 1.
+            return
+        # Cells about the size of an average object
+        size = sum(max(b[2] - b[0], b[3] - b[1]) for n, b, p in shapes)
+        self.cell = max(size / len(shapes), 1.)
+        for shape in shapes:
+            x0, y0, x1, y1 = self._cells(shape[1])
+            for cx in range(x0, x1 + 1):
+                for cy in range(y0, y1 + 1):
+                    self.grid.setdefault((cx, cy), []).append(shape)
+    def _cells(self, bbox):
+        cell = self.cell
+        return (int(bbox[0] // cell), int(bbox[1] // cell),
+                int(bbox[2] // cell), int(bbox[3] // cell))
+    def _contains(self, shape, x, y):
+        bx0, by0, bx1, by1 = shape[1]
+        if x < bx0 or x > bx1 or y < by0 or y > by1:
+            return False
+        pts = shape[2]
+        inside = False
+        px, py = pts[-1]
+        for qx, qy in pts:
+            if (qy > y) != (py > y) and \
+                x < (px - qx) * (y - qy) / (py - qy) + qx:
+                inside = not inside
+            px, py = qx, qy
+        return inside
+    def lookup(self, x, y):
+        # Consecutive moves are usually inside the same object
+        last = self.last
+        if last is not None and self._contains(last, x, y):
+            return last[0]
+        cell = self.cell
+        for shape in self.grid.get((int(x // cell), int(y // cell)), ()):
+            if self._contains(shape, x, y):
+                self.last = shape
+                return shape[0]
+        return None
+
 class ExcludeObject:
     def __init__(self, config):
         self.printer = config.get_printer()
@@ -50,6 +110,8 @@ class ExcludeObject:
             self.max_position_excluded = 0
             self.extruder_adj = 0
             self.initial_extrusion_moves = 5
+            self.offset_pending = False
+            self.extruder_offset_pending = False
             self.last_position = [0., 0., 0., 0.]
 
             self.get_position()
@@ -74,9 +136,15 @@ class ExcludeObject:
 
     def _reset_state(self):
         self.objects = []
-        self.excluded_objects = []
+        self._set_excluded_objects([])
         self.current_object = None
         self.in_excluded_region = False
+        self.object_index = None
+        self.markers_seen = False
+
+    def _set_excluded_objects(self, excluded_objects):
+        self.excluded_objects = excluded_objects
+        self.excluded_set = frozenset(excluded_objects)
 
     def _reset_file(self):
         self._reset_state()
@@ -140,20 +208,43 @@ class ExcludeObject:
         tx_pos = newpos[:]
         for i in range(len(newpos)):
             tx_pos[i] = newpos[i] - offset[i]
+        offsets = self.extrusion_offsets.values()
+        self.offset_pending = self.extruder_adj != 0 or any(
+            o[i] for o in offsets for i in range(len(o)) if i != 3)
+        self.extruder_offset_pending = any(o[3] for o in offsets)
         self.next_transform.move(tx_pos, speed)
 
+    def _passthrough_move(self, newpos, speed):
+        # Only extruder offsets (if any) are pending, so all _normal_move()
+        # would do is subtract that offset.  last_position_extruded is
+        # caught up when entering an excluded region.
+        if self.initial_extrusion_moves > 0 and \
+            self.last_position[3] != newpos[3]:
+            self.initial_extrusion_moves -= 1
+        self.last_position[:] = newpos
+        if newpos[3] > self.max_position_extruded:
+            self.max_position_extruded = newpos[3]
+        if self.extruder_offset_pending:
+            offset = self._get_extrusion_offsets(len(newpos))
+            if offset[3] != 0:
+                newpos = newpos[:]
+                newpos[3] -= offset[3]
+        self.next_transform.move(newpos, speed)
+
     def _ignore_move(self, newpos, speed):
         offset = self._get_extrusion_offsets(len(newpos))
         for i in range(len(newpos)):
             if i != 3:
                 offset[i] = newpos[i] - self.last_position_extruded[i]
         offset[3] = offset[3] + newpos[3] - self.last_position[3]
+        self.offset_pending = True
         self.last_position[:] = newpos
         self.last_position_excluded[:] = self.last_position
         self.max_position_excluded = max(self.max_position_excluded, newpos[3])
 
     def _move_into_excluded_region(self, newpos, speed):
         self.in_excluded_region = True
+        self.last_position_extruded[:] = self.last_position
         self._ignore_move(newpos, speed)
 
     def _move_from_excluded_region(self, newpos, speed):
@@ -168,7 +259,7 @@ class ExcludeObject:
 
     def _test_in_excluded_region(self):
         # Inside cancelled object
-        return self.current_object in self.excluded_objects \
+        return self.current_object in self.excluded_set \
             and self.initial_extrusion_moves == 0
 
     def get_status(self, eventtime=None):
@@ -179,7 +270,17 @@ class ExcludeObject:
         }
         return status
 
+    def _infer_current_object(self, newpos):
+        # Without START/END markers the object is the one the XY move ends in
+        if self.object_index is None:
+            self.object_index = ObjectIndex(self.objects)
+        self.current_object = self.object_index.lookup(newpos[0], newpos[1])
+
     def move(self, newpos, speed):
+        if not self.markers_seen and \
+            (newpos[0] != self.last_position[0] or \
+            newpos[1] != self.last_position[1]):
+            self._infer_current_object(newpos)
         move_in_excluded_region = self._test_in_excluded_region()
         self.last_speed = speed
 
@@ -191,8 +292,10 @@ class ExcludeObject:
         else:
             if self.in_excluded_region:
                 self._move_from_excluded_region(newpos, speed)
-            else:
+            elif self.offset_pending:
                 self._normal_move(newpos, speed)
+            else:
+                self._passthrough_move(newpos, speed)
 
     cmd_EXCLUDE_OBJECT_START_help = "Marks the beginning the current object" \
                                     " as labeled"
@@ -200,6 +303,7 @@ class ExcludeObject:
         name = gcmd.get('NAME').upper()
         if not any(obj["name"] == name for obj in self.objects):
             self._add_object_definition({"name": name})
+        self.markers_seen = True
         self.current_object = name
         self.was_excluded_at_start = self._test_in_excluded_region()
 
@@ -228,7 +332,7 @@ class ExcludeObject:
                 self._unexclude_object(name)
 
             else:
-                self.excluded_objects = []
+                self._set_excluded_objects([])
 
         elif name:
             if name.upper() not in self.excluded_objects:
@@ -275,19 +379,21 @@ class ExcludeObject:
     def _add_object_definition(self, definition):
         self.objects = sorted(self.objects + [definition],
                               key=lambda o: o["name"])
+        self.object_index = None
 
     def _exclude_object(self, name):
         self._register_transform()
         self.gcode.respond_info('Excluding object {}'.format(name.upper()))
         if name not in self.excluded_objects:
-            self.excluded_objects = sorted(self.excluded_objects + [name])
+            self._set_excluded_objects(
+                sorted(self.excluded_objects + [name]))
 
     def _unexclude_object(self, name):
         self.gcode.respond_info('Unexcluding object {}'.format(name.upper()))
         if name in self.excluded_objects:
             excluded_objects = list(self.excluded_objects)
             excluded_objects.remove(name)
-            self.excluded_objects = sorted(excluded_objects)
+            self._set_excluded_objects(sorted(excluded_objects))
 
     def _list_objects(self, gcmd):
         if gcmd.get('JSON', None) is not None:
@@ -8,7 +8,7 @@
 # This file may be distributed under the terms of the GNU GPLv3 license.
 import math
 
-# Coordinates created by this are converted into G1 commands.
+# Coordinates created by this are queued as a batch of G1 moves.
 #
 # supports XY, XZ & YZ planes with remaining axis as helical
 
@@ -144,7 +144,7 @@ class ArcSupport:
         linear_per_segment = linear_travel / segments
 
         asE = gcmd.get_float("E", None)
-        asF = gcmd.get_float("F", None)
+        asF = gcmd.get_float("F", None, above=0.)
 
         e_per_move = e_base = 0.
         if asE is not None:
@@ -152,6 +152,8 @@ class ArcSupport:
                 e_base = currentPos[3]
             e_per_move = (asE - e_base) / segments
 
+        coords = []
+        e_values = []
         for i in range(1, int(segments) + 1):
             dist_Helical = i * linear_per_segment
             c_theta = i * theta_per_segment
@@ -168,16 +170,15 @@ class ArcSupport:
 
             if i == segments:
                 c = targetPos
-            # Convert coords into G1 commands
-            g1_params = {'X': c[0], 'Y': c[1], 'Z': c[2]}
+            coords.append(c)
             if e_per_move:
-                g1_params['E'] = e_base + e_per_move
+                e_values.append(e_base + e_per_move)
                 if absolut_extrude:
                     e_base += e_per_move
-            if asF is not None:
-                g1_params['F'] = asF
-            g1_gcmd = self.gcode.create_gcode_command("G1", "G1", g1_params)
-            self.gcode_move.cmd_G1(g1_gcmd)
+            else:
+                e_values.append(None)
+        # Queue all segments as one batch of G1 moves
+        self.gcode_move.move_batch(coords, e_values, [asF] * len(coords))
 
 def load_config(config):
     return ArcSupport(config)
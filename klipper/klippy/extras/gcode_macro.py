@@ -5,17 +5,83 @@
 # This file may be distributed under the terms of the GNU GPLv3 license.
 import traceback, logging, ast, copy, json
 import jinja2
+from jinja2 import meta, nodes
 
 
 ######################################################################
 # Template handling
 ######################################################################
 
+# Copy-on-access views of get_status() results.  Each nested dict or
+# list is shallow copied only when a template first reaches it, so a
+# template can never modify the state of the object that reported it.
+def _wrap_status(val):
+    vtype = type(val)
+    if vtype is dict:
+        return StatusDict(val)
+    if vtype is list:
+        return StatusList(val)
+    return val
+
+class StatusDict(dict):
+    def __getitem__(self, key):
+        val = dict.__getitem__(self, key)
+        res = _wrap_status(val)
+        if res is not val:
+            dict.__setitem__(self, key, res)
+        return res
+    def get(self, key, default=None):
+        if key in self:
+            return self[key]
+        return default
+    def values(self):
+        return [self[key] for key in self]
+    def items(self):
+        return [(key, self[key]) for key in self]
+
+class StatusList(list):
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return StatusList(list.__getitem__(self, index))
+        val = list.__getitem__(self, index)
+        res = _wrap_status(val)
+        if res is not val:
+            list.__setitem__(self, index, res)
+        return res
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+# Raw get_status() results shared by the templates rendered within one
+# reactor tick.  The cache is dropped when the reactor next runs other
+# work and whenever template g-code runs, as either may change state.
+class StatusCache:
+    def __init__(self, printer):
+        self.reactor = printer.get_reactor()
+        self.status = {}
+        self.clear_pending = False
+    def get_status(self, name, obj, eventtime):
+        sts = self.status.get(name)
+        if sts is None:
+            with self.reactor.assert_no_pause():
+                sts = obj.get_status(eventtime)
+            self.status[name] = sts
+            if not self.clear_pending:
+                self.clear_pending = True
+                self.reactor.register_callback(self._handle_tick_end)
+        return sts
+    def _handle_tick_end(self, eventtime):
+        self.clear_pending = False
+        self.status.clear()
+    def invalidate(self):
+        self.status.clear()
+
 # Wrapper for access to printer object get_status() methods
 class GetStatusWrapper:
-    def __init__(self, printer, eventtime=None):
+    def __init__(self, printer, eventtime=None, status_cache=None):
         self.printer = printer
         self.eventtime = eventtime
+        self.status_cache = status_cache
         self.cache = {}
     def __getitem__(self, val):
         sval = str(val).strip()
@@ -27,9 +93,15 @@ class GetStatusWrapper:
         reactor = self.printer.get_reactor()
         if self.eventtime is None:
             self.eventtime = reactor.monotonic()
-        with reactor.assert_no_pause():
-            sts = po.get_status(self.eventtime)
-        self.cache[sval] = res = copy.deepcopy(sts)
+        if self.status_cache is not None:
+            sts = self.status_cache.get_status(sval, po, self.eventtime)
+        else:
+            with reactor.assert_no_pause():
+                sts = po.get_status(self.eventtime)
+        res = _wrap_status(sts)
+        if res is sts:
+            res = copy.deepcopy(sts)
+        self.cache[sval] = res
         return res
     def __contains__(self, val):
         try:
@@ -42,6 +114,83 @@ class GetStatusWrapper:
             if self.__contains__(name):
                 yield name
 
+# Find the context values a template reads.  Returns a sorted tuple of
+# access paths (the context name followed by the constant attribute and
+# item keys used on it, or the access path of the context value used as
+# a key), or None if the template uses the context in a way that can not
+# be tracked (computed printer object lookups or calls to actions).
+def find_context_reads(env, script):
+    tree = env.parse(script)
+    roots = meta.find_undeclared_variables(tree)
+    paths = set()
+    def get_path(node):
+        keys = []
+        while True:
+            if isinstance(node, nodes.Getattr):
+                keys.append(node.attr)
+            elif isinstance(node, nodes.Getitem):
+                if isinstance(node.arg, nodes.Const):
+                    keys.append(node.arg.value)
+                else:
+                    key = get_path(node.arg)
+                    if key is None:
+                        # Only the part of the lookup up to here is known
+                        visit(node.arg)
+                        keys = []
+                    else:
+                        paths.add(key)
+                        keys.append(key)
+            else:
+                break
+            node = node.node
+        if (isinstance(node, nodes.Name) and node.ctx == 'load'
+                and node.name in roots):
+            return (node.name,) + tuple(reversed(keys))
+        if not isinstance(node, nodes.Name):
+            visit(node)
+        return None
+    def visit(node):
+        if isinstance(node, (nodes.Getattr, nodes.Getitem, nodes.Name)):
+            path = get_path(node)
+            if path is not None:
+                paths.add(path)
+            return
+        for child in node.iter_child_nodes():
+            visit(child)
+    visit(tree)
+    for path in paths:
+        if path[0].startswith('action_') or path == ('printer',):
+            return None
+    return tuple(sorted(paths, key=repr))
+
+# Resolve an access path against a template context.  Returns the value
+# and whether the full path was found (otherwise the last value reached).
+def _lookup_context_path(context, path):
+    val = context.get(path[0], None)
+    for key in path[1:]:
+        if type(key) is tuple:
+            key, found = _lookup_context_path(context, key)
+            if not found:
+                return val, False
+        try:
+            val = val[key]
+        except (KeyError, IndexError, TypeError):
+            return val, False
+    return val, True
+
+# Values whose repr() reflects their full contents
+_KEYABLE_TYPES = (dict, list, tuple, str, int, float, bool, type(None))
+
+_UNKEYABLE = object()
+
+def _get_context_key(context, path):
+    val, found = _lookup_context_path(context, path)
+    if found or isinstance(val, _KEYABLE_TYPES):
+        # A partial path here reads an attribute or method of the value
+        # (eg, .items() or .startswith()), so key on the whole value
+        return repr(val)
+    return _UNKEYABLE
+
 # Wrapper around a Jinja2 template
 class TemplateWrapper:
     def __init__(self, printer, env, name, script):
@@ -50,6 +199,10 @@ class TemplateWrapper:
         self.gcode = self.printer.lookup_object('gcode')
         gcode_macro = self.printer.lookup_object('gcode_macro')
         self.create_template_context = gcode_macro.create_template_context
+        self.status_cache = gcode_macro.status_cache
+        self.env = env
+        self.script = script
+        self.context_reads = self.context_reads_found = None
         try:
             self.template = env.from_string(script)
         except jinja2.exceptions.TemplateSyntaxError as e:
@@ -73,14 +226,33 @@ class TemplateWrapper:
                 self.name, traceback.format_exception_only(type(e), e)[-1])
             logging.exception(msg)
             raise self.gcode.error(msg)
+    def get_context_reads(self):
+        if not self.context_reads_found:
+            self.context_reads = find_context_reads(self.env, self.script)
+            self.context_reads_found = True
+        return self.context_reads
+    def get_context_key(self, context):
+        # Return a hashable key of every context value the template reads,
+        # or None if the template output can not be keyed on its context
+        reads = self.get_context_reads()
+        if reads is None:
+            return None
+        key = tuple([_get_context_key(context, path) for path in reads])
+        if _UNKEYABLE in key:
+            return None
+        return key
     def run_gcode_from_command(self, context=None):
-        self.gcode.run_script_from_command(self.render(context))
+        self.run_script_from_command(self.render(context))
+    def run_script_from_command(self, script):
+        self.status_cache.invalidate()
+        self.gcode.run_script_from_command(script)
 
 # Main gcode macro template tracking
 class PrinterGCodeMacro:
     def __init__(self, config):
         self.printer = config.get_printer()
         self.env = jinja2.Environment('{%', '%}', '{', '}')
+        self.status_cache = StatusCache(self.printer)
     def load_template(self, config, option, default=None):
         name = "%s:%s" % (config.get_name(), option)
         if default is None:
@@ -105,7 +277,8 @@ class PrinterGCodeMacro:
         return ""
     def create_template_context(self, eventtime=None):
         return {
-            'printer': GetStatusWrapper(self.printer, eventtime),
+            'printer': GetStatusWrapper(self.printer, eventtime,
+                                        self.status_cache),
             'action_emergency_stop': self._action_emergency_stop,
             'action_respond_info': self._action_respond_info,
             'action_raise_error': self._action_raise_error,
@@ -189,6 +362,8 @@ class GCodeMacro:
     def cmd(self, gcmd):
         if self.in_script:
             raise gcmd.error("Macro %s called recursively" % (self.alias,))
+        # Commands run before this macro may have changed printer state
+        self.template.status_cache.invalidate()
         kwparams = dict(self.variables)
         kwparams.update(self.template.create_template_context())
         kwparams['params'] = gcmd.get_command_parameters()
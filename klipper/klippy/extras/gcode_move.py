@@ -159,6 +159,33 @@ class GCodeMove:
             raise gcmd.error("Unable to parse move '%s'"
                              % (gcmd.get_commandline(),))
         self.move_with_transform(self.last_position, self.speed)
+    def move_batch(self, coords, e_values=None, speeds=None):
+        # Queue a series of absolute XYZ moves (as if issued by G1)
+        # without building and parsing a g-code command for each one.
+        # The optional per-move e_values and speeds (mm/min) may contain
+        # None to leave that value unchanged for a move.
+        if e_values is None:
+            e_values = [None] * len(coords)
+        if speeds is None:
+            speeds = [None] * len(coords)
+        base_position = self.base_position
+        last_position = self.last_position
+        for coord, e, gcode_speed in zip(coords, e_values, speeds):
+            last_position[0] = coord[0] + base_position[0]
+            last_position[1] = coord[1] + base_position[1]
+            last_position[2] = coord[2] + base_position[2]
+            if e is not None:
+                e *= self.extrude_factor
+                if self.absolute_extrude:
+                    last_position[3] = e + base_position[3]
+                else:
+                    last_position[3] += e
+            if gcode_speed is not None:
+                if gcode_speed <= 0.:
+                    raise self.printer.command_error(
+                        "Invalid speed in move batch: %s" % (gcode_speed,))
+                self.speed = gcode_speed * self.speed_factor
+            self.move_with_transform(last_position, self.speed)
     # G-Code coordinate manipulation
     def cmd_G20(self, gcmd):
         # Set units to inches
@@ -0,0 +1,373 @@
+# Export operational metrics in Prometheus text format
+#
+# This file may be distributed under the terms of the GNU GPLv3 license.
+import logging, os, socket, bisect, errno
+
+# This module gathers host health data (mcu link statistics, canbus
+# errors, reactor timer lag, heater state, filament changer events)
+# into a single registry and serves it on a local unix socket.  Most
+# values are only read from their owners when the socket is queried,
+# so the registry adds essentially no load to the reactor between
+# queries.  The socket accepts either a plain connection (the metrics
+# are written and the socket closed) or an http GET request, for
+# example: curl --unix-socket /tmp/klippy_metrics http://localhost/
+
+DEFAULT_BUCKETS = (.005, .01, .025, .05, .1, .25, .5, 1., 2.5, 5., 10.,
+                   30., 60., 120., 300.)
+TIMER_LAG_BUCKETS = (.0005, .001, .002, .005, .01, .025, .05, .1, .25, .5,
+                     1.)
+
+def _format_labels(labelnames, labels, extra=()):
+    items = list(zip(labelnames, labels)) + list(extra)
+    if not items:
+        return ""
+    return "{%s}" % (",".join(['%s="%s"' % (
+        name, str(value).replace('\\', '\\\\').replace('"', '\\"')
+        .replace('\n', '\\n')) for name, value in items]),)
+
+def _format_value(value):
+    if value == float('inf'):
+        return "+Inf"
+    return repr(float(value))
+
+class Counter:
+    kind = "counter"
+    def __init__(self, name, desc, labelnames=()):
+        self.name = name
+        self.desc = desc
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+    def inc(self, amount=1., labels=()):
+        self.values[labels] = self.values.get(labels, 0.) + amount
+    def set_total(self, value, labels=()):
+        # Mirror a counter that is maintained elsewhere
+        self.values[labels] = value
+    def render(self, out):
+        for labels, value in sorted(self.values.items()):
+            out.append("%s%s %s" % (self.name, _format_labels(
+                self.labelnames, labels), _format_value(value)))
+
+class Gauge(Counter):
+    kind = "gauge"
+    def set(self, value, labels=()):
+        self.values[labels] = value
+    def clear(self):
+        self.values.clear()
+
+class Histogram:
+    kind = "histogram"
+    def __init__(self, name, desc, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.desc = desc
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self.values = {}
+    def observe(self, value, labels=()):
+        data = self.values.get(labels)
+        if data is None:
+            # Per bucket counts, then the sum and count of observations
+            data = self.values[labels] = [0] * (len(self.buckets) + 1) + [0.]
+        data[bisect.bisect_left(self.buckets, value)] += 1
+        data[-1] += value
+    def render(self, out):
+        name = self.name
+        for labels, data in sorted(self.values.items()):
+            total = 0
+            for bound, count in zip(self.buckets + (float('inf'),), data):
+                total += count
+                out.append("%s_bucket%s %d" % (name, _format_labels(
+                    self.labelnames, labels,
+                    [('le', _format_value(bound))]), total))
+            label_str = _format_labels(self.labelnames, labels)
+            out.append("%s_sum%s %s" % (name, label_str,
+                                        _format_value(data[-1])))
+            out.append("%s_count%s %d" % (name, label_str, total))
+
+# Storage of all metrics
+class MetricsRegistry:
+    def __init__(self, printer):
+        self.printer = printer
+        self.metrics = {}
+        self.collectors = []
+    def _lookup(self, cls, name, desc, labelnames, **kw):
+        metric = self.metrics.get(name)
+        if metric is None:
+            metric = self.metrics[name] = cls(name, desc, labelnames, **kw)
+        elif not isinstance(metric, cls):
+            raise self.printer.config_error(
+                "Metric '%s' already registered as a %s"
+                % (name, metric.kind))
+        return metric
+    def counter(self, name, desc, labelnames=()):
+        return self._lookup(Counter, name, desc, labelnames)
+    def gauge(self, name, desc, labelnames=()):
+        return self._lookup(Gauge, name, desc, labelnames)
+    def histogram(self, name, desc, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._lookup(Histogram, name, desc, labelnames,
+                            buckets=buckets)
+    def register_collector(self, cb):
+        # The callback is invoked (with the eventtime) before rendering
+        # and may update metrics from the status of other objects
+        self.collectors.append(cb)
+    def render(self, eventtime):
+        for cb in self.collectors:
+            try:
+                cb(eventtime)
+            except Exception:
+                logging.exception("Metrics collector error")
+        out = []
+        for name, metric in sorted(self.metrics.items()):
+            if not metric.values:
+                continue
+            out.append("# HELP %s %s" % (name, metric.desc))
+            out.append("# TYPE %s %s" % (name, metric.kind))
+            metric.render(out)
+        out.append("")
+        return "\n".join(out)
+
+def lookup_metrics(printer):
+    registry = printer.lookup_object('metrics_registry', None)
+    if registry is None:
+        registry = MetricsRegistry(printer)
+        printer.add_object('metrics_registry', registry)
+    return registry
+
+# Mcu statistics (as reported in the "Stats" log lines)
+MCU_COUNTERS = {
+    'bytes_write': "Bytes sent to the mcu",
+    'bytes_read': "Bytes received from the mcu",
+    'bytes_retransmit': "Bytes retransmitted to the mcu",
+    'bytes_invalid': "Invalid bytes received from the mcu",
+}
+MCU_GAUGES = {
+    'srtt': "Smoothed round trip time to the mcu",
+    'rttvar': "Round trip time variance to the mcu",
+    'rto': "Retransmit timeout of the mcu link",
+    'ready_bytes': "Bytes ready to be sent to the mcu",
+    'upcoming_bytes': "Bytes queued for future transmission to the mcu",
+    'mcu_awake': "Fraction of time the mcu is busy",
+    'mcu_task_avg': "Average mcu task time",
+    'mcu_task_stddev': "Standard deviation of the mcu task time",
+}
+CANBUS_COUNTERS = {
+    'rx_error': "Canbus receive errors",
+    'tx_error': "Canbus transmit errors",
+    'tx_retries': "Canbus transmit retries",
+}
+
+# Connection from a metrics client
+class MetricsClient:
+    def __init__(self, server, sock):
+        self.server = server
+        self.reactor = server.reactor
+        self.sock = sock
+        self.request = b""
+        self.send_buffer = None
+        self.fd_handle = self.reactor.register_fd(
+            self.sock.fileno(), self._handle_read, self._handle_write)
+        self.reactor.set_fd_wake(self.fd_handle, True, False)
+        # Plain clients might not send anything
+        self.timer = self.reactor.register_timer(
+            self._handle_timeout, self.reactor.monotonic() + .1)
+    def _handle_timeout(self, eventtime):
+        self._respond(eventtime)
+        return self.reactor.NEVER
+    def _handle_read(self, eventtime):
+        try:
+            data = self.sock.recv(4096)
+        except socket.error as e:
+            if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                return
+            data = b""
+        self.request += data
+        if not data or b"\r\n\r\n" in self.request or b"\n\n" in self.request:
+            self._respond(eventtime)
+    def _respond(self, eventtime):
+        if self.send_buffer is not None:
+            return
+        self.reactor.update_timer(self.timer, self.reactor.NEVER)
+        body = self.server.registry.render(eventtime).encode()
+        if self.request.startswith(b"GET"):
+            header = ("HTTP/1.0 200 OK\r\n"
+                      "Content-Type: text/plain; version=0.0.4\r\n"
+                      "Content-Length: %d\r\n\r\n" % (len(body),))
+            body = header.encode() + body
+        self.send_buffer = body
+        self.reactor.set_fd_wake(self.fd_handle, False, True)
+        self._handle_write(eventtime)
+    def _handle_write(self, eventtime):
+        if not self.send_buffer:
+            if self.send_buffer is not None:
+                self.close()
+            return
+        try:
+            sent = self.sock.send(self.send_buffer)
+        except socket.error as e:
+            if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                return
+            self.close()
+            return
+        self.send_buffer = self.send_buffer[sent:]
+        if not self.send_buffer:
+            self.close()
+    def close(self):
+        if self.fd_handle is None:
+            return
+        self.reactor.unregister_fd(self.fd_handle)
+        self.reactor.unregister_timer(self.timer)
+        self.fd_handle = None
+        try:
+            self.sock.close()
+        except socket.error:
+            pass
+        self.server.clients.discard(self)
+
+class PrinterMetrics:
+    def __init__(self, config):
+        self.printer = config.get_printer()
+        self.reactor = self.printer.get_reactor()
+        self.registry = lookup_metrics(self.printer)
+        self.socket_path = config.get('socket_path', '/tmp/klippy_metrics')
+        self.lag_interval = config.getfloat('timer_lag_interval', .5,
+                                            above=0.)
+        self.sock = self.fd_handle = None
+        self.clients = set()
+        # Reactor timer lag
+        self.timer_lag = self.registry.histogram(
+            'klippy_timer_lag_seconds', "Lateness of reactor timers",
+            buckets=TIMER_LAG_BUCKETS)
+        self.lag_waketime = self.reactor.NEVER
+        self.lag_timer = self.reactor.register_timer(self._probe_lag)
+        # Metrics gathered from other objects at query time
+        reg = self.registry
+        self.mcu_counters = dict(
+            (key, reg.counter('klippy_mcu_%s_total' % (key,), desc, ['mcu']))
+            for key, desc in MCU_COUNTERS.items())
+        self.mcu_gauges = dict(
+            (key, reg.gauge('klippy_mcu_%s' % (key,), desc, ['mcu']))
+            for key, desc in MCU_GAUGES.items())
+        self.canbus_counters = dict(
+            (key, reg.counter('klippy_canbus_%s_total' % (key,), desc,
+                              ['mcu']))
+            for key, desc in CANBUS_COUNTERS.items())
+        self.canbus_state = reg.gauge('klippy_canbus_bus_state',
+                                      "Canbus state (1 for the current state)",
+                                      ['mcu', 'state'])
+        self.heater_gauges = dict(
+            (key, reg.gauge('klippy_heater_%s' % (key,), desc, ['heater']))
+            for key, desc in [('temperature', "Heater temperature"),
+                              ('target', "Heater target temperature"),
+                              ('power', "Heater power")])
+        self.system_gauges = dict(
+            (key, reg.gauge('klippy_system_%s' % (key,), desc))
+            for key, desc in [('sysload', "System load average"),
+                              ('cputime', "Klippy process cpu time"),
+                              ('memavail', "Available system memory (kB)")])
+        self.oams_gauges = dict(
+            (key, reg.gauge('oams_%s' % (key,), desc, ['oams']))
+            for key, desc in [('fps_value', "OpenAMS FPS sensor value"),
+                              ('current_spool', "OpenAMS loaded spool")])
+        self.oams_counters = dict(
+            (key, reg.counter('oams_%s_total' % (key,), desc, ['oams']))
+            for key, desc in [
+                ('load_retry_failures', "OpenAMS load retry failures"),
+                ('unload_retry_failures', "OpenAMS unload retry failures")])
+        self.oams_hes = reg.gauge('oams_hes_value',
+                                  "OpenAMS hall effect sensor values",
+                                  ['oams', 'sensor', 'bay'])
+        reg.register_collector(self._collect)
+        self.printer.register_event_handler("klippy:ready", self._handle_ready)
+        self.printer.register_event_handler("klippy:disconnect",
+                                            self._handle_disconnect)
+    def _handle_ready(self):
+        if self.printer.get_start_args().get('debugoutput') is not None:
+            return
+        self.lag_waketime = self.reactor.monotonic() + self.lag_interval
+        self.reactor.update_timer(self.lag_timer, self.lag_waketime)
+        try:
+            os.remove(self.socket_path)
+        except OSError:
+            pass
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.setblocking(0)
+        try:
+            self.sock.bind(self.socket_path)
+        except socket.error as e:
+            logging.warning("metrics: unable to open socket %s: %s",
+                            self.socket_path, e)
+            self.sock.close()
+            self.sock = None
+            return
+        self.sock.listen(4)
+        self.fd_handle = self.reactor.register_fd(self.sock.fileno(),
+                                                  self._handle_accept)
+    def _handle_disconnect(self):
+        for client in list(self.clients):
+            client.close()
+        if self.sock is not None:
+            self.reactor.unregister_fd(self.fd_handle)
+            self.sock.close()
+            self.sock = None
+            try:
+                os.remove(self.socket_path)
+            except OSError:
+                pass
+    def _handle_accept(self, eventtime):
+        try:
+            sock, addr = self.sock.accept()
+        except socket.error:
+            return
+        sock.setblocking(0)
+        self.clients.add(MetricsClient(self, sock))
+    def _probe_lag(self, eventtime):
+        self.timer_lag.observe(max(0., eventtime - self.lag_waketime))
+        self.lag_waketime = eventtime + self.lag_interval
+        return self.lag_waketime
+    # Gather values from other objects
+    def _collect(self, eventtime):
+        for name, mcu in self.printer.lookup_objects(module='mcu'):
+            mcu_name = name.split()[-1]
+            stats = mcu.get_status(eventtime).get('last_stats', {})
+            for key, counter in self.mcu_counters.items():
+                if key in stats:
+                    counter.set_total(stats[key], (mcu_name,))
+            for key, gauge in self.mcu_gauges.items():
+                if key in stats:
+                    gauge.set(stats[key], (mcu_name,))
+        self.canbus_state.clear()
+        for name, cstats in self.printer.lookup_objects(module='canbus_stats'):
+            mcu_name = name.split()[-1]
+            status = cstats.get_status(eventtime)
+            if status.get('rx_error') is None:
+                continue
+            for key, counter in self.canbus_counters.items():
+                counter.set_total(status[key], (mcu_name,))
+            self.canbus_state.set(1, (mcu_name, status['bus_state']))
+        pheaters = self.printer.lookup_object('heaters', None)
+        if pheaters is not None:
+            for name, heater in pheaters.heaters.items():
+                status = heater.get_status(eventtime)
+                for key, gauge in self.heater_gauges.items():
+                    if key in status:
+                        gauge.set(status[key], (name,))
+        sysstats = self.printer.lookup_object('system_stats', None)
+        if sysstats is not None:
+            status = sysstats.get_status(eventtime)
+            for key, gauge in self.system_gauges.items():
+                gauge.set(status[key])
+        for name, oams in self.printer.lookup_objects(module='oams'):
+            oams_name = name.split()[-1]
+            status = oams.get_status(eventtime)
+            for key, gauge in self.oams_gauges.items():
+                if isinstance(status.get(key), (int, float)):
+                    gauge.set(status[key], (oams_name,))
+            for key, counter in self.oams_counters.items():
+                if key in status:
+                    counter.set_total(status[key], (oams_name,))
+            for sensor in ('f1s', 'hub'):
+                for bay, value in enumerate(
+                        status.get('%s_hes_value' % (sensor,), [])):
+                    self.oams_hes.set(value, (oams_name, sensor, bay))
+
+def load_config(config):
+    return PrinterMetrics(config)
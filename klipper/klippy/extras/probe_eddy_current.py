@@ -5,7 +5,7 @@
 # This file may be distributed under the terms of the GNU GPLv3 license.
 import sys, logging, math, bisect
 import mcu, mathutil
-from . import ldc1612, trigger_analog, probe, manual_probe
+from . import ldc1612, trigger_analog, probe, manual_probe, bulk_sensor
 
 
 ######################################################################
@@ -448,6 +448,10 @@ class EddyGatherSamples:
         # Sensor reading
         self._sensor_messages = []
         self._need_stop = False
+        # With numpy, samples are kept in a (time, freq, z) ring instead
+        self._np = bulk_sensor.lookup_numpy()
+        self._ring = None
+        self._ring_start = self._ring_end = 0
         # Probe request and results storage
         self._probe_requests = []
         self._analysis_results = []
@@ -457,14 +461,56 @@ class EddyGatherSamples:
     def _add_sensor_message(self, msg):
         if self._need_stop:
             del self._sensor_messages[:]
+            self._ring = None
             return False
-        self._sensor_messages.append(msg)
+        if self._np is None:
+            self._sensor_messages.append(msg)
+        elif msg['data']:
+            self._ring_append(msg['data'])
         self._check_sensor_messages()
         return True
     def finish(self):
         self._need_stop = True
+    def _ring_append(self, data):
+        np = self._np
+        rows = np.array(data, dtype=np.float64).reshape(-1, 3)
+        ring = self._ring
+        start, end = self._ring_start, self._ring_end
+        if ring is None or end + len(rows) > len(ring):
+            # Drop consumed samples, growing the buffer if still needed
+            count = end - start
+            size = 4096 if ring is None else len(ring)
+            while count + len(rows) > size:
+                size *= 2
+            new_ring = np.empty((size, 3))
+            if ring is not None:
+                new_ring[:count] = ring[start:end]
+            ring = self._ring = new_ring
+            start, end = self._ring_start, self._ring_end = 0, count
+        ring[end:end + len(rows)] = rows
+        self._ring_end = end + len(rows)
+    def _have_samples_until(self, end_time):
+        if self._np is None:
+            return (self._sensor_messages
+                    and self._sensor_messages[-1]['data'][-1][0] >= end_time)
+        return (self._ring_end > self._ring_start
+                and self._ring[self._ring_end - 1, 0] >= end_time)
+    def _pull_ring_measurements(self, start_time, end_time):
+        # Binary search the ring for the samples in the time range.  The
+        # result is an (N, 3) array view that is only valid until the
+        # next sensor message arrives.
+        np = self._np
+        times = self._ring[self._ring_start:self._ring_end, 0]
+        first = int(np.searchsorted(times, start_time, side='left'))
+        last = int(np.searchsorted(times, end_time, side='right'))
+        measures = self._ring[self._ring_start + first:
+                              self._ring_start + last]
+        self._ring_start += first
+        return measures
     def _pull_measurements(self, start_time, end_time):
         # Extract measurements from sensor messages for given time range
+        if self._np is not None:
+            return self._pull_ring_measurements(start_time, end_time)
         measures = []
         msg_num = discard_msgs = 0
         while msg_num < len(self._sensor_messages):
@@ -486,9 +532,9 @@ class EddyGatherSamples:
         del self._sensor_messages[:discard_msgs]
         return measures
     def _check_sensor_messages(self):
-        while self._sensor_messages and self._probe_requests:
+        while self._probe_requests:
             cb, start_time, end_time, args = self._probe_requests[0]
-            if self._sensor_messages[-1]['data'][-1][0] < end_time:
+            if not self._have_samples_until(end_time):
                 break
             measures = self._pull_measurements(start_time, end_time)
             errmsg = res = None
@@ -535,11 +581,13 @@ class EddyGatherSamples:
 # Generate a ProbeResult from the average of a set of measurements
 def probe_results_from_avg(measures, toolhead_pos, calibration, offsets):
     cmderr = calibration.get_printer().command_error
-    if not measures:
+    if not len(measures):
         raise cmderr("Unable to obtain probe_eddy_current sensor readings")
     # Determine average of measurements
-    freq_sum = sum([m[1] for m in measures])
-    freq_avg = freq_sum / len(measures)
+    if isinstance(measures, list):
+        freq_avg = sum([m[1] for m in measures]) / len(measures)
+    else:
+        freq_avg = float(measures[:, 1].mean())
     # Determine height associated with frequency
     sensor_z = calibration.freq_to_height(freq_avg)
     if sensor_z <= -OUT_OF_RANGE or sensor_z >= OUT_OF_RANGE:
@@ -562,6 +610,7 @@ def probe_results_from_avg(measures, toolhead_pos, calibration, offsets):
 class TapBestFit:
     def __init__(self):
         self._least_squares_cache = {}
+        self._cumulative_sums = None
     def _build_ls_matrix(self, samples, est_z_contact):
         # The function here is only a reference for the optimized version below
         len_samples = len(samples)
@@ -605,11 +654,30 @@ class TapBestFit:
         return (sum_le_z, sum_le_z2, sum_le_freq, sum_le_freq_z,
                 sum_gt_z, sum_gt_z2, sum_gt_z3, sum_gt_z4,
                 sum_gt_freq, sum_gt_freq_z, sum_gt_freq_z2)
+    def _build_cumulative_sums(self, samples):
+        # Vectorized _build_sums() for every num_le at once: row num_le
+        # holds the sums over samples[:num_le] and samples[num_le:]
+        np = bulk_sensor.lookup_numpy()
+        if np is None:
+            return None
+        z, freq = np.array(samples, dtype=np.float64).reshape(-1, 2).T
+        z2 = z**2
+        le_terms = np.column_stack((z, z2, freq, freq*z))
+        gt_terms = np.column_stack((z, z2, z**3, z**4,
+                                    freq, freq*z, freq * z2))
+        le_sums = np.zeros((len(z) + 1, 4))
+        le_sums[1:] = np.cumsum(le_terms, axis=0)
+        gt_sums = np.zeros((len(z) + 1, 7))
+        gt_sums[:-1] = np.cumsum(gt_terms[::-1], axis=0)[::-1]
+        return np.hstack((le_sums, gt_sums)).tolist()
     def _build_ls_matrix_opt(self, samples, est_z_contact):
         # This function is an optimized version of _build_ls_matrix()
         num_le = bisect.bisect(samples, (est_z_contact, sys.float_info.max))
         # Check for previously calculated raw freq/z counters
-        sums = self._least_squares_cache.get(num_le)
+        if self._cumulative_sums is not None:
+            sums = self._cumulative_sums[num_le]
+        else:
+            sums = self._least_squares_cache.get(num_le)
         if sums is None:
             sums = self._build_sums(samples, num_le)
             self._least_squares_cache[num_le] = sums
@@ -661,6 +729,7 @@ class TapBestFit:
         base_z = .5 * (data[0][1][2] + data[-1][1][2])
         base_freq = .5 * (data[0][0] + data[-1][0])
         samples = [(d[1][2] - base_z, d[0] - base_freq) for d in data]
+        self._cumulative_sums = self._build_cumulative_sums(samples)
         # Run least squares with various z values to reduce residual error
         min_z = best_z = samples[0][0]
         max_z = samples[-1][0]
@@ -690,6 +759,7 @@ class TapBestFit:
                 else:
                     min_z = guess_z
         self._least_squares_cache.clear()
+        self._cumulative_sums = None
         # Return to original freq/z measurement base
         bc = [v[0] for v in best_coeffs]
         z_contact = base_z + best_z
@@ -844,6 +914,8 @@ class EddyTap:
         raise self._printer.command_error("Unable to detect tap: %s" % (msg,))
     def _analyze_pullback(self, measures, start_time, end_time):
         self._last_tap = None
+        if not isinstance(measures, list):
+            measures = measures.tolist()
         reactor = self._printer.get_reactor()
         self._validate_samples_time(measures, start_time, end_time)
         # Correlate measurements to toolhead position at time of measurement
@@ -283,6 +283,8 @@ class ResonanceTester:
         self.max_smoothing = config.getfloat('max_smoothing', None, minval=0.05)
         self.probe_points = config.getlists('probe_points', seps=(',', '\n'),
                                             parser=float, count=3)
+        # Write long captures to disk instead of keeping them in memory
+        self.stream_samples = config.getboolean('stream_samples', False)
 
         self.gcode = self.printer.lookup_object('gcode')
         self.gcode.register_command("MEASURE_AXES_NOISE",
@@ -344,6 +346,9 @@ class ResonanceTester:
                     raise gcmd.error(
                             "No accelerometers specified that can measure"
                             " resonances over axis '%s'" % axis.get_name())
+                if self.stream_samples:
+                    for chip_axis, aclient, chip_name in raw_values:
+                        aclient.stream_to_file()
 
                 # Generate moves
                 test_seq = self.generator.gen_test()
@@ -361,9 +366,11 @@ class ResonanceTester:
                                 "Writing raw accelerometer data to "
                                 "%s file" % (raw_name,))
                 if helper is None:
+                    self._discard_streams(raw_values)
                     continue
                 for chip_axis, aclient, chip_name in raw_values:
                     if not aclient.has_valid_samples():
+                        self._discard_streams(raw_values)
                         raise gcmd.error(
                             "accelerometer '%s' measured no data" % (
                                 chip_name,))
@@ -377,7 +384,11 @@ class ResonanceTester:
                         calibration_data[axis] = new_data
                     else:
                         calibration_data[axis].add_data(new_data)
+                self._discard_streams(raw_values)
         return calibration_data
+    def _discard_streams(self, raw_values):
+        for chip_axis, aclient, chip_name in raw_values:
+            aclient.discard_stream()
     def _parse_chips(self, accel_chips):
         parsed_chips = []
         for chip_name in accel_chips.split(','):
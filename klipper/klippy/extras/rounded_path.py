@@ -8,9 +8,8 @@
 # Each corner is rounded to a maximum deviation distance of D.
 # Since each corner depends on the next one, the chain needs to end with an R=0
 # command to flush pending moves.
-# Coordinates created by this are converted into G0 commands.
+# Coordinates created by this are queued as a batch of G0 moves.
 import numpy as np
-from math import comb
 
 # This file may be distributed under the terms of the GNU GPLv3 license.
 import math
@@ -32,12 +31,6 @@ class ControlPoint:
 def _vecto(f: ControlPoint, t: ControlPoint)->list:
     return [t.vec[i]-f.vec[i] for i in range(3)]
 
-def _vadd(f: list, t: list) ->list:
-    return [f[i]+ t[i] for i in range(3)]
-
-def _vmul(f:list, n) ->list:
-    return [f[i] * n for i in range(3)]
-
 def _cross(vp: list, vn: list) -> list:
     return [vp[1] * vn[2] - vp[2] * vn[1], vp[2] * vn[0] - vp[0] * vn[2],
             vp[0] * vn[1] - vp[1] * vn[0]]
@@ -45,10 +38,6 @@ def _cross(vp: list, vn: list) -> list:
 def _vdist(v0: list, v1:list) -> float:
     return math.hypot(v0[0]-v1[0], v0[1]-v1[1], v0[2]-v1[2])
 
-def _vnorm(vec: list) -> list:
-    invlen = 1.0/math.hypot(*vec)
-    return [x*invlen for x in vec]
-
 def _vangle(vec1: list, vec2: list) -> float:
     crossx = vec1[1] * vec2[2] - vec1[2] * vec2[1]
     crossy = vec1[2] * vec2[0] - vec1[0] * vec2[2]
@@ -69,19 +58,20 @@ def _vrot(vec: list, angle, axis: list) -> list:
         vec[0] * (t * axis[0] * axis[2] - s * axis[1]) + vec[1] * (t * axis[1] * axis[2] + s * axis[0]) + vec[2] * (t * axis[2] ** 2 + c)
     ]
 
-def _bernstein_poly(index, num_points, positions):
+def _bezier_chain(starts, tips, ends, counts):
     """
-     The Bernstein polynomial of n, i as a function of t
+     Samples the quadratic bezier of every corner in a chain at once.
+     Corner i contributes counts[i] points running from starts[i] to ends[i];
+     corners with a count of 1 collapse to their start point.
     """
-    return comb(num_points, index) * (positions ** (num_points - index)) * (1 - positions)**index
-
-def _bezier_curve(start: list, tip: list, end: list, numpoints: int) -> list[list[float]]:
-    nPoints = 3
-    nDims = len(start)
-    t = np.linspace(1.0, 0.0, numpoints)
-    polynomial_array = np.array([_bernstein_poly(i, nPoints - 1, t) for i in range(0, nPoints)])
-    vals_by_dimension = [np.dot(np.array([start[d], tip[d], end[d]]), polynomial_array) for d in range(nDims)]
-    return np.transpose(vals_by_dimension)
+    corner = np.repeat(np.arange(len(counts)), counts)
+    first = np.cumsum(counts) - counts
+    step = np.arange(corner.size) - first[corner]
+    t = 1.0 - step / np.maximum(counts - 1, 1)[corner]
+    u = 1.0 - t
+    return ((t * t)[:, None] * starts[corner]
+            + (2.0 * t * u)[:, None] * tips[corner]
+            + (u * u)[:, None] * ends[corner])
 
 class RoundedPath:
     buffer: list[ControlPoint]
@@ -92,8 +82,6 @@ class RoundedPath:
 
         self.gcode_move = self.printer.load_object(config, 'gcode_move')
         self.gcode = self.printer.lookup_object('gcode')
-        self.G0_params = {}
-        self.G0_cmd = self.gcode.create_gcode_command("G0", "G0", self.G0_params)
         self.real_G0 = self.gcode_move.cmd_G1
         self.gcode.register_command("ROUNDED_G0", self.cmd_ROUNDED_G0)
         self.buffer = []
@@ -179,21 +167,27 @@ class RoundedPath:
             return
 
         self._deconflict_lin_d(num_segments+1)
-
-        for i in range(num_segments):
-            self._arc(self.buffer[i+1], self.buffer[i],self.buffer[i+2])
+        points, speeds = self._solve_chain(num_segments)
+        self._submit(points.tolist(), speeds.tolist())
 
         self.buffer = self.buffer[num_segments:]
         # Update where we finished
         self.buffer[0].vec = self.lastg0
 
     def _deconflict_lin_d(self, num_segments):
-        order = [i+1 for i in range(num_segments)]
-        order = sorted(order, key=lambda a: self.buffer[a].len)
+        chain = self.buffer[:num_segments+1]
+        lin_d = np.array([p.lin_d for p in chain])
+        lens = np.array([p.len for p in chain[1:]])
+        # Shrinking a corner only ever reduces the overlap on its neighbours,
+        # so segments that do not overlap up front never need revisiting.
+        conflicts = np.flatnonzero(lin_d[1:] + lin_d[:-1] - lens > 0.) + 1
+        if not conflicts.size:
+            return
+        order = sorted(conflicts.tolist(), key=lambda a: chain[a].len)
         # Process segments, shortest first
         for i in order:
-            p0 = self.buffer[i-1]
-            p1 = self.buffer[i]
+            p0 = chain[i-1]
+            p1 = chain[i]
             missingd = p1.lin_d + p0.lin_d - p1.len
             if missingd <= 0:
                 continue
@@ -222,38 +216,53 @@ class RoundedPath:
             p0.lin_d = max(0.0, p0.lin_d - missingr_shared / p0.lin_d_to_r)
             p1.lin_d = max(0.0, p1.lin_d - missingr_shared / p1.lin_d_to_r)
 
-    def _arc(self, c:ControlPoint, p:ControlPoint, n:ControlPoint):
-        radius = c.lin_d * c.lin_d_to_r
-        num_segments = math.floor(radius * c.angle / self.mm_per_arc_segment)
-        if num_segments < 1:
-            self._g0(c)
-            return
-        normal_to_previous = _vnorm(_vecto(c, p))
-        normal_to_next = _vnorm(_vecto(c, n))
-        start = _vadd(c.vec, _vmul(normal_to_previous, c.lin_d))
-        end = _vadd(c.vec, _vmul(normal_to_next, c.lin_d))
-        tip = c.vec
-        beziercurve = _bezier_curve(start, tip, end, num_segments + 1)
-        for p in beziercurve:
-            self._g0p(c, p)
+    # Rounds corners 1..num_segments of the buffer in one pass and returns
+    # the resulting segment end points along with their feedrates.
+    def _solve_chain(self, num_segments):
+        chain = self.buffer[:num_segments+2]
+        corners = chain[1:-1]
+        vecs = np.array([p.vec for p in chain], dtype=float)
+        tips = vecs[1:-1]
+        lin_d = np.array([c.lin_d for c in corners])
+        radius = lin_d * np.array([c.lin_d_to_r for c in corners])
+        angle = np.array([c.angle for c in corners])
+        arc_segments = np.floor(radius * angle / self.mm_per_arc_segment)
+        rounded = arc_segments >= 1
+        # Corners that are too small to round are emitted as their tip
+        starts = tips.copy()
+        ends = tips.copy()
+        if rounded.any():
+            to_prev = vecs[:-2][rounded] - tips[rounded]
+            to_next = vecs[2:][rounded] - tips[rounded]
+            offset = lin_d[rounded][:, None]
+            starts[rounded] += (to_prev * offset
+                / np.linalg.norm(to_prev, axis=1)[:, None])
+            ends[rounded] += (to_next * offset
+                / np.linalg.norm(to_next, axis=1)[:, None])
+        counts = np.where(rounded, arc_segments + 1, 1).astype(int)
+        points = _bezier_chain(starts, tips, ends, counts)
+        speeds = np.repeat([c.f for c in corners], counts)
+        return points, speeds
 
     def _g0(self, p: ControlPoint):
-        self._g0p(p, p.vec)
-
-    def _g0p(self, p: ControlPoint, vec: list):
-        # Ignore tiny residual moves that can be introduced by floating point
-        # interpolation when generating bezier arc segments.
-        if self.lastg0 is not None and _vdist(self.lastg0, vec) <= EPSILON:
+        self._submit([p.vec], [p.f])
+
+    def _submit(self, points: list, speeds: list):
+        last = self.lastg0
+        coords = []
+        feedrates = []
+        for vec, f in zip(points, speeds):
+            # Ignore tiny residual moves that can be introduced by floating
+            # point interpolation when generating bezier arc segments.
+            if last is not None and _vdist(last, vec) <= EPSILON:
+                continue
+            last = vec
+            coords.append(vec)
+            feedrates.append(f if f > 0.0 else None)
+        if not coords:
             return
-        self.G0_params["X"]=vec[0]
-        self.G0_params["Y"]=vec[1]
-        self.G0_params["Z"]=vec[2]
-        if p.f > 0.0:
-            self.G0_params['F'] = p.f
-        else:
-            self.G0_params.pop('F', None)
-        self.lastg0 = [vec[0], vec[1], vec[2]]
-        self.real_G0(self.G0_cmd)
+        self.lastg0 = [last[0], last[1], last[2]]
+        self.gcode_move.move_batch(coords, speeds=feedrates)
 
 def load_config(config):
     return RoundedPath(config)
\ No newline at end of file
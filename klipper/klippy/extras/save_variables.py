@@ -4,22 +4,43 @@
 # Copyright (C) 2016-2020  Kevin O'Connor <kevin@koconnor.net>
 #
 # This file may be distributed under the terms of the GNU GPLv3 license.
-import os, logging, ast, configparser
+import os, logging, ast, configparser, tempfile
 
+# The in-memory variables are authoritative.  Each save is appended to a
+# journal next to the variables file (so it survives a klippy crash) and the
+# variables file itself is rewritten atomically after write_delay seconds,
+# which also empties the journal.
 class SaveVariables:
     def __init__(self, config):
         self.printer = config.get_printer()
+        self.reactor = self.printer.get_reactor()
         self.filename = os.path.expanduser(config.get('filename'))
+        self.write_delay = config.getfloat('write_delay', 1., minval=0.)
+        dirname, basename = os.path.split(self.filename)
+        self.journal_name = os.path.join(dirname, '.%s.journal' % (basename,))
+        self.journal = None
         self.allVariables = {}
         try:
             if not os.path.exists(self.filename):
                 open(self.filename, "w").close()
             self.loadVariables()
+            if self.replayJournal():
+                self.writeVariables()
         except self.printer.command_error as e:
             raise config.error(str(e))
+        except Exception as e:
+            logging.exception("Unable to restore saved variables")
+            raise config.error("Unable to restore variables from %s: %s"
+                               % (self.filename, e))
+        self.write_timer = self.reactor.register_timer(self._write_event)
+        self.write_pending = False
+        self.printer.register_event_handler("klippy:disconnect",
+                                            self._handle_disconnect)
         gcode = self.printer.lookup_object('gcode')
         gcode.register_command('SAVE_VARIABLE', self.cmd_SAVE_VARIABLE,
                                desc=self.cmd_SAVE_VARIABLE_help)
+        gcode.register_command('SAVE_VARIABLES', self.cmd_SAVE_VARIABLES,
+                               desc=self.cmd_SAVE_VARIABLES_help)
     def loadVariables(self):
         allvars = {}
         varfile = configparser.ConfigParser()
@@ -33,32 +54,123 @@ class SaveVariables:
             logging.exception(msg)
             raise self.printer.command_error(msg)
         self.allVariables = allvars
-    cmd_SAVE_VARIABLE_help = "Save arbitrary variables to disk"
-    def cmd_SAVE_VARIABLE(self, gcmd):
-        varname = gcmd.get('VARIABLE')
-        if (varname.lower() != varname):
-            raise gcmd.error("VARIABLE must not contain upper case")
-        value = gcmd.get('VALUE')
+    def replayJournal(self):
+        # Apply saves not yet written to the variables file
         try:
-            value = ast.literal_eval(value)
-        except ValueError as e:
-            raise gcmd.error("Unable to parse '%s' as a literal" % (value,))
-        newvars = dict(self.allVariables)
-        newvars[varname] = value
-        # Write file
+            with open(self.journal_name, "r") as f:
+                lines = f.readlines()
+        except (IOError, OSError):
+            return False
+        allvars = dict(self.allVariables)
+        count = 0
+        for line in lines:
+            name, sep, val = line.rstrip('\n').partition('=')
+            try:
+                if not sep or not line.endswith('\n'):
+                    raise ValueError("incomplete entry")
+                value = ast.literal_eval(val)
+            except (ValueError, SyntaxError):
+                # Torn write at the time of a crash
+                logging.warning("save_variables: ignoring journal entry %r",
+                                line)
+                break
+            try:
+                self._check_value(name, value)
+            except ValueError:
+                logging.warning("save_variables: dropping unwritable journal"
+                                " entry %r", line)
+                continue
+            allvars[name] = value
+            count += 1
+        self.allVariables = allvars
+        if count:
+            logging.info("save_variables: recovered %d journaled saves",
+                         count)
+        return bool(lines)
+    def _check_value(self, name, value):
+        # Raises ValueError if writeVariables() could not store the value
         varfile = configparser.ConfigParser()
         varfile.add_section('Variables')
-        for name, val in sorted(newvars.items()):
+        varfile.set('Variables', name, repr(value))
+    def writeVariables(self):
+        # Atomically replace the variables file and empty the journal
+        varfile = configparser.ConfigParser()
+        varfile.add_section('Variables')
+        for name, val in sorted(self.allVariables.items()):
             varfile.set('Variables', name, repr(val))
+        dirname = os.path.dirname(os.path.abspath(self.filename))
+        fd, tmpname = tempfile.mkstemp(prefix=".variables-", dir=dirname)
+        try:
+            with os.fdopen(fd, "w") as f:
+                varfile.write(f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmpname, self.filename)
+        except:
+            if os.path.exists(tmpname):
+                os.unlink(tmpname)
+            raise
+        if self.journal is not None:
+            self.journal.close()
+        self.journal = open(self.journal_name, "w")
+    def _write_event(self, eventtime):
+        self.write_pending = False
+        try:
+            self.writeVariables()
+        except:
+            logging.exception("Unable to save variables to %s",
+                              self.filename)
+        return self.reactor.NEVER
+    def _handle_disconnect(self):
+        if self.write_pending:
+            self.reactor.update_timer(self.write_timer, self.reactor.NEVER)
+            self._write_event(self.reactor.monotonic())
+        if self.journal is not None:
+            self.journal.close()
+            self.journal = None
+    def _parse_value(self, gcmd, value):
         try:
-            f = open(self.filename, "w")
-            varfile.write(f)
-            f.close()
+            return ast.literal_eval(value)
+        except (ValueError, SyntaxError):
+            raise gcmd.error("Unable to parse '%s' as a literal" % (value,))
+    def _save(self, gcmd, newvals):
+        # Journal the saves, then update the authoritative copy
+        try:
+            for name, val in newvals:
+                self._check_value(name, val)
+            if self.journal is None:
+                self.journal = open(self.journal_name, "a")
+            self.journal.write("".join(["%s=%r\n" % (name, val)
+                                        for name, val in newvals]))
+            self.journal.flush()
         except:
             msg = "Unable to save variable"
             logging.exception(msg)
             raise gcmd.error(msg)
-        self.loadVariables()
+        # Replace (not update) the dict so status queries see the change
+        newvars = dict(self.allVariables)
+        newvars.update(newvals)
+        self.allVariables = newvars
+        if not self.write_pending:
+            self.write_pending = True
+            self.reactor.update_timer(
+                self.write_timer, self.reactor.monotonic() + self.write_delay)
+    cmd_SAVE_VARIABLE_help = "Save arbitrary variables to disk"
+    def cmd_SAVE_VARIABLE(self, gcmd):
+        varname = gcmd.get('VARIABLE')
+        if (varname.lower() != varname):
+            raise gcmd.error("VARIABLE must not contain upper case")
+        value = self._parse_value(gcmd, gcmd.get('VALUE'))
+        self._save(gcmd, [(varname, value)])
+    cmd_SAVE_VARIABLES_help = "Save several variables to disk at once"
+    def cmd_SAVE_VARIABLES(self, gcmd):
+        # SAVE_VARIABLES name1=value1 name2=value2 ...
+        newvals = [(name.lower(), self._parse_value(gcmd, value))
+                   for name, value in sorted(
+                       gcmd.get_command_parameters().items())]
+        if not newvals:
+            raise gcmd.error("SAVE_VARIABLES requires name=value pairs")
+        self._save(gcmd, newvals)
     def get_status(self, eventtime):
         return {'variables': self.allVariables}
 
@@ -3,8 +3,10 @@
 # Copyright (C) 2020-2024  Dmitry Butyugin <dmbutyugin@google.com>
 #
 # This file may be distributed under the terms of the GNU GPLv3 license.
-import collections, importlib, logging, math, multiprocessing, traceback
+import collections, importlib, logging, math, mmap, multiprocessing
+import time, traceback
 shaper_defs = importlib.import_module('.shaper_defs', 'extras')
+bulk_sensor = importlib.import_module('.bulk_sensor', 'extras')
 
 MIN_FREQ = 5.
 MAX_FREQ = 200.
@@ -15,10 +17,24 @@ TEST_DAMPING_RATIOS=[0.075, 0.1, 0.15]
 
 AUTOTUNE_SHAPERS = ['zv', 'mzv', 'ei', '2hump_ei', '3hump_ei']
 
+# Initial size of the buffer each worker shares with the main process
+WORKER_BUFFER_SIZE = 4 * 1024 * 1024
+MAX_WORKERS = 2
+
+# Maximum number of elements in the temporary arrays of fit_shaper
+FIT_CHUNK_SIZE = 1 << 18
+
 ######################################################################
 # Frequency response calculation and shaper auto-tuning
 ######################################################################
 
+def _get_samples_array(np, raw_values):
+    # Clients without get_samples_array() return a list of samples
+    get_samples_array = getattr(raw_values, 'get_samples_array', None)
+    if get_samples_array is not None:
+        return get_samples_array()
+    return np.array(raw_values.get_samples())
+
 class CalibrationData:
     def __init__(self, name, freq_bins, psd_sum, psd_x, psd_y, psd_z):
         self.name = name
@@ -55,6 +71,11 @@ class CalibrationData:
         return self._psd_map[axis]
     def get_datasets(self):
         return [self] + self.data_sets
+    def __getstate__(self):
+        # The numpy module can not be sent to a worker process
+        state = dict(self.__dict__)
+        state.pop('numpy', None)
+        return state
 
 
 CalibrationResult = collections.namedtuple(
@@ -74,56 +95,18 @@ class ShaperCalibrate:
                     "installed via `~/klippy-env/bin/pip install` (refer to "
                     "docs/Measuring_Resonances.md for more details).")
 
+    def get_worker_pool(self):
+        pool = self.printer.lookup_object('shaper_calibrate_workers', None)
+        if pool is None:
+            pool = CalibrationWorkerPool(self.printer)
+            self.printer.add_object('shaper_calibrate_workers', pool)
+        return pool
+
     def background_process_exec(self, method, args):
         if self.printer is None:
             return method(*args)
-        import queuelogger
-        parent_conn, child_conn = multiprocessing.Pipe()
-        def wrapper():
-            queuelogger.clear_bg_logging()
-            try:
-                res = method(*args)
-            except:
-                child_conn.send((True, traceback.format_exc()))
-                child_conn.close()
-                return
-            if isinstance(res, list):
-                child_conn.send((True, None))
-                for el in res:
-                    child_conn.send((False, el))
-                child_conn.send((True, None))
-            else:
-                child_conn.send((False, res))
-            child_conn.close()
-        # Start a process to perform the calculation
-        calc_proc = multiprocessing.Process(target=wrapper)
-        calc_proc.daemon = True
-        calc_proc.start()
-        # Wait for the process to finish
-        reactor = self.printer.get_reactor()
-        gcode = self.printer.lookup_object("gcode")
-        eventtime = last_report_time = reactor.monotonic()
-        while calc_proc.is_alive() and not parent_conn.poll():
-            if eventtime > last_report_time + 5.:
-                last_report_time = eventtime
-                gcode.respond_info("Wait for calculations..", log=False)
-            eventtime = reactor.pause(eventtime + .1)
-        # Return results
-        status, recv = parent_conn.recv()
-        if recv is None:
-            res = []
-            while True:
-                status, recv = parent_conn.recv()
-                if status:
-                    break
-                res.append(recv)
-        else:
-            res = recv
-        if status and recv is not None:
-            raise self.error("Error in remote calculation: %s" % (recv,))
-        calc_proc.join()
-        parent_conn.close()
-        return res
+        pool = self.get_worker_pool()
+        return pool.wait(pool.submit(method.__name__, args))
 
     def _split_into_windows(self, x, window_size, overlap):
         # Memory-efficient algorithm to split an input 'x' into a series
@@ -165,17 +148,75 @@ class ShaperCalibrate:
         freqs = np.fft.rfftfreq(nfft, 1. / fs)
         return freqs, psd
 
+    def _streamed_psd(self, chunks, count, fs, nfft):
+        # Same as _psd() for the x, y and z columns of samples that are
+        # read one chunk at a time, so that memory use stays bounded
+        np = self.numpy
+        window = np.kaiser(nfft, 6.)
+        scale = 1.0 / (window**2).sum()
+        overlap = nfft // 2
+        step = nfft - overlap
+        n_windows = (count - overlap) // step
+        psd = np.zeros((3, nfft // 2 + 1))
+        pending = np.zeros((3, 0))
+        done = 0
+        for chunk in chunks:
+            pending = np.concatenate([pending, chunk[:, 1:].T], axis=1)
+            avail = min((pending.shape[1] - overlap) // step, n_windows - done)
+            if avail <= 0:
+                continue
+            for i in range(3):
+                x = self._split_into_windows(pending[i], nfft, overlap)
+                x = x[:, :avail]
+                x = window[:, None] * (x - np.mean(x, axis=0))
+                result = np.fft.rfft(x, n=nfft, axis=0)
+                psd[i] += (np.conjugate(result) * result).real.sum(axis=-1)
+            done += avail
+            pending = pending[:, avail * step:]
+        psd *= scale / (fs * n_windows)
+        psd[:, 1:-1] *= 2.
+        freqs = np.fft.rfftfreq(nfft, 1. / fs)
+        return freqs, psd
+
+    def _calc_streamed_freq_response(self, name, reader):
+        # First pass over the capture file finds the sampling rate
+        count = 0
+        first_time = last_time = None
+        for chunk in reader.iter_chunks():
+            if first_time is None:
+                first_time = chunk[0, 0]
+            last_time = chunk[-1, 0]
+            count += chunk.shape[0]
+        if not count:
+            return None
+        T = last_time - first_time
+        SAMPLING_FREQ = count / T
+        M = 1 << int(SAMPLING_FREQ * WINDOW_T_SEC - 1).bit_length()
+        if count <= M:
+            return None
+        freqs, psd = self._streamed_psd(reader.iter_chunks(), count,
+                                        SAMPLING_FREQ, M)
+        px, py, pz = psd
+        return CalibrationData(name, freqs, px+py+pz, px, py, pz)
+
     def calc_freq_response(self, name, raw_values):
         np = self.numpy
         if raw_values is None:
             return None
+        if not isinstance(raw_values, (np.ndarray,
+                                       bulk_sensor.CaptureFileReader)):
+            # Out of tree clients may only provide get_samples()
+            get_stream_reader = getattr(raw_values, 'get_stream_reader', None)
+            if get_stream_reader is not None:
+                raw_values = get_stream_reader() or raw_values
+        if isinstance(raw_values, bulk_sensor.CaptureFileReader):
+            return self._calc_streamed_freq_response(name, raw_values)
         if isinstance(raw_values, np.ndarray):
             data = raw_values
         else:
-            samples = raw_values.get_samples()
-            if not samples:
+            data = _get_samples_array(np, raw_values)
+            if not len(data):
                 return None
-            data = np.array(samples)
 
         N = data.shape[0]
         T = data[-1,0] - data[0,0]
@@ -193,40 +234,17 @@ class ShaperCalibrate:
         return CalibrationData(name, fx, px+py+pz, px, py, pz)
 
     def process_accelerometer_data(self, name, data):
-        calibration_data = self.background_process_exec(
-                self.calc_freq_response, (name, data))
+        if self.printer is None:
+            calibration_data = self.calc_freq_response(name, data)
+        else:
+            pool = self.get_worker_pool()
+            calibration_data = pool.wait(pool.submit_samples(name, data))
         if calibration_data is None:
             raise self.error(
                     "Internal error processing accelerometer data %s" % (data,))
         calibration_data.set_numpy(self.numpy)
         return calibration_data
 
-    def _estimate_shaper(self, shaper, test_damping_ratio, test_freqs):
-        np = self.numpy
-
-        A, T = np.array(shaper[0]), np.array(shaper[1])
-        inv_D = 1. / A.sum()
-
-        omega = 2. * math.pi * test_freqs
-        damping = test_damping_ratio * omega
-        omega_d = omega * math.sqrt(1. - test_damping_ratio**2)
-        W = A * np.exp(np.outer(-damping, (T[-1] - T)))
-        S = W * np.sin(np.outer(omega_d, T))
-        C = W * np.cos(np.outer(omega_d, T))
-        return np.sqrt(S.sum(axis=1)**2 + C.sum(axis=1)**2) * inv_D
-
-    def _estimate_remaining_vibrations(self, shaper, test_damping_ratio,
-                                       freq_bins, psd):
-        vals = self._estimate_shaper(shaper, test_damping_ratio, freq_bins)
-        # The input shaper can only reduce the amplitude of vibrations by
-        # SHAPER_VIBRATION_REDUCTION times, so all vibrations below that
-        # threshold can be igonred
-        vibr_threshold = psd.max() / shaper_defs.SHAPER_VIBRATION_REDUCTION
-        remaining_vibrations = self.numpy.maximum(
-                vals * psd - vibr_threshold, 0).sum()
-        all_vibrations = self.numpy.maximum(psd - vibr_threshold, 0).sum()
-        return (remaining_vibrations / all_vibrations, vals)
-
     def _get_shaper_smoothing(self, shaper, accel=5000, scv=5.):
         half_accel = accel * .5
 
@@ -247,6 +265,110 @@ class ShaperCalibrate:
         offset_180 *= inv_D
         return max(offset_90, offset_180)
 
+    def _get_shapers_params(self, shapers):
+        np = self.numpy
+        A = np.array([shaper[0] for shaper in shapers])
+        T = np.array([shaper[1] for shaper in shapers])
+        # Same per-shaper constants and rounding as _get_shaper_smoothing
+        inv_D = np.array([1. / sum(shaper[0]) for shaper in shapers])
+        ts = np.array([sum([a * t for a, t in zip(*shaper)])
+                       for shaper in shapers]) * inv_D
+        # Python pow() rounds differently from x*x in rare cases
+        dt2 = np.array([[float(t - shaper_ts)**2 for t in shaper[1]]
+                        for shaper, shaper_ts in zip(shapers, ts.tolist())])
+        return A, T, inv_D, ts, dt2
+
+    def _get_shapers_smoothing(self, params, accel, scv):
+        # Vectorized version of _get_shaper_smoothing for a set of shapers
+        np = self.numpy
+        A, T, inv_D, ts, dt2 = params
+        half_accel = accel * .5
+        offset_90 = offset_180 = 0.
+        for i in range(A.shape[1]):
+            dt = T[:,i] - ts
+            offset_90 = offset_90 + np.where(
+                    T[:,i] >= ts, A[:,i] * (scv + half_accel * dt) * dt, 0.)
+            offset_180 = offset_180 + A[:,i] * half_accel * dt2[:,i]
+        offset_90 *= inv_D * math.sqrt(2.)
+        offset_180 *= inv_D
+        return np.maximum(offset_90, offset_180)
+
+    def _find_shapers_max_accel(self, params, scv):
+        # Runs find_shaper_max_accel bisection for all shapers in lockstep
+        np = self.numpy
+        TARGET_SMOOTHING = 0.12
+        def func(test_accel, idx):
+            smoothing = self._get_shapers_smoothing(
+                    [p[idx] for p in params], test_accel, scv)
+            return smoothing <= TARGET_SMOOTHING
+        n = len(params[0])
+        left = np.ones(n)
+        right = np.ones(n)
+        max_accel = np.zeros(n)
+        active = np.arange(n)
+        active = active[func(np.full(n, 1e-9), active)]
+        idx = active
+        while len(idx):
+            idx = idx[~func(left[idx], idx)]
+            right[idx] = left[idx]
+            left[idx] *= .5
+        idx = active[right[active] == left[active]]
+        while len(idx):
+            idx = idx[func(right[idx], idx)]
+            right[idx] *= 2.
+        idx = active
+        while True:
+            idx = idx[right[idx] - left[idx] > 1e-8]
+            if not len(idx):
+                break
+            middle = (left[idx] + right[idx]) * .5
+            is_ok = func(middle, idx)
+            left[idx[is_ok]] = middle[is_ok]
+            right[idx[~is_ok]] = middle[~is_ok]
+        max_accel[active] = left[active]
+        return max_accel
+
+    def _estimate_shapers(self, A, T, test_damping_ratio, test_freqs):
+        # Shaper response over a (shaper x frequency x pulse) tensor
+        np = self.numpy
+
+        inv_D = 1. / A.sum(axis=1)
+
+        omega = 2. * math.pi * test_freqs
+        damping = test_damping_ratio * omega
+        omega_d = omega * math.sqrt(1. - test_damping_ratio**2)
+        W = A[:,None,:] * np.exp((-damping)[None,:,None]
+                                 * (T[:,-1:] - T)[:,None,:])
+        S = W * np.sin(omega_d[None,:,None] * T[:,None,:])
+        C = W * np.cos(omega_d[None,:,None] * T[:,None,:])
+        return (np.sqrt(S.sum(axis=-1)**2 + C.sum(axis=-1)**2)
+                * inv_D[:,None])
+
+    def _estimate_shapers_vibrations(self, A, T, test_damping_ratios,
+                                     freq_bins, psd):
+        np = self.numpy
+        # The input shaper can only reduce the amplitude of vibrations by
+        # SHAPER_VIBRATION_REDUCTION times, so all vibrations below that
+        # threshold can be igonred
+        vibr_threshold = psd.max() / shaper_defs.SHAPER_VIBRATION_REDUCTION
+        all_vibrations = np.maximum(psd - vibr_threshold, 0).sum()
+        shaper_vibrations = np.zeros(len(A))
+        shaper_vals = np.zeros(shape=(len(A), len(freq_bins)))
+        # Bound the size of the temporary tensors
+        chunk = max(1, FIT_CHUNK_SIZE // (len(freq_bins) * A.shape[1] or 1))
+        for i in range(0, len(A), chunk):
+            for dr in test_damping_ratios:
+                vals = self._estimate_shapers(A[i:i+chunk], T[i:i+chunk],
+                                              dr, freq_bins)
+                remaining_vibrations = np.maximum(
+                        vals * psd - vibr_threshold, 0).sum(axis=-1)
+                shaper_vals[i:i+chunk] = np.maximum(
+                        shaper_vals[i:i+chunk], vals)
+                shaper_vibrations[i:i+chunk] = np.maximum(
+                        shaper_vibrations[i:i+chunk],
+                        remaining_vibrations / all_vibrations)
+        return shaper_vibrations, shaper_vals
+
     def fit_shaper(self, shaper_name, calibration_data, shaper_freqs,
                    damping_ratio, scv, max_smoothing, max_vibrations,
                    test_damping_ratios, max_freq):
@@ -269,56 +391,65 @@ class ShaperCalibrate:
 
         max_freq = max(max_freq or MAX_FREQ, test_freqs.max())
 
-        best_res = None
-        results = []
         min_freq = max_freq
         for data in calibration_data.get_datasets():
             min_freq = min(min_freq, data.freq_bins.min())
-        for test_freq in test_freqs[::-1]:
-            shaper_vibrations = 0.
-            shaper = shaper_defs.init_shaper(shaper_name, test_freq,
-                                             damping_ratio)
-            shaper_smoothing = self._get_shaper_smoothing(shaper, scv=scv)
-            if max_smoothing and shaper_smoothing > max_smoothing and best_res:
-                return [best_res] + results
-            max_accel = self.find_shaper_max_accel(shaper, scv)
-            all_shaper_vals = []
-
-            for data in calibration_data.get_datasets():
-                freq_bins = data.freq_bins
-                psd = data.psd_sum[freq_bins <= max_freq]
-                freq_bins = freq_bins[freq_bins <= max_freq]
-
-                shaper_vals = np.zeros(shape=freq_bins.shape)
-                # Exact damping ratio of the printer is unknown, pessimizing
-                # remaining vibrations over possible damping values
-                for dr in test_damping_ratios:
-                    vibrations, vals = self._estimate_remaining_vibrations(
-                            shaper, dr, freq_bins, psd)
-                    shaper_vals = np.maximum(shaper_vals, vals)
-                    if vibrations > shaper_vibrations:
-                        shaper_vibrations = vibrations
-                all_shaper_vals.append((freq_bins, shaper_vals))
+        # Frequencies are tested from the highest one
+        test_freqs = test_freqs[::-1]
+        params = self._get_shapers_params([
+            shaper_defs.init_shaper(shaper_name, test_freq, damping_ratio)
+            for test_freq in test_freqs])
+        all_smoothing = self._get_shapers_smoothing(params, 5000, scv)
+        # Stop at the first frequency (but the highest one) that exceeds
+        # max_smoothing
+        num_freqs = len(test_freqs)
+        if max_smoothing:
+            too_smooth = np.nonzero(all_smoothing[1:] > max_smoothing)[0]
+            if len(too_smooth):
+                num_freqs = too_smooth[0] + 1
+        params = [p[:num_freqs] for p in params]
+        A, T = params[:2]
+        all_max_accel = self._find_shapers_max_accel(params, scv).tolist()
+        all_vibrations = np.zeros(num_freqs)
+        all_shaper_vals = []
+        for data in calibration_data.get_datasets():
+            freq_bins = data.freq_bins
+            psd = data.psd_sum[freq_bins <= max_freq]
+            freq_bins = freq_bins[freq_bins <= max_freq]
+            # Exact damping ratio of the printer is unknown, pessimizing
+            # remaining vibrations over possible damping values
+            vibrations, shaper_vals = self._estimate_shapers_vibrations(
+                    A, T, test_damping_ratios, freq_bins, psd)
+            all_vibrations = np.maximum(all_vibrations, vibrations)
+            all_shaper_vals.append((freq_bins, shaper_vals))
+
+        best_res = None
+        results = []
+        shaper_freq_bins = np.arange(min_freq, max_freq, 0.2)
+        for i in range(num_freqs):
+            shaper_smoothing = float(all_smoothing[i])
+            shaper_vibrations = all_vibrations[i]
             # The score trying to minimize vibrations, but also accounting
             # the growth of smoothing. The formula itself does not have any
             # special meaning, it simply shows good results on real user data
             shaper_score = shaper_smoothing * (shaper_vibrations**1.5 +
                                                shaper_vibrations * .2 + .01)
-            shaper_freq_bins = np.arange(min_freq, max_freq, 0.2)
             shaper_vals = np.zeros(shape=shaper_freq_bins.shape)
             for freq_bins, vals in all_shaper_vals:
                 shaper_vals = np.maximum(
                         shaper_vals, np.interp(shaper_freq_bins,
-                                               freq_bins, vals))
+                                               freq_bins, vals[i]))
             results.append(
                     CalibrationResult(
-                        name=shaper_name, freq=test_freq,
+                        name=shaper_name, freq=test_freqs[i],
                         freq_bins=shaper_freq_bins, vals=shaper_vals,
                         vibrs=shaper_vibrations, smoothing=shaper_smoothing,
-                        score=shaper_score, max_accel=max_accel))
+                        score=shaper_score, max_accel=all_max_accel[i]))
             if best_res is None or best_res.vibrs > results[-1].vibrs:
                 # The current frequency is better for the shaper.
                 best_res = results[-1]
+        if num_freqs < len(test_freqs):
+            return [best_res] + results
         # Try to find an 'optimal' shapper configuration: the one that is not
         # much worse than the 'best' one, but gives much less smoothing
         selected = best_res
@@ -491,3 +622,255 @@ class ShaperCalibrate:
                     csvfile.write("\n")
         except IOError as e:
             raise self.error("Error writing to file '%s': %s", output, str(e))
+
+
+######################################################################
+# Background calculation workers
+######################################################################
+
+# Requests sent to a worker
+WORKER_CALL = 'call'
+WORKER_PSD = 'psd'
+WORKER_CALIBRATE = 'calibrate'
+
+def _calc_buffer_responses(helper, buf, name, shapes):
+    np = helper.numpy
+    res = []
+    offset = 0
+    for shape in shapes:
+        if isinstance(shape, bulk_sensor.CaptureFileReader):
+            # Samples streamed to a capture file are read from there
+            res.append(helper.calc_freq_response(name, shape))
+            continue
+        count = shape[0] * shape[1]
+        data = np.frombuffer(buf, dtype=np.float64, count=count,
+                             offset=offset * 8).reshape(shape)
+        res.append(helper.calc_freq_response(name, data))
+        offset += count
+    return res
+
+def _calibration_worker(conn, buf):
+    import queuelogger
+    queuelogger.clear_bg_logging()
+    helper = ShaperCalibrate(None)
+    np = helper.numpy
+    while True:
+        try:
+            request, args = conn.recv()
+        except (EOFError, OSError):
+            return
+        try:
+            if request == WORKER_PSD:
+                # Samples are in the shared buffer, PSDs are returned there
+                name, shape = args
+                res = _calc_buffer_responses(helper, buf, name, [shape])[0]
+                if res is not None:
+                    arrays = [res.freq_bins, res.psd_sum,
+                              res.psd_x, res.psd_y, res.psd_z]
+                    out = np.frombuffer(buf, dtype=np.float64,
+                                        count=len(arrays) * len(arrays[0]))
+                    out.reshape(len(arrays), -1)[:] = arrays
+                    del out
+                    res = len(arrays[0])
+                conn.send((False, res))
+            elif request == WORKER_CALIBRATE:
+                # Full shaper calibration of one axis from the samples
+                # of one or more accelerometers in the shared buffer
+                name, shapes, fit_args = args
+                start_time = time.time()
+                all_data = _calc_buffer_responses(helper, buf, name, shapes)
+                if None in all_data:
+                    raise helper.error(
+                        "Internal error processing accelerometer data %s"
+                        % (name,))
+                for data in all_data:
+                    data.set_numpy(np)
+                calibration_data = all_data[0]
+                for data in all_data[1:]:
+                    calibration_data.add_data(data)
+                calibration_data.normalize_to_frequencies()
+                messages = []
+                best_shaper, all_shapers = helper.find_best_shaper(
+                        calibration_data, logger=messages.append, **fit_args)
+                conn.send((False, (best_shaper, all_shapers, messages,
+                                   time.time() - start_time)))
+            else:
+                method, method_args = args
+                conn.send((False, getattr(helper, method)(*method_args)))
+        except:
+            conn.send((True, traceback.format_exc()))
+
+class CalibrationWorker:
+    def __init__(self, buffer_size):
+        self.buffer_size = buffer_size
+        self.buffer = mmap.mmap(-1, buffer_size)
+        self.conn, child_conn = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(
+            target=_calibration_worker, args=(child_conn, self.buffer))
+        self.process.daemon = True
+        self.process.start()
+        child_conn.close()
+        self.job = None
+    def is_alive(self):
+        return self.process.is_alive()
+    def close(self):
+        self.conn.close()
+        if self.process.is_alive():
+            self.process.terminate()
+        self.process.join()
+        self.buffer.close()
+
+class CalibrationJob:
+    def __init__(self, worker, request, name=None):
+        self.worker = worker
+        self.request = request
+        self.name = name
+        self.done = False
+        self.error = None
+        self.result = None
+
+# Long lived processes that perform the shaper calibration maths, so each
+# calculation avoids the cost of forking a new process.  Accelerometer
+# samples and the resulting PSDs are exchanged through a buffer shared
+# with the worker instead of being pickled through the pipe.
+class CalibrationWorkerPool:
+    def __init__(self, printer):
+        self.printer = printer
+        self.reactor = printer.get_reactor()
+        self.error = printer.command_error
+        self.numpy = importlib.import_module('numpy')
+        self.max_workers = max(1, min(MAX_WORKERS,
+                                      multiprocessing.cpu_count() - 1))
+        self.workers = []
+        printer.register_event_handler("klippy:disconnect",
+                                       self._handle_disconnect)
+    def _handle_disconnect(self):
+        for worker in self.workers:
+            worker.close()
+        self.workers = []
+    def _replace_worker(self, worker, buffer_size):
+        worker.close()
+        new_worker = CalibrationWorker(buffer_size)
+        self.workers[self.workers.index(worker)] = new_worker
+        return new_worker
+    def _collect(self, worker):
+        # Move the result of a finished job out of the worker
+        job = worker.job
+        worker.job = None
+        job.done = True
+        if not worker.conn.poll():
+            self._replace_worker(worker, worker.buffer_size)
+            job.error = "Calculation worker process exited"
+            return
+        is_error, res = worker.conn.recv()
+        if is_error:
+            job.error = "Error in remote calculation: %s" % (res,)
+            return
+        if job.request == WORKER_PSD and res is not None:
+            np = self.numpy
+            arrays = np.frombuffer(worker.buffer, dtype=np.float64,
+                                   count=5 * res).reshape(5, res).copy()
+            freq_bins, psd_sum, psd_x, psd_y, psd_z = arrays
+            res = CalibrationData(job.name, freq_bins, psd_sum,
+                                  psd_x, psd_y, psd_z)
+        job.result = res
+    def _poll(self, worker):
+        if worker.job is not None and (worker.conn.poll()
+                                       or not worker.is_alive()):
+            self._collect(worker)
+    def _get_idle_worker(self, buffer_size=0):
+        eventtime = self.reactor.monotonic()
+        while True:
+            for worker in self.workers:
+                self._poll(worker)
+                if worker.job is None:
+                    break
+            else:
+                worker = None
+                if len(self.workers) < self.max_workers:
+                    worker = CalibrationWorker(WORKER_BUFFER_SIZE)
+                    self.workers.append(worker)
+            if worker is not None:
+                if not worker.is_alive() or worker.buffer_size < buffer_size:
+                    size = max(worker.buffer_size, buffer_size)
+                    worker = self._replace_worker(
+                        worker, 1 << (size - 1).bit_length())
+                return worker
+            eventtime = self.reactor.pause(eventtime + .1)
+    def _get_samples(self, raw_values):
+        np = self.numpy
+        if raw_values is None:
+            return None
+        if isinstance(raw_values, np.ndarray):
+            data = raw_values
+        else:
+            get_stream_reader = getattr(raw_values, 'get_stream_reader', None)
+            reader = get_stream_reader() if get_stream_reader else None
+            if reader is not None:
+                # The worker reads the capture file itself
+                return reader
+            data = _get_samples_array(np, raw_values)
+            if not len(data):
+                return None
+        return np.ascontiguousarray(data, dtype=np.float64)
+    def _get_shapes(self, all_data):
+        return [data if isinstance(data, bulk_sensor.CaptureFileReader)
+                else data.shape for data in all_data]
+    def _submit_buffer(self, request, name, all_data, args):
+        np = self.numpy
+        all_data = [data for data in all_data
+                    if not isinstance(data, bulk_sensor.CaptureFileReader)]
+        worker = self._get_idle_worker(sum([d.nbytes for d in all_data]))
+        offset = 0
+        for data in all_data:
+            np.frombuffer(worker.buffer, dtype=np.float64, count=data.size,
+                          offset=offset * 8)[:] = data.ravel()
+            offset += data.size
+        worker.job = job = CalibrationJob(worker, request, name)
+        worker.conn.send((request, args))
+        return job
+    def submit(self, method, args):
+        worker = self._get_idle_worker()
+        worker.job = job = CalibrationJob(worker, WORKER_CALL)
+        worker.conn.send((WORKER_CALL, (method, args)))
+        return job
+    def submit_samples(self, name, raw_values):
+        data = self._get_samples(raw_values)
+        if data is None:
+            return None
+        if isinstance(data, bulk_sensor.CaptureFileReader):
+            return self.submit('calc_freq_response', (name, data))
+        return self._submit_buffer(WORKER_PSD, name, [data],
+                                   (name, data.shape))
+    def submit_calibration(self, name, all_raw_values, **fit_args):
+        # Calculates the PSDs of all accelerometer samples and the best
+        # shaper for them; the result is a (best_shaper, all_shapers,
+        # messages, calculation_time) tuple
+        all_data = [self._get_samples(raw_values)
+                    for raw_values in all_raw_values]
+        if not all_data or any(data is None for data in all_data):
+            raise self.error(
+                    "Internal error processing accelerometer data %s"
+                    % (name,))
+        return self._submit_buffer(
+                WORKER_CALIBRATE, name, all_data,
+                (name, self._get_shapes(all_data), fit_args))
+    def is_done(self, job):
+        if job is None:
+            return True
+        if not job.done and job.worker.job is job:
+            self._poll(job.worker)
+        return job.done
+    def wait(self, job):
+        if job is None:
+            return None
+        gcode = self.printer.lookup_object("gcode")
+        eventtime = last_report_time = self.reactor.monotonic()
+        while not self.is_done(job):
+            if eventtime > last_report_time + 5.:
+                last_report_time = eventtime
+                gcode.respond_info("Wait for calculations..", log=False)
+            eventtime = self.reactor.pause(eventtime + .1)
+        if job.error is not None:
+            raise self.error(job.error)
+        return job.result
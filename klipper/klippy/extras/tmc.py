@@ -82,10 +82,163 @@ class FieldHelper:
                 for field_name, mask in reg_fields.items()}
 
 
+######################################################################
+# Register shadow
+######################################################################
+
+# Read-only registers that never change
+SHADOW_STATIC_REGISTERS = {"OTP_READ"}
+# Registers whose read back value differs from the value written
+SHADOW_UNMIRRORED_REGISTERS = {"GSTAT"}
+
+# Host side copy of the driver registers.  Nothing is served from memory
+# unless the caller passes a max_age: then registers written by the host
+# (and static registers once read) are served until a driver reset is
+# seen, and other registers when read within the last max_age seconds.
+# A max_age of zero always queries the driver (eg, DUMP_TMC), so wiring
+# faults are not hidden behind the values the host wrote.
+class TMCRegisterShadow:
+    def __init__(self, printer, fields):
+        self.reactor = printer.get_reactor()
+        self.values = {}
+        self.stats = {}
+        self.reset_mask = fields.all_fields.get("GSTAT", {}).get("reset", 0)
+    def lookup(self, reg_name, max_age=0.):
+        stats = self.stats.get(reg_name)
+        if stats is None:
+            stats = self.stats[reg_name] = [0, 0]
+        entry = self.values.get(reg_name)
+        if entry is not None and max_age:
+            val, read_time = entry
+            if (read_time is None
+                    or self.reactor.monotonic() - read_time <= max_age):
+                stats[0] += 1
+                return val
+        stats[1] += 1
+        return None
+    def note_read(self, reg_name, val):
+        if reg_name in SHADOW_STATIC_REGISTERS:
+            self.values[reg_name] = (val, None)
+        else:
+            self.values[reg_name] = (val, self.reactor.monotonic())
+        if reg_name == "GSTAT" and val & self.reset_mask:
+            # Driver lost its configuration
+            self.invalidate()
+    def note_write(self, reg_name, val):
+        if reg_name in SHADOW_UNMIRRORED_REGISTERS:
+            self.values.pop(reg_name, None)
+        else:
+            self.values[reg_name] = (val, None)
+    def invalidate(self):
+        self.values = {reg_name: entry
+                       for reg_name, entry in self.values.items()
+                       if reg_name in SHADOW_STATIC_REGISTERS}
+    def get_status(self):
+        return {reg_name: {'hits': hits, 'misses': misses}
+                for reg_name, (hits, misses) in self.stats.items()}
+
+
 ######################################################################
 # Periodic error checking
 ######################################################################
 
+POLL_INTERVAL = 1.
+POLL_MIN_INTERVAL = .5
+POLL_MAX_INTERVAL = 2.
+# Number of clean checks before a cool driver is polled less often
+POLL_RELAX_COUNT = 60
+POLL_HOT_TEMP = 100.
+POLL_COOL_TEMP = 70.
+# Drivers due within this time are polled with a due driver on the same mcu
+POLL_COALESCE_TIME = .25
+
+# Polls the health of all drivers from a single timer.  Drivers are
+# grouped per mcu, mcu groups are staggered across the poll period and
+# all drivers of an mcu that are (nearly) due are queried back to back.
+class TMCPollScheduler:
+    def __init__(self, printer):
+        self.printer = printer
+        self.reactor = printer.get_reactor()
+        self.poll_timer = None
+        self.checks = []
+        self.mcu_groups = []
+        self.mcu_stats = {}
+    def _get_offset(self, mcu_name):
+        # Spread mcu groups evenly over the poll period
+        if mcu_name not in self.mcu_groups:
+            self.mcu_groups.append(mcu_name)
+        index = self.mcu_groups.index(mcu_name)
+        return POLL_INTERVAL * ((index * 0.6180339887) % 1.)
+    def register_check(self, check):
+        if check in self.checks:
+            return
+        self.checks.append(check)
+        curtime = self.reactor.monotonic()
+        check.next_poll = (curtime + POLL_INTERVAL
+                           + self._get_offset(check.mcu_name))
+        if self.poll_timer is None:
+            self.poll_timer = self.reactor.register_timer(self._poll,
+                                                          check.next_poll)
+        elif not self.checks[:-1] or check.next_poll < min(
+                [c.next_poll for c in self.checks[:-1]]):
+            self.reactor.update_timer(self.poll_timer, check.next_poll)
+    def unregister_check(self, check):
+        if check in self.checks:
+            self.checks.remove(check)
+    def _note_latency(self, mcu_name, query_time, queries):
+        stats = self.mcu_stats.get(mcu_name)
+        if stats is None:
+            stats = self.mcu_stats[mcu_name] = {
+                'queries': 0, 'query_time': 0., 'last_latency': 0.,
+                'max_latency': 0.}
+        latency = query_time / queries
+        stats['queries'] += queries
+        stats['query_time'] += query_time
+        stats['last_latency'] = latency
+        stats['max_latency'] = max(stats['max_latency'], latency)
+    def _poll(self, eventtime):
+        due_mcus = [c.mcu_name for c in self.checks
+                    if c.next_poll <= eventtime]
+        batch = [c for c in self.checks
+                 if c.mcu_name in due_mcus
+                 and c.next_poll <= eventtime + POLL_COALESCE_TIME]
+        batch.sort(key=lambda c: due_mcus.index(c.mcu_name))
+        for check in batch:
+            if check not in self.checks:
+                # Driver disabled while polling another driver
+                continue
+            start_time = self.reactor.monotonic()
+            try:
+                queries = check.do_periodic_check()
+            except self.printer.command_error as e:
+                self.printer.invoke_shutdown(str(e))
+                self.poll_timer = None
+                return self.reactor.NEVER
+            self._note_latency(check.mcu_name,
+                               self.reactor.monotonic() - start_time, queries)
+            check.next_poll = eventtime + check.poll_interval
+        if not self.checks:
+            return self.reactor.NEVER
+        return min([c.next_poll for c in self.checks])
+    def get_status(self, eventtime=None):
+        mcus = {}
+        for mcu_name, stats in self.mcu_stats.items():
+            mcus[mcu_name] = {
+                'queries': stats['queries'],
+                'avg_latency': round(stats['query_time']
+                                     / stats['queries'], 6),
+                'last_latency': round(stats['last_latency'], 6),
+                'max_latency': round(stats['max_latency'], 6)}
+        intervals = {c.stepper_name: c.poll_interval for c in self.checks}
+        return {'mcus': mcus, 'poll_intervals': intervals}
+
+def lookup_poll_scheduler(printer):
+    scheduler = printer.lookup_object('tmc_poll_scheduler', None)
+    if scheduler is None:
+        scheduler = TMCPollScheduler(printer)
+        printer.add_object('tmc_poll_scheduler', scheduler)
+    return scheduler
+
 class TMCErrorCheck:
     def __init__(self, config, mcu_tmc):
         self.printer = config.get_printer()
@@ -93,7 +246,13 @@ class TMCErrorCheck:
         self.stepper_name = ' '.join(name_parts[1:])
         self.mcu_tmc = mcu_tmc
         self.fields = mcu_tmc.get_fields()
-        self.check_timer = None
+        self.mcu_name = mcu_tmc.get_mcu().get_name()
+        self.poll_scheduler = lookup_poll_scheduler(self.printer)
+        self.is_polling = False
+        self.poll_interval = POLL_INTERVAL
+        self.next_poll = 0.
+        self.clean_polls = 0
+        self.query_count = self.retry_count = 0
         self.last_drv_status = self.last_drv_fields = None
         # Setup for GSTAT query
         reg_name = self.fields.lookup_register("drv_err")
@@ -135,8 +294,10 @@ class TMCErrorCheck:
         count = 0
         while 1:
             try:
+                self.query_count += 1
                 val = self.mcu_tmc.get_register(reg_name)
             except self.printer.command_error as e:
+                self.retry_count += 1
                 count += 1
                 if count < 3 and str(e).startswith("Unable to read tmc uart"):
                     # Allow more retries on a TMC UART read error
@@ -152,12 +313,13 @@ class TMCErrorCheck:
                 if not cs_actual_mask or val & cs_actual_mask:
                     break
                 irun = self.fields.get_field(self.irun_field)
-                if self.check_timer is None or irun < 4:
+                if not self.is_polling or irun < 4:
                     break
                 if (self.irun_field == "irun"
                     and not self.fields.get_field("ihold")):
                     break
                 # CS_ACTUAL field of zero - indicates a driver reset
+            self.retry_count += 1
             count += 1
             if count >= 3:
                 fmt = self.fields.pretty_format(reg_name, val)
@@ -170,50 +332,68 @@ class TMCErrorCheck:
         return cleared_flags
     def _query_temperature(self):
         try:
+            self.query_count += 1
             self.adc_temp = self.mcu_tmc.get_register(self.adc_temp_reg)
         except self.printer.command_error as e:
             # Ignore comms error for temperature
             self.adc_temp = None
             return
-    def _do_periodic_check(self, eventtime):
-        try:
-            self._query_register(self.drv_status_reg_info)
-            if self.gstat_reg_info is not None:
-                self._query_register(self.gstat_reg_info)
-            if self.adc_temp_reg is not None:
-                self._query_temperature()
-        except self.printer.command_error as e:
-            self.printer.invoke_shutdown(str(e))
-            return self.printer.get_reactor().NEVER
-        return eventtime + 1.
+    def _get_temperature(self):
+        if self.adc_temp is None:
+            return None
+        return round((self.adc_temp - 2038) / 7.7, 2)
+    def _update_poll_interval(self, had_retry):
+        # Poll hot, warning or flaky drivers more often, and cool drivers
+        # with a clean history less often
+        last_value, reg_name, mask = self.drv_status_reg_info[:3]
+        temp = self._get_temperature()
+        if had_retry or last_value & mask or (
+                temp is not None and temp >= POLL_HOT_TEMP):
+            self.clean_polls = 0
+            self.poll_interval = POLL_MIN_INTERVAL
+            return
+        self.clean_polls += 1
+        if (self.clean_polls >= POLL_RELAX_COUNT
+            and (temp is None or temp < POLL_COOL_TEMP)):
+            self.poll_interval = POLL_MAX_INTERVAL
+        else:
+            self.poll_interval = POLL_INTERVAL
+    def do_periodic_check(self):
+        # Returns the number of register queries performed
+        query_count, retry_count = self.query_count, self.retry_count
+        self._query_register(self.drv_status_reg_info)
+        if self.gstat_reg_info is not None:
+            self._query_register(self.gstat_reg_info)
+        if self.adc_temp_reg is not None:
+            self._query_temperature()
+        self._update_poll_interval(self.retry_count != retry_count)
+        return self.query_count - query_count
     def stop_checks(self):
-        if self.check_timer is None:
+        if not self.is_polling:
             return
-        self.printer.get_reactor().unregister_timer(self.check_timer)
-        self.check_timer = None
+        self.poll_scheduler.unregister_check(self)
+        self.is_polling = False
     def start_checks(self):
-        if self.check_timer is not None:
+        if self.is_polling:
             self.stop_checks()
         cleared_flags = 0
         self._query_register(self.drv_status_reg_info)
         if self.gstat_reg_info is not None:
             cleared_flags = self._query_register(self.gstat_reg_info,
                                                  try_clear=self.clear_gstat)
-        reactor = self.printer.get_reactor()
-        curtime = reactor.monotonic()
-        self.check_timer = reactor.register_timer(self._do_periodic_check,
-                                                  curtime + 1.)
+        self.is_polling = True
+        self.clean_polls = 0
+        self.poll_interval = POLL_INTERVAL
+        self.poll_scheduler.register_check(self)
         if cleared_flags:
             reset_mask = self.fields.all_fields["GSTAT"]["reset"]
             if cleared_flags & reset_mask:
                 return True
         return False
     def get_status(self, eventtime=None):
-        if self.check_timer is None:
+        if not self.is_polling:
             return {'drv_status': None, 'temperature': None}
-        temp = None
-        if self.adc_temp is not None:
-            temp = round((self.adc_temp - 2038) / 7.7, 2)
+        temp = self._get_temperature()
         last_value, reg_name = self.drv_status_reg_info[:2]
         if last_value != self.last_drv_status:
             self.last_drv_status = last_value
@@ -514,6 +694,7 @@ class TMCCommandHelper:
                'run_current': current[0],
                'hold_current': current[1]}
         res.update(self.echeck_helper.get_status(eventtime))
+        res['register_cache'] = self.mcu_tmc.shadow.get_status()
         return res
     # DUMP_TMC support
     def setup_register_dump(self, read_registers, read_translate=None):
@@ -524,8 +705,25 @@ class TMCCommandHelper:
                                    self.cmd_DUMP_TMC,
                                    desc=self.cmd_DUMP_TMC_help)
     cmd_DUMP_TMC_help = "Read and display TMC stepper driver registers"
+    def _dump_registers(self, reg_names, max_age):
+        # Query GSTAT first so a driver reset invalidates the shadowed
+        # copies of the registers written by the host
+        values = {}
+        if "GSTAT" in self.read_registers:
+            values["GSTAT"] = self.mcu_tmc.get_register("GSTAT", max_age)
+        reg_names = [reg_name for reg_name in reg_names
+                     if reg_name not in values]
+        get_registers = getattr(self.mcu_tmc, "get_registers", None)
+        if get_registers is not None:
+            # Transport can read them all in one go
+            values.update(get_registers(reg_names, max_age))
+            return values
+        for reg_name in reg_names:
+            values[reg_name] = self.mcu_tmc.get_register(reg_name, max_age)
+        return values
     def cmd_DUMP_TMC(self, gcmd):
         logging.info("DUMP_TMC %s", self.name)
+        max_age = gcmd.get_float('MAX_AGE', 0., minval=0.)
         reg_name = gcmd.get('REGISTER', None)
         if reg_name is not None:
             reg_name = reg_name.upper()
@@ -535,7 +733,7 @@ class TMCCommandHelper:
                 gcmd.respond_info(self.fields.pretty_format(reg_name, val))
             elif reg_name in self.read_registers:
                 # readable register
-                val = self.mcu_tmc.get_register(reg_name)
+                val = self._dump_registers([reg_name], max_age)[reg_name]
                 if self.read_translate is not None:
                     reg_name, val = self.read_translate(reg_name, val)
                 gcmd.respond_info(self.fields.pretty_format(reg_name, val))
@@ -547,8 +745,9 @@ class TMCCommandHelper:
                 if reg_name not in self.read_registers:
                     gcmd.respond_info(self.fields.pretty_format(reg_name, val))
             gcmd.respond_info("========== Queried registers ==========")
+            values = self._dump_registers(self.read_registers, max_age)
             for reg_name in self.read_registers:
-                val = self.mcu_tmc.get_register(reg_name)
+                val = values[reg_name]
                 if self.read_translate is not None:
                     reg_name, val = self.read_translate(reg_name, val)
                 gcmd.respond_info(self.fields.pretty_format(reg_name, val))
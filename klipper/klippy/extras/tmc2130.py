@@ -267,6 +267,7 @@ class MCU_TMC_SPI:
         self.name_to_reg = name_to_reg
         self.fields = fields
         self.tmc_frequency = tmc_frequency
+        self.shadow = tmc.TMCRegisterShadow(self.printer, fields)
     def get_fields(self):
         return self.fields
     def get_register_raw(self, reg_name):
@@ -281,14 +282,19 @@ class MCU_TMC_SPI:
             "driver_error": spi_status >> 1 & 0x1,
             "reset_flag": spi_status & 0x1
         }
-    def get_register(self, reg_name):
-        return self.get_register_raw(reg_name)["data"]
+    def get_register(self, reg_name, max_age=0.):
+        val = self.shadow.lookup(reg_name, max_age)
+        if val is None:
+            val = self.get_register_raw(reg_name)["data"]
+            self.shadow.note_read(reg_name, val)
+        return val
     def set_register(self, reg_name, val, print_time=None):
         reg = self.name_to_reg[reg_name]
         with self.mutex:
             for retry in range(5):
                 v = self.tmc_spi.reg_write(reg, val, self.chain_pos, print_time)
                 if v == val:
+                    self.shadow.note_write(reg_name, val)
                     return
         raise self.printer.command_error(
             "Unable to write tmc spi '%s' register %s" % (self.name, reg_name))
@@ -196,6 +196,7 @@ class MCU_TMC2660_SPI:
         self.spi = bus.MCU_SPI_from_config(config, 0, default_speed=4000000)
         self.name_to_reg = name_to_reg
         self.fields = fields
+        self.shadow = tmc.TMCRegisterShadow(self.printer, fields)
     def get_fields(self):
         return self.fields
     def get_register_raw(self, reg_name):
@@ -219,8 +220,12 @@ class MCU_TMC2660_SPI:
             'data': (pr[0] << 16) | (pr[1] << 8) | pr[2],
             '#receive_time': params['#receive_time'],
         }
-    def get_register(self, reg_name):
-        return self.get_register_raw(reg_name)['data']
+    def get_register(self, reg_name, max_age=0.):
+        val = self.shadow.lookup(reg_name, max_age)
+        if val is None:
+            val = self.get_register_raw(reg_name)['data']
+            self.shadow.note_read(reg_name, val)
+        return val
     def set_register(self, reg_name, val, print_time=None):
         minclock = 0
         if print_time is not None:
@@ -229,6 +234,7 @@ class MCU_TMC2660_SPI:
         msg = [((val >> 16) | reg) & 0xff, (val >> 8) & 0xff, val & 0xff]
         with self.mutex:
             self.spi.spi_send(msg, minclock)
+        self.shadow.note_write(reg_name, val)
     def get_tmc_frequency(self):
         return None
     def get_mcu(self):
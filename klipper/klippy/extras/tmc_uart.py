@@ -4,6 +4,7 @@
 #
 # This file may be distributed under the terms of the GNU GPLv3 license.
 import logging
+from . import tmc
 
 
 ######################################################################
@@ -73,6 +74,25 @@ def lookup_tmc_uart_mutex(mcu):
 TMC_BAUD_RATE = 40000
 TMC_BAUD_RATE_AVR = 9000
 
+# Lookup tables for the uart framing.  The CRC8-ATM of a tmc datagram is
+# computed on each byte sent least significant bit first, which is a
+# regular (msb first) CRC8 of the bit reversed byte.
+def _build_crc8_table():
+    table = []
+    for i in range(256):
+        crc = i
+        for j in range(8):
+            if crc & 0x80:
+                crc = ((crc << 1) ^ 0x07) & 0xff
+            else:
+                crc = (crc << 1) & 0xff
+        table.append(crc)
+    return table
+CRC8_TABLE = _build_crc8_table()
+BIT_REVERSE = [int('{:08b}'.format(i)[::-1], 2) for i in range(256)]
+# Each byte is sent as a 10 bit frame with start and stop bits
+SERIAL_FRAME = [(d << 1) | 0x200 for d in range(256)]
+
 # Code for sending messages on a TMC uart
 class MCU_TMC_uart_bitbang:
     def __init__(self, rx_pin_params, tx_pin_params, select_pins_desc):
@@ -122,26 +142,16 @@ class MCU_TMC_uart_bitbang:
         # Generate a CRC8-ATM value for a bytearray
         crc = 0
         for b in data:
-            for i in range(8):
-                if (crc >> 7) ^ (b & 0x01):
-                    crc = (crc << 1) ^ 0x07
-                else:
-                    crc = (crc << 1)
-                crc &= 0xff
-                b >>= 1
+            crc = CRC8_TABLE[crc ^ BIT_REVERSE[b]]
         return crc
     def _add_serial_bits(self, data):
         # Add serial start and stop bits to a message in a bytearray
         out = 0
         pos = 0
         for d in data:
-            b = (d << 1) | 0x200
-            out |= (b << pos)
+            out |= SERIAL_FRAME[d] << pos
             pos += 10
-        res = bytearray()
-        for i in range((pos+7)//8):
-            res.append((out >> (i*8)) & 0xff)
-        return res
+        return bytearray(out.to_bytes((pos+7)//8, 'little'))
     def _encode_read(self, sync, addr, reg):
         # Generate a uart read register message
         msg = bytearray([sync, addr, reg])
@@ -158,10 +168,7 @@ class MCU_TMC_uart_bitbang:
         if len(data) != 10:
             return None
         # Convert data into a long integer for easy manipulation
-        mval = pos = 0
-        for d in bytearray(data):
-            mval |= d << pos
-            pos += 8
+        mval = int.from_bytes(bytes(data), 'little')
         # Extract register value
         val = ((((mval >> 31) & 0xff) << 24) | (((mval >> 41) & 0xff) << 16)
                | (((mval >> 51) & 0xff) << 8) | ((mval >> 61) & 0xff))
@@ -225,6 +232,7 @@ class MCU_TMC_uart:
             config, max_addr)
         self.mutex = self.mcu_uart.mutex
         self.tmc_frequency = tmc_frequency
+        self.shadow = tmc.TMCRegisterShadow(self.printer, fields)
     def get_fields(self):
         return self.fields
     def _do_get_register(self, reg_name):
@@ -243,8 +251,28 @@ class MCU_TMC_uart:
     def get_register_raw(self, reg_name):
         with self.mutex:
             return self._do_get_register(reg_name)
-    def get_register(self, reg_name):
-        return self.get_register_raw(reg_name)['data']
+    def get_register(self, reg_name, max_age=0.):
+        val = self.shadow.lookup(reg_name, max_age)
+        if val is None:
+            val = self.get_register_raw(reg_name)['data']
+            self.shadow.note_read(reg_name, val)
+        return val
+    def get_registers(self, reg_names, max_age=0.):
+        # Read several registers within a single hold of the uart mutex
+        values = {}
+        for reg_name in reg_names:
+            val = self.shadow.lookup(reg_name, max_age)
+            if val is not None:
+                values[reg_name] = val
+        to_read = [reg_name for reg_name in reg_names
+                   if reg_name not in values]
+        if to_read:
+            with self.mutex:
+                for reg_name in to_read:
+                    val = self._do_get_register(reg_name)['data']
+                    self.shadow.note_read(reg_name, val)
+                    values[reg_name] = val
+        return values
     def set_register(self, reg_name, val, print_time=None):
         reg = self.name_to_reg[reg_name]
         if self.printer.get_start_args().get('debugoutput') is not None:
@@ -258,6 +286,7 @@ class MCU_TMC_uart:
                                         print_time)
                 self.ifcnt = self._do_get_register("IFCNT")['data']
                 if self.ifcnt == (ifcnt + 1) & 0xff:
+                    self.shadow.note_write(reg_name, val)
                     return
         raise self.printer.command_error(
             "Unable to write tmc uart '%s' register %s" % (self.name, reg_name))